@@ -5,4 +5,5 @@ class DocumentConfig(AppConfig):
 	name = '_1327.documents'
 
 	def ready(self):
-		import _1327.documents.signals  # noqa
+		from _1327.documents import signals
+		signals.connect_model_receivers()
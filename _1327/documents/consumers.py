@@ -1,23 +1,137 @@
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+import asyncio
+import json
 
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 
-class PreviewConsumer(WebsocketConsumer):
+from _1327.documents.models import Document
+from _1327.documents.utils import check_preview_permissions, diff_preview_blocks, preview_blocks, PREVIEW_LANGUAGES, render_and_send_preview
 
-	def connect(self):
+
+# queued instead of an update when a viewer does not keep up with the updates of a preview
+WHOLE_PREVIEW = None
+
+
+class PreviewConsumer(AsyncWebsocketConsumer):
+	"""
+		everybody knowing the hash value of a document may watch its preview,
+		editors of the document may also send texts that are rendered for all viewers.
+		viewers get the whole preview when connecting and the changed blocks of the html afterwards,
+		a viewer missing an update asks for the whole preview again.
+		each connection keeps the blocks it sent and numbers its updates itself.
+
+		the consumer sends a heartbeat every PREVIEW_HEARTBEAT_INTERVAL seconds that viewers answer,
+		connections without any message for PREVIEW_IDLE_TIMEOUT seconds are closed.
+	"""
+
+	async def connect(self):
 		self.group_name = self.scope['url_route']['kwargs']['hash_value']
-		async_to_sync(self.channel_layer.group_add)(
+		self.tasks = []
+		try:
+			self.can_render = await database_sync_to_async(self.get_render_permission)()
+		except Document.DoesNotExist:
+			await self.close()
+			return
+
+		await self.channel_layer.group_add(
 			self.group_name,
 			self.channel_name,
 		)
+		# loaded after joining the group, so no update sent afterwards is missed
+		self.previews = {}
+		for language in PREVIEW_LANGUAGES:
+			blocks = await database_sync_to_async(preview_blocks)(self.group_name, language)
+			if blocks:
+				self.previews[language] = {'sequence': 1, 'blocks': tuple(blocks)}
+		await self.accept()
+
+		self.outbox = asyncio.Queue(maxsize=settings.PREVIEW_SEND_QUEUE_SIZE)
+		self.last_received = asyncio.get_event_loop().time()
+		self.tasks = [
+			asyncio.ensure_future(self.send_queued_messages()),
+			asyncio.ensure_future(self.send_heartbeats()),
+		]
+		self.queue_message(WHOLE_PREVIEW)
 
-		self.accept()
+	def get_render_permission(self):
+		document = Document.objects.get(hash_value=self.group_name)
+		# the permissions are checked once for the whole connection
+		try:
+			check_preview_permissions(document, self.scope['user'])
+			return True
+		except PermissionDenied:
+			return False
 
-	def disconnect(self, messsage, **kwargs):
-		async_to_sync(self.channel_layer.group_discard)(
+	async def disconnect(self, code):
+		for task in self.tasks:
+			task.cancel()
+		await self.channel_layer.group_discard(
 			self.group_name,
 			self.channel_name,
 		)
 
-	def update_preview(self, event):
-		self.send(text_data=event['message'])
+	async def receive(self, text_data=None, bytes_data=None):
+		self.last_received = asyncio.get_event_loop().time()
+		try:
+			data = json.loads(text_data)
+		except (TypeError, ValueError):
+			return
+		if not isinstance(data, dict):
+			return
+
+		if data.get('resync') in PREVIEW_LANGUAGES:
+			await self.send_whole_preview(data['resync'])
+		elif self.can_render and isinstance(data.get('text'), str):
+			# only schedules the render on the threads of the preview coalescer, the viewers get the result as group message
+			render_and_send_preview(self.group_name, data.get('language'), data['text'])
+
+	async def update_preview(self, event):
+		preview = self.previews.setdefault(event['language'], {'sequence': 0, 'blocks': ()})
+		blocks = tuple(event['blocks'])
+		changes = diff_preview_blocks(preview['blocks'], blocks)
+		if not changes:
+			return
+		preview['sequence'] += 1
+		preview['blocks'] = blocks
+		self.queue_message(json.dumps({
+			'language': event['language'],
+			'sequence': preview['sequence'],
+			'changes': changes,
+		}))
+
+	def queue_message(self, message):
+		if self.outbox.full():
+			# the viewer gets the whole preview instead of all updates it could not keep up with
+			while not self.outbox.empty():
+				self.outbox.get_nowait()
+			message = WHOLE_PREVIEW
+		self.outbox.put_nowait(message)
+
+	async def send_queued_messages(self):
+		while True:
+			message = await self.outbox.get()
+			if message is WHOLE_PREVIEW:
+				for language in PREVIEW_LANGUAGES:
+					await self.send_whole_preview(language)
+			else:
+				await self.send(text_data=message)
+
+	async def send_whole_preview(self, language):
+		preview = self.previews.get(language)
+		if preview is not None:
+			await self.send(text_data=json.dumps({
+				'language': language,
+				'sequence': preview['sequence'],
+				'blocks': preview['blocks'],
+			}))
+
+	async def send_heartbeats(self):
+		loop = asyncio.get_event_loop()
+		while True:
+			await asyncio.sleep(settings.PREVIEW_HEARTBEAT_INTERVAL)
+			if loop.time() - self.last_received > settings.PREVIEW_IDLE_TIMEOUT:
+				await self.close()
+				return
+			await self.send(text_data=json.dumps({'heartbeat': True}))
@@ -11,6 +11,7 @@ from django.utils.translation import gettext_lazy as _
 from guardian.shortcuts import assign_perm, get_perms, remove_perm
 
 from _1327.main.utils import slugify_and_clean_url_title
+from _1327.user_management.registry import get_group
 from .models import Attachment, Document
 
 
@@ -27,7 +28,7 @@ class DocumentForm(forms.ModelForm):
 		user = kwargs.pop('user', None)
 		creation = kwargs.pop('creation', None)
 		creation_group = kwargs.pop('creation_group', None)
-		staff = Group.objects.get(name=settings.STAFF_GROUP_NAME)
+		staff = get_group(settings.STAFF_GROUP_NAME)
 		super().__init__(*args, **kwargs)
 
 		add_permission_name = self.Meta.model().add_permission_name.split('.')[1]
@@ -86,7 +87,7 @@ class PermissionBaseForm(forms.BaseForm):
 	obj = None
 
 	def save(self, model):
-		group = Group.objects.get(name=self.cleaned_data["group_name"])
+		group = get_group(self.cleaned_data["group_name"])
 		for field_name, value in self.cleaned_data.items():
 			if field_name == 'group_name':
 				continue
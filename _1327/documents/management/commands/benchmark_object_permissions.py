@@ -0,0 +1,64 @@
+import random
+import timeit
+
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from guardian.models import GroupObjectPermission
+
+from _1327.information_pages.models import InformationDocument, InformationDocumentGroupObjectPermission
+from _1327.main.utils import in_memory_database
+from _1327.user_management.models import UserProfile
+from _1327.user_management.shortcuts import object_pks_with_permission
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Compares filtering documents by group object permissions stored in the generic tables of guardian and in the direct tables'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--documents', type=int, default=1000)
+		parser.add_argument('--groups', type=int, default=30)
+		parser.add_argument('--iterations', type=int, default=20)
+
+	def handle(self, *args, **options):
+		with in_memory_database():
+			results = self.run_benchmarks(options['documents'], options['groups'], options['iterations'])
+
+		for name, value in results:
+			self.stdout.write('{:<36}{:>12}'.format(name, value))
+
+	def run_benchmarks(self, document_count, group_count, iterations):
+		random.seed(1327)
+		documents = [
+			InformationDocument.objects.create(title_en='Document {}'.format(index), title_de='Dokument {}'.format(index), url_title='document-{}'.format(index))
+			for index in range(document_count)
+		]
+		groups = [Group.objects.create(name='Group {}'.format(index)) for index in range(group_count)]
+		user = UserProfile.objects.create(username='benchmark')
+		user.groups.add(*groups[:3])
+
+		permission_name = InformationDocument.get_view_permission()
+		content_type = ContentType.objects.get_for_model(InformationDocument)
+		permission = Permission.objects.get(content_type=content_type, codename=permission_name.split('.')[1])
+		assignments = [(group, document) for group in groups for document in random.sample(documents, document_count // 10)]
+		# the same permissions are stored in both tables
+		InformationDocumentGroupObjectPermission.objects.bulk_create(
+			[InformationDocumentGroupObjectPermission(group=group, permission=permission, content_object=document) for group, document in assignments],
+			ignore_conflicts=True,
+		)
+		GroupObjectPermission.objects.bulk_create(
+			[GroupObjectPermission(group=group, permission=permission, content_type=content_type, object_pk=str(document.pk)) for group, document in assignments],
+			ignore_conflicts=True,
+		)
+
+		results = [('documents', document_count), ('object permissions', len(assignments))]
+		for name, permission_model in (('generic tables', GroupObjectPermission), ('direct tables', InformationDocumentGroupObjectPermission)):
+			def query():
+				object_pks = object_pks_with_permission(permission_model, InformationDocument, permission_name, group__user=user)
+				return list(InformationDocument.objects.filter(pk__in=object_pks).values_list('pk', flat=True))
+
+			permitted = len(query())
+			seconds = min(timeit.repeat(query, repeat=3, number=iterations)) / iterations
+			results.append(('{} ({} permitted)'.format(name, permitted), '{:.2f} ms'.format(seconds * 1000)))
+		return results
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from _1327.information_pages.models import InformationDocument
+from _1327.main.utils import in_memory_database
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Connects many idle viewers to one preview in this process and measures their cost and the time to update all of them'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--viewers', type=int, default=500)
+		parser.add_argument('--idle', type=float, default=1, help='Seconds the viewers stay connected without updates')
+
+	def handle(self, *args, **options):
+		# the viewers are connected within this process, the configured channel layer might not be running
+		with in_memory_database(), override_settings(CHANNEL_LAYERS={'default': {'BACKEND': '_1327.main.channel_layers.LocalChannelLayer'}}):
+			document = InformationDocument.objects.create(title_en='Preview', title_de='Vorschau', url_title='preview')
+			results = async_to_sync(self.run_viewers)(document.hash_value, options['viewers'], options['idle'])
+
+		for name, value in results:
+			self.stdout.write('{:<28}{:>12}'.format(name, value))
+
+	async def run_viewers(self, hash_value, viewer_count, idle_seconds):
+		# imported here, the routing reads the settings when it is imported
+		from _1327.routing import application
+
+		threads = threading.active_count()
+		tracemalloc.start()
+		memory, __ = tracemalloc.get_traced_memory()
+
+		start = time.perf_counter()
+		viewers = [WebsocketCommunicator(application, '{}/{}'.format(settings.PREVIEW_URL, hash_value)) for __ in range(viewer_count)]
+		for viewer in viewers:
+			connected, __ = await viewer.connect(timeout=10)
+			if not connected:
+				raise RuntimeError('A viewer could not connect to the preview')
+		connect_seconds = time.perf_counter() - start
+
+		await asyncio.sleep(idle_seconds)
+		idle_memory, __ = tracemalloc.get_traced_memory()
+		idle_threads = threading.active_count()
+		tracemalloc.stop()
+
+		start = time.perf_counter()
+		await get_channel_layer().group_send(hash_value, {
+			'type': 'update_preview',
+			'language': 'de',
+			'blocks': ['<p>Update</p>'],
+		})
+		await asyncio.gather(*(viewer.receive_from(timeout=10) for viewer in viewers))
+		update_seconds = time.perf_counter() - start
+
+		for viewer in viewers:
+			await viewer.disconnect()
+
+		return [
+			('viewers', viewer_count),
+			('connect all', '{:.1f} ms'.format(connect_seconds * 1000)),
+			('additional threads', idle_threads - threads),
+			('memory per viewer', '{:.1f} KiB'.format((idle_memory - memory) / viewer_count / 1024)),
+			('update all', '{:.1f} ms'.format(update_seconds * 1000)),
+		]
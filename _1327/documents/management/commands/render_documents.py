@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+
+import django
+from django.core.management.base import BaseCommand
+
+from _1327.documents.models import Document
+from _1327.documents.utils import render_documents
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Renders the texts of all documents again and stores the results'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--processes', type=int, default=os.cpu_count())
+		parser.add_argument('--chunk-size', type=int, default=50)
+
+	def handle(self, *args, **options):
+		document_ids = list(Document.objects.non_polymorphic().order_by('id').values_list('id', flat=True))
+		chunk_size = options['chunk_size']
+		chunks = [document_ids[index:index + chunk_size] for index in range(0, len(document_ids), chunk_size)]
+
+		if options['processes'] > 1:
+			with multiprocessing.get_context('spawn').Pool(options['processes'], initializer=django.setup) as pool:
+				for chunk in chunks:
+					render_documents(chunk, pool)
+		else:
+			for chunk in chunks:
+				render_documents(chunk)
+
+		self.stdout.write('Rendered {} documents.'.format(len(document_ids)))
@@ -1,4 +1,5 @@
 import markdown
+from markdown.preprocessors import Preprocessor
 
 from _1327.documents.models import Document
 from _1327.polls.models import Poll
@@ -6,6 +7,51 @@ from _1327.polls.models import Poll
 
 class InternalLinksMarkdownExtension(markdown.extensions.Extension):
 
+	def __init__(self, urls=None, **kwargs):
+		super().__init__(**kwargs)
+		# urls of the link targets resolved in advance with resolve_urls, e.g. when rendering in another process
+		self.urls = urls
+
+	@staticmethod
+	def create_patterns(md=None):
+		return [
+			Document.LinkPattern(Document.DOCUMENT_LINK_REGEX, md),
+			Poll.LinkPattern(Poll.POLLS_LINK_REGEX, md),
+		]
+
+	@classmethod
+	def resolve_urls(cls, text):
+		patterns = cls.create_patterns()
+		for pattern in patterns:
+			pattern.collect_urls(text)
+		return [pattern.urls for pattern in patterns]
+
 	def extendMarkdown(self, md):
-		md.inlinePatterns.register(Document.LinkPattern(Document.DOCUMENT_LINK_REGEX, md), 'InternalLinkDocumentsPattern', 200)
-		md.inlinePatterns.register(Poll.LinkPattern(Poll.POLLS_LINK_REGEX, md), 'InternalLinkPollsPattern', 200)
+		md.registerExtension(self)
+		self.patterns = self.create_patterns(md)
+		md.preprocessors.register(InternalLinksPreprocessor(md, self), 'InternalLinks', 5)
+		md.inlinePatterns.register(self.patterns[0], 'InternalLinkDocumentsPattern', 200)
+		md.inlinePatterns.register(self.patterns[1], 'InternalLinkPollsPattern', 200)
+
+	def reset(self):
+		for pattern in self.patterns:
+			pattern.urls = {}
+
+
+class InternalLinksPreprocessor(Preprocessor):
+
+	def __init__(self, md, extension):
+		super().__init__(md)
+		self.extension = extension
+
+	def run(self, lines):
+		if self.extension.urls is not None:
+			for pattern, urls in zip(self.extension.patterns, self.extension.urls):
+				pattern.urls = urls
+			return lines
+
+		# links may span multiple lines
+		text = "\n".join(lines)
+		for pattern in self.extension.patterns:
+			pattern.collect_urls(text)
+		return lines
@@ -1,4 +1,3 @@
-from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 
 import markdown
@@ -7,14 +6,25 @@ from markdown.inlinepatterns import LinkInlineProcessor
 
 class InternalLinkPattern(LinkInlineProcessor):
 
+	def __init__(self, pattern, md=None):
+		super().__init__(pattern, md)
+		self.urls = {}
+
+	def collect_urls(self, text):
+		# all links of a text are resolved at once instead of querying every single link target
+		ids = {int(match.group('id')) for match in self.compiled_re.finditer(text)}
+		self.urls = self.resolve_urls(ids) if ids else {}
+
 	def handleMatch(self, m, data=None):
 		el = markdown.util.etree.Element("a")
-		try:
-			el.set('href', self.url(m.group('id')))
-			el.text = markdown.util.AtomicString(m.group('title'))
-		except ObjectDoesNotExist:
+		url = self.urls.get(int(m.group('id')))
+		if url is None:
 			el.text = markdown.util.AtomicString(_('[missing link]'))
+		else:
+			el.set('href', url)
+			el.text = markdown.util.AtomicString(m.group('title'))
 		return el, m.start(0), m.end(0)
 
-	def url(id):
+	@staticmethod
+	def resolve_urls(ids):
 		raise NotImplementedError
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.14 on 2026-10-17 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_auto_20200224_1847'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='rendered_text_de',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='rendered_text_en',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='rendered_toc_de',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='rendered_toc_en',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -2,26 +2,31 @@ from datetime import datetime
 import hashlib
 import re
 
+from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.urls import reverse
-from django.utils import timezone
+from django.utils import timezone, translation
 from django.utils.translation import gettext_lazy as _
-from guardian.shortcuts import assign_perm, get_groups_with_perms, get_users_with_perms, remove_perm
+from guardian.shortcuts import get_groups_with_perms
+from guardian.utils import get_identity
 from polymorphic.models import PolymorphicModel
 from reversion import revisions
 from reversion.models import Version
 
 from _1327.documents.markdown_internal_link_pattern import InternalLinkPattern
-from _1327.main.tools import translate
-from _1327.main.utils import slugify
+from _1327.main.tools import current_language, translate
+from _1327.main.utils import convert_markdown, slugify, try_convert_markdown
 from _1327.user_management.models import UserProfile
+from _1327.user_management.registry import permission_names
+from _1327.user_management.shortcuts import bulk_assign_perms, bulk_remove_perms
 
 
 DOCUMENT_VIEW_PERMISSION_NAME = 'view_document'
 
 
-@revisions.register
+# the rendered texts are derived from the texts and rendered again when a version is restored
+@revisions.register(exclude=['rendered_text_de', 'rendered_text_en', 'rendered_toc_de', 'rendered_toc_en'])
 class Document(PolymorphicModel):
 	def get_hash():
 		max_id = Document.objects.aggregate(models.Max('id'))['id__max'] or 0
@@ -35,6 +40,10 @@ class Document(PolymorphicModel):
 	text_de = models.TextField(blank=True, verbose_name=_("Text (German)"))
 	text_en = models.TextField(blank=True, verbose_name=_("Text (English)"))
 	text = translate(en='text_en', de='text_de')
+	rendered_text_de = models.TextField(blank=True, editable=False)
+	rendered_text_en = models.TextField(blank=True, editable=False)
+	rendered_toc_de = models.TextField(blank=True, editable=False)
+	rendered_toc_en = models.TextField(blank=True, editable=False)
 	hash_value = models.CharField(max_length=40, unique=True, default=get_hash, verbose_name=_("Hash value"))
 
 	DOCUMENT_LINK_REGEX = r'\[(?P<title>[^\[]+)\]\(document:(?P<id>\d+)\)'
@@ -45,11 +54,14 @@ class Document(PolymorphicModel):
 		verbose_name_plural = _("Documents")
 
 	class LinkPattern(InternalLinkPattern):
-		def url(self, id):
-			document = Document.objects.get(id=id)
-			if document:
-				return reverse(document.get_view_url_name(), args=[document.url_title])
-			return ''
+		@staticmethod
+		def resolve_urls(ids):
+			# the view url name is taken from the model of the document, the documents are not downcast
+			documents = Document.objects.non_polymorphic().filter(id__in=ids).values_list('id', 'url_title', 'polymorphic_ctype_id')
+			return {
+				document_id: reverse(ContentType.objects.get_for_id(content_type_id).model_class().get_view_url_name(), args=[url_title])
+				for document_id, url_title, content_type_id in documents
+			}
 
 	def __str__(self):
 		return f"{self.title_de} | {self.title_en}"
@@ -65,7 +77,8 @@ class Document(PolymorphicModel):
 	def get_edit_url(self):
 		raise NotImplementedError()
 
-	def get_view_url_name(self):
+	@classmethod
+	def get_view_url_name(cls):
 		return 'view'
 
 	def get_edit_url_name(self):
@@ -82,10 +95,7 @@ class Document(PolymorphicModel):
 
 	@classmethod
 	def get_view_permission(klass):
-		content_type = ContentType.objects.get_for_model(klass)
-		app_label = content_type.app_label
-		permission = "{}.{}".format(app_label, klass.VIEW_PERMISSION_NAME)
-		return permission
+		return permission_names(klass).view
 
 	def save_formset(self, formset):
 		pass
@@ -128,41 +138,39 @@ class Document(PolymorphicModel):
 
 	@property
 	def view_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.view_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).view
 
 	@property
 	def edit_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.change_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).change
 
 	@property
 	def add_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.add_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).add
 
 	@property
 	def delete_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.delete_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).delete
+
+	def all_permission_codenames(self):
+		return [permission.split('.')[1] for permission in (self.view_permission_name, self.edit_permission_name, self.delete_permission_name)]
 
 	def delete_all_permissions(self, user_or_group):
-		remove_perm(self.view_permission_name, user_or_group, self)
-		remove_perm(self.edit_permission_name, user_or_group, self)
-		remove_perm(self.delete_permission_name, user_or_group, self)
+		bulk_remove_perms(self, self.all_permission_codenames(), user_or_group)
 
 	def set_all_permissions(self, user_or_group):
-		assign_perm(self.view_permission_name, user_or_group, self)
-		assign_perm(self.edit_permission_name, user_or_group, self)
-		assign_perm(self.delete_permission_name, user_or_group, self)
+		permission_ids = Permission.objects.filter(
+			content_type=ContentType.objects.get_for_model(self),
+			codename__in=self.all_permission_codenames(),
+		).values_list('id', flat=True)
+		user, group = get_identity(user_or_group)
+		if user is not None:
+			bulk_assign_perms(self, user_permissions=[(user.pk, permission_id) for permission_id in permission_ids])
+		else:
+			bulk_assign_perms(self, group_permissions=[(group.pk, permission_id) for permission_id in permission_ids])
 
 	def reset_permissions(self):
-		users = get_users_with_perms(self)
-		for user in users:
-			self.delete_all_permissions(user)
-		groups = get_groups_with_perms(self)
-		for group in groups:
-			self.delete_all_permissions(group)
+		bulk_remove_perms(self, self.all_permission_codenames())
 
 	@property
 	def meta_information_html(self):
@@ -194,10 +202,9 @@ class Document(PolymorphicModel):
 
 	def has_perms(self):
 		group_perms = get_groups_with_perms(self, attach_perms=True)
-		content_type = ContentType.objects.get_for_model(self)
 		for perms in group_perms.values():
 			for perm in perms:
-				perm = "{app}.{perm}".format(app=content_type.app_label, perm=perm)
+				perm = "{app}.{perm}".format(app=self._meta.app_label, perm=perm)
 				if perm != self.add_permission_name:
 					return True
 		return False
@@ -205,6 +212,26 @@ class Document(PolymorphicModel):
 	def handle_edit(self, cleaned_data):
 		pass
 
+	def update_rendered_text(self):
+		for language in ('de', 'en'):
+			with translation.override(language):
+				self.set_rendered_text(language, try_convert_markdown(getattr(self, 'text_' + language)))
+
+	def set_rendered_text(self, language, rendered):
+		# texts that could not be rendered in time are rendered when they are viewed
+		text, toc = rendered if rendered is not None else ('', '')
+		setattr(self, 'rendered_text_' + language, text)
+		setattr(self, 'rendered_toc_' + language, toc)
+
+	def get_rendered_text(self, language=None):
+		language = language or current_language()
+		text = getattr(self, 'text_' + language)
+		rendered_text = getattr(self, 'rendered_text_' + language)
+		if text != '' and rendered_text == '':
+			# e.g. documents that were not saved by handle_edit or whose render timed out
+			return convert_markdown(text)
+		return rendered_text, getattr(self, 'rendered_toc_' + language)
+
 
 class TemporaryDocumentText(models.Model):
 	text_de = models.TextField(blank=True)
@@ -1,10 +1,15 @@
+from django.apps import apps
 from django.contrib.auth.models import Group
-from django.db.models.signals import post_save, pre_save
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from guardian.shortcuts import assign_perm, get_perms_for_model
+from guardian.models import GroupObjectPermissionBase
 
 from _1327.documents.models import Document
-from _1327.main.utils import slugify
+from _1327.documents.utils import render_documents_containing
+from _1327.main.cache_versions import bump_cache_version
+from _1327.main.utils import invalidate_menus, invalidate_permission_overview, invalidate_permission_overviews, slugify
+from _1327.user_management.shortcuts import bulk_assign_perms
 
 
 @receiver(pre_save)
@@ -35,9 +40,61 @@ def permission_callback(sender, instance, created, *args, **kwargs):
 	if sender not in Document.__subclasses__() or not created:
 		return
 
-	permissions = get_perms_for_model(instance)
-	groups = Group.objects.all()
-	for group in groups:
-		for permission in group.permissions.all():
-			if permission in permissions:
-				assign_perm(permission.codename, group, instance)
+	# groups get the object permissions for all of their global permissions of the document's model
+	group_permissions = Group.permissions.through.objects.filter(
+		permission__content_type=ContentType.objects.get_for_model(instance),
+	).values_list('group_id', 'permission_id')
+	bulk_assign_perms(instance, group_permissions=list(group_permissions))
+
+
+def pre_save_link_target(sender, instance, *args, **kwargs):
+	"""
+		remembers whether the url of a document changes, rendered links to it are outdated in that case
+	"""
+	instance._url_title_changed = instance.pk is None or not Document.objects.filter(pk=instance.pk, url_title=instance.url_title).exists()
+
+
+def render_linking_documents(document):
+	render_documents_containing('(document:{})'.format(document.id), '(poll:{})'.format(document.id))
+
+
+def post_save_link_target(sender, instance, created, *args, **kwargs):
+	# texts may link to a document before it is created, e.g. with the id of a deleted document
+	if getattr(instance, '_url_title_changed', True):
+		bump_cache_version('links')
+		# the cached menus contain the urls of documents
+		invalidate_menus()
+		render_linking_documents(instance)
+
+
+def post_delete_link_target(sender, instance, *args, **kwargs):
+	bump_cache_version('links')
+	invalidate_menus()
+	render_linking_documents(instance)
+
+
+def invalidate_document_permission_overview(sender, instance, *args, **kwargs):
+	if sender.objects.is_generic():
+		invalidate_permission_overview(instance.content_type_id, instance.object_pk)
+	else:
+		content_type = ContentType.objects.get_for_model(sender._meta.get_field('content_object').related_model)
+		invalidate_permission_overview(content_type.id, instance.content_object_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_document_permission_overviews(sender, instance, *args, **kwargs):
+	invalidate_permission_overviews()
+
+
+def connect_model_receivers():
+	# the receivers are connected for each document and group object permission model,
+	# receivers of post_delete without sender prevent fast deletes of all models
+	for model in apps.get_models():
+		if issubclass(model, Document):
+			pre_save.connect(pre_save_link_target, sender=model)
+			post_save.connect(post_save_link_target, sender=model)
+			post_delete.connect(post_delete_link_target, sender=model)
+		if issubclass(model, GroupObjectPermissionBase):
+			post_save.connect(invalidate_document_permission_overview, sender=model)
+			post_delete.connect(invalidate_document_permission_overview, sender=model)
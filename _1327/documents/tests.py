@@ -1,15 +1,26 @@
+import asyncio
 from datetime import datetime
+from io import StringIO
 import json
 import re
 import tempfile
+import threading
 
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.base import ContentFile
-from django.db import transaction
-from django.test import TestCase
-from django.urls import reverse
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import translation
 from django_webtest import WebTest
 from guardian.shortcuts import assign_perm, get_perms, get_perms_for_model, remove_perm
 from guardian.utils import get_anonymous_user
@@ -21,12 +32,16 @@ from reversion.models import Version
 from _1327.documents.markdown_internal_link_extension import InternalLinksMarkdownExtension
 from _1327.documents.markdown_scaled_image_extension import SCALED_IMAGE_LINK_RE, ScaledImagePattern
 from _1327.information_pages.models import InformationDocument
-from _1327.main.utils import EscapeHtml, slugify
+from _1327.main.cache_versions import shared_cache
+from _1327.main.models import AbbreviationExplanation
+from _1327.main.utils import document_permission_overview, EscapeHtml, invalidate_abbreviations, markdown_cache, markdown_cache_key, slugify
 from _1327.minutes.models import MinutesDocument
 from _1327.polls.models import Poll
 from _1327.user_management.models import UserProfile
 
+from .consumers import PreviewConsumer, WHOLE_PREVIEW
 from .models import Attachment, Document, TemporaryDocumentText
+from .utils import preview_coalescer
 
 
 class TestInternalLinkMarkDown(TestCase):
@@ -58,6 +73,24 @@ class TestInternalLinkMarkDown(TestCase):
 		text = self.md.convert('[description](document:{})'.format(document.id))
 		self.assertIn('<a>[missing link]</a>', text)
 
+	def test_links_are_resolved_in_bulk(self):
+		minutes = baker.make(MinutesDocument, _quantity=5)
+		polls = baker.make(Poll, _quantity=5)
+		links = ['[minutes](document:{})'.format(document.id) for document in minutes]
+		links += ['[poll](poll:{})'.format(poll.id) for poll in polls]
+		links += ['[information](document:{})'.format(self.document.id), '[gone](document:0)', '[gone](poll:0)']
+
+		# one query per link type, the documents are not downcast
+		with self.assertNumQueries(2):
+			text = self.md.convert('\n\n'.join(links))
+
+		for document in minutes:
+			self.assertIn('<a href="{}">minutes</a>'.format(reverse(document.get_view_url_name(), args=[document.url_title])), text)
+		for poll in polls:
+			self.assertIn('<a href="{}">poll</a>'.format(reverse(poll.get_view_url_name(), args=[poll.id])), text)
+		self.assertIn('<a href="{}">information</a>'.format(reverse(self.document.get_view_url_name(), args=[self.document.url_title])), text)
+		self.assertEqual(text.count('<a>[missing link]</a>'), 2)
+
 
 class TestRevertion(WebTest):
 	csrf_checks = False
@@ -738,6 +771,106 @@ class TestMarkdownRendering(WebTest):
 		self.assertEqual('<p>' + self.document_text + '</p>', response.body.decode('utf-8'))
 
 
+class TestRenderedText(WebTest):
+	csrf_checks = False
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = baker.make(UserProfile, is_superuser=True)
+
+	def test_edit_stores_rendered_text(self):
+		document = baker.make(InformationDocument, text_en='old text')
+		document.set_all_permissions(baker.make(Group))
+		response = self.app.get(reverse(document.get_edit_url_name(), args=[document.url_title]), user=self.user)
+		form = response.forms['document-form']
+		form['text_en'] = '# Heading\n\n|quorum|(3/7)'
+		form['text_de'] = '|quorum|(3/7)'
+		form['comment'] = 'edited'
+		form.submit().follow()
+
+		document.refresh_from_db()
+		self.assertIn('<h2 id="heading">Heading</h2>', document.rendered_text_en)
+		self.assertIn('Heading', document.rendered_toc_en)
+		self.assertIn('3/7 present → not quorate', document.rendered_text_en)
+		self.assertIn('3/7', document.rendered_text_de)
+
+	def test_view_serves_rendered_text(self):
+		document = baker.make(InformationDocument, text_en='text', rendered_text_en='<p>stored</p>')
+		document.set_all_permissions(get_anonymous_user())
+		response = self.app.get(reverse(document.get_view_url_name(), args=[document.url_title]))
+		self.assertIn('<p>stored</p>', response.body.decode('utf-8'))
+
+	def test_view_renders_text_without_rendered_text(self):
+		document = baker.make(InformationDocument, text_en='text')
+		document.set_all_permissions(get_anonymous_user())
+		response = self.app.get(reverse(document.get_view_url_name(), args=[document.url_title]))
+		self.assertIn('<p>text</p>', response.body.decode('utf-8'))
+
+	def test_url_change_renders_linking_documents_again(self):
+		target = baker.make(InformationDocument, url_title='old')
+		document = baker.make(InformationDocument, text_en='[link](document:{})'.format(target.id))
+		document.update_rendered_text()
+		document.save()
+		self.assertIn('/old"', document.rendered_text_en)
+
+		target.url_title = 'new'
+		target.save()
+		document.refresh_from_db()
+		self.assertIn('/new"', document.rendered_text_en)
+
+		target.delete()
+		document.refresh_from_db()
+		self.assertIn('[missing link]', document.rendered_text_en)
+
+	def test_created_link_target_renders_linking_documents_again(self):
+		# an id that is not used by the linking document
+		target_id = (Document.objects.aggregate(Max('id'))['id__max'] or 0) + 100
+		document = baker.make(InformationDocument, text_en='[link](document:{})'.format(target_id))
+		document.update_rendered_text()
+		document.save()
+		self.assertIn('[missing link]', document.rendered_text_en)
+
+		target = baker.make(InformationDocument, id=target_id, url_title='target')
+		document.refresh_from_db()
+		self.assertIn(reverse(target.get_view_url_name(), args=['target']), document.rendered_text_en)
+
+	def test_abbreviation_change_renders_documents_again(self):
+		document = baker.make(InformationDocument, text_en='The FSR meets')
+		other_document = baker.make(InformationDocument, text_en='other text', rendered_text_en='<p>stored</p>')
+		# the abbreviations are kept by the process, the rollback of the test database does not reset them
+		self.addCleanup(invalidate_abbreviations)
+		abbreviation = AbbreviationExplanation.objects.create(abbreviation='FSR', explanation='Fachschaftsrat')
+		document.refresh_from_db()
+		self.assertIn('<abbr title="Fachschaftsrat">FSR</abbr>', document.rendered_text_en)
+
+		abbreviation.abbreviation = 'StuRa'
+		abbreviation.save()
+		document.refresh_from_db()
+		self.assertEqual(document.rendered_text_en, '<p>The FSR meets</p>')
+
+		other_document.refresh_from_db()
+		self.assertEqual(other_document.rendered_text_en, '<p>stored</p>')
+
+	def test_render_documents_command(self):
+		document = baker.make(InformationDocument, text_en='text', text_de='Text')
+		call_command('render_documents', processes=1, stdout=StringIO())
+		document.refresh_from_db()
+		self.assertEqual(document.rendered_text_en, '<p>text</p>')
+		self.assertEqual(document.rendered_text_de, '<p>Text</p>')
+
+	@override_settings(MARKDOWN_PROCESS_POOL_THRESHOLD=10)
+	def test_render_documents_command_in_processes(self):
+		# the workers of the command must not start the worker processes of the markdown pool
+		linked_document = baker.make(InformationDocument)
+		text = 'A text above the threshold with a [link](document:{})'.format(linked_document.id)
+		document = baker.make(InformationDocument, text_en=text, text_de='Ein Text')
+		Document.objects.filter(id=document.id).update(rendered_text_en='', rendered_text_de='')
+		call_command('render_documents', processes=2, stdout=StringIO())
+		document.refresh_from_db()
+		self.assertEqual(document.rendered_text_en, '<p>A text above the threshold with a <a href="{}">link</a></p>'.format(linked_document.get_view_url()))
+		self.assertEqual(document.rendered_text_de, '<p>Ein Text</p>')
+
+
 class TestLanguage(WebTest):
 	csrf_checks = False
 
@@ -1471,6 +1604,286 @@ class TestPreview(WebTest):
 			self.assertIn(preview_url, response.body.decode('utf-8'))
 
 
+@override_settings(CACHES={
+	'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+	'markdown': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+	'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+})
+class TestPreviewConsumer(TestCase):
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.document = baker.make(InformationDocument)
+		cls.document.set_all_permissions(baker.make(Group))
+		cls.user = baker.make(UserProfile, is_superuser=True)
+		cls.anonymous_user = get_anonymous_user()
+
+	def setUp(self):
+		markdown_cache().clear()
+		shared_cache().clear()
+
+	def connect(self, hash_value, user):
+		# has to be called within the event loop of the test, the queues of the communicator are bound to it on python < 3.10
+		application = URLRouter([path('preview/<hash_value>', PreviewConsumer.as_asgi())])
+		communicator = WebsocketCommunicator(application, 'preview/{}'.format(hash_value))
+		communicator.scope['user'] = user
+		return communicator
+
+	def test_editor_renders_preview(self):
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			connected, __ = await editor.connect()
+			self.assertTrue(connected)
+			connected, __ = await viewer.connect()
+			self.assertTrue(connected)
+			# there is no preview to send on connecting yet
+			self.assertTrue(await viewer.receive_nothing())
+
+			await editor.send_to(text_data=json.dumps({'text': '# Heading', 'language': 'en'}))
+			for communicator in (editor, viewer):
+				message = json.loads(await communicator.receive_from())
+				self.assertEqual(message, {'language': 'en', 'sequence': 1, 'changes': [[0, 0, ['<h2 id="heading">Heading</h2>']]]})
+
+			await editor.disconnect()
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	def test_only_changed_blocks_are_sent(self):
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			await editor.connect()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nsecond\n\nthird', 'language': 'de'}))
+			await editor.receive_from()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nchanged\n\nthird', 'language': 'de'}))
+			message = json.loads(await editor.receive_from())
+			self.assertEqual(message, {'language': 'de', 'sequence': 2, 'changes': [[1, 2, ['<p>changed</p>\n']]]})
+
+			# unchanged texts are not sent again
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nchanged\n\nthird', 'language': 'de'}))
+			self.assertTrue(await editor.receive_nothing())
+			await editor.disconnect()
+
+		async_to_sync(run)()
+
+	@override_settings(LANGUAGE_CODE='de')
+	def test_preview_is_rendered_in_its_language(self):
+		# the texts are rendered by threads of the preview coalescer without active language
+		group_name = '{}_en'.format(self.document.hash_value)
+		preview_coalescer.submit(group_name, '|start|(15:00)').result()
+		# the blocks of the preview are cached under keys of the language they were rendered in
+		with translation.override('en'):
+			key = markdown_cache_key('|start|(15:00)')
+		self.assertEqual(list(markdown_cache().get('markdown_preview_{}'.format(group_name))), [key])
+
+	def test_receiving_texts_does_not_wait_for_render(self):
+		continue_render = threading.Event()
+		render = preview_coalescer.render
+
+		def slow_render(group_name, text):
+			continue_render.wait()
+			return render(group_name, text)
+
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			await editor.connect()
+			await editor.receive_from()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nsecond', 'language': 'en'}))
+			# the consumer still answers while the text is rendered
+			await editor.send_to(text_data=json.dumps({'resync': 'en'}))
+			self.assertEqual(json.loads(await editor.receive_from()), {'language': 'en', 'sequence': 1, 'blocks': ['<p>old</p>']})
+			continue_render.set()
+			message = json.loads(await editor.receive_from())
+			self.assertEqual(message['sequence'], 2)
+			await editor.disconnect()
+
+		shared_cache().set('preview_{}_en'.format(self.document.hash_value), ['<p>old</p>'])
+		preview_coalescer.render = slow_render
+		try:
+			async_to_sync(run)()
+		finally:
+			continue_render.set()
+			preview_coalescer.render = render
+
+	def test_whole_preview_is_sent_on_connect_and_resync(self):
+		whole_preview = {'language': 'en', 'sequence': 1, 'blocks': ['<p>first</p>\n', '<p>second</p>']}
+
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			await editor.connect()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nsecond', 'language': 'en'}))
+			await editor.receive_from()
+
+			await viewer.connect()
+			self.assertEqual(json.loads(await viewer.receive_from()), whole_preview)
+
+			# viewers missing an update ask for the whole preview
+			await viewer.send_to(text_data=json.dumps({'resync': 'en'}))
+			self.assertEqual(json.loads(await viewer.receive_from()), whole_preview)
+			await viewer.send_to(text_data=json.dumps({'resync': 'de'}))
+			self.assertTrue(await viewer.receive_nothing())
+
+			await editor.disconnect()
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	def test_reconnect_after_cached_blocks_expired(self):
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			await editor.connect()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nsecond', 'language': 'en'}))
+			await editor.receive_from()
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nthird', 'language': 'en'}))
+			self.assertEqual(json.loads(await editor.receive_from())['sequence'], 2)
+
+			shared_cache().clear()
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			await viewer.connect()
+			self.assertTrue(await viewer.receive_nothing())
+			# the sequences of the new connection start again, the page asks for the whole preview on a change of an unknown base
+			await editor.send_to(text_data=json.dumps({'text': 'first\n\nfourth', 'language': 'en'}))
+			await editor.receive_from()
+			self.assertEqual(json.loads(await viewer.receive_from()), {'language': 'en', 'sequence': 1, 'changes': [[0, 0, ['<p>first</p>\n', '<p>fourth</p>']]]})
+			await viewer.send_to(text_data=json.dumps({'resync': 'en'}))
+			self.assertEqual(json.loads(await viewer.receive_from()), {'language': 'en', 'sequence': 1, 'blocks': ['<p>first</p>\n', '<p>fourth</p>']})
+
+			await editor.disconnect()
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	def test_updates_sent_by_other_processes_are_diffed_per_viewer(self):
+		async def run():
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			await viewer.connect()
+			# other processes do not know which blocks the viewers of this process have
+			for blocks in (['<p>first</p>'], ['<p>first</p>', '<p>second</p>'], ['<p>first</p>', '<p>second</p>']):
+				await get_channel_layer().group_send(self.document.hash_value, {'type': 'update_preview', 'language': 'en', 'blocks': blocks})
+			self.assertEqual(json.loads(await viewer.receive_from()), {'language': 'en', 'sequence': 1, 'changes': [[0, 0, ['<p>first</p>']]]})
+			self.assertEqual(json.loads(await viewer.receive_from()), {'language': 'en', 'sequence': 2, 'changes': [[1, 1, ['<p>second</p>']]]})
+			self.assertTrue(await viewer.receive_nothing())
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	@override_settings(PREVIEW_HEARTBEAT_INTERVAL=0.05, PREVIEW_IDLE_TIMEOUT=0.12)
+	def test_idle_connections_are_closed(self):
+		async def run():
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			await viewer.connect()
+			self.assertEqual(json.loads(await viewer.receive_from()), {'heartbeat': True})
+			await viewer.send_to(text_data=json.dumps({'heartbeat': True}))
+
+			# the connection is closed after the viewer stopped answering
+			messages = []
+			output = await viewer.receive_output(timeout=1)
+			while output['type'] != 'websocket.close':
+				messages.append(json.loads(output['text']))
+				output = await viewer.receive_output(timeout=1)
+			self.assertGreaterEqual(len(messages), 1)
+			self.assertTrue(all(message == {'heartbeat': True} for message in messages))
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	def test_viewers_not_keeping_up_get_whole_preview(self):
+		consumer = PreviewConsumer()
+		consumer.previews = {}
+
+		async def run():
+			consumer.outbox = asyncio.Queue(maxsize=2)
+			for text in ('first', 'second', 'third'):
+				await consumer.update_preview({'language': 'en', 'blocks': ['<p>{}</p>'.format(text)]})
+			# the updates are replaced, the queue does not grow
+			self.assertEqual(consumer.outbox.qsize(), 1)
+			self.assertIs(consumer.outbox.get_nowait(), WHOLE_PREVIEW)
+
+		async_to_sync(run)()
+
+	def test_benchmark_preview_viewers_command(self):
+		output = StringIO()
+		call_command('benchmark_preview_viewers', viewers=20, idle=0, stdout=output)
+		self.assertRegex(output.getvalue(), r'viewers\s+20')
+		self.assertIn('update all', output.getvalue())
+
+	def test_viewer_can_not_render_preview(self):
+		async def run():
+			viewer = self.connect(self.document.hash_value, self.anonymous_user)
+			connected, __ = await viewer.connect()
+			self.assertTrue(connected)
+
+			await viewer.send_to(text_data=json.dumps({'text': '# Heading', 'language': 'en'}))
+			self.assertTrue(await viewer.receive_nothing())
+			await viewer.disconnect()
+
+		async_to_sync(run)()
+
+	def test_invalid_messages_are_ignored(self):
+		async def run():
+			editor = self.connect(self.document.hash_value, self.user)
+			await editor.connect()
+
+			await editor.send_to(text_data='# Heading')
+			await editor.send_to(text_data=json.dumps({'language': 'en'}))
+			self.assertTrue(await editor.receive_nothing())
+			await editor.disconnect()
+
+		async_to_sync(run)()
+
+	def test_preview_of_missing_document(self):
+		async def run():
+			communicator = self.connect('missing', self.user)
+			connected, __ = await communicator.connect()
+			self.assertFalse(connected)
+
+		async_to_sync(run)()
+
+
+class TestDefaultPermissions(TestCase):
+
+	def create_document_queries(self):
+		with CaptureQueriesContext(connection) as context:
+			document = baker.make(InformationDocument)
+		return document, len(context.captured_queries)
+
+	def test_default_permissions_are_assigned_in_bulk(self):
+		permissions = Permission.objects.filter(content_type=ContentType.objects.get_for_model(InformationDocument))
+		groups = baker.make(Group, _quantity=10)
+		groups[0].permissions.add(*permissions)
+		__, queries = self.create_document_queries()
+
+		for group in groups[1:]:
+			group.permissions.add(*permissions)
+		document, queries_with_more_groups = self.create_document_queries()
+		self.assertEqual(queries_with_more_groups, queries)
+		for group in groups:
+			self.assertEqual(set(get_perms(group, document)), {permission.codename for permission in permissions})
+
+	def test_set_and_reset_permissions(self):
+		document = baker.make(InformationDocument)
+		group = baker.make(Group)
+		user = baker.make(UserProfile)
+		assign_perm(document.view_permission_name, group, document)
+
+		with self.assertNumQueries(2):
+			document.set_all_permissions(group)
+		document.set_all_permissions(user)
+		self.assertEqual(set(get_perms(group, document)), set(document.all_permission_codenames()))
+		self.assertTrue(user.has_perm(document.delete_permission_name, document))
+
+		document.delete_all_permissions(user)
+		self.assertEqual(get_perms(user, document), [])
+		self.assertEqual(len(get_perms(group, document)), 3)
+
+		document.set_all_permissions(user)
+		document.reset_permissions()
+		self.assertEqual(get_perms(user, document), [])
+		self.assertEqual(get_perms(group, document), [])
+
+
 class TestPermissionOverview(WebTest):
 	csrf_checks = False
 
@@ -1536,6 +1949,40 @@ class TestPermissionOverview(WebTest):
 			for icon in icons:
 				self.assertIn(icon, response)
 
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_permission_overview_is_cached(self):
+		shared_cache().clear()
+		superuser = baker.make(UserProfile, is_superuser=True)
+		document = self.information_document
+		other_groups = baker.make(Group, _quantity=5)
+		ContentType.objects.get_for_model(document)
+
+		with self.assertNumQueries(1):
+			overview = document_permission_overview(superuser, document)
+		self.assertEqual(overview, [
+			(settings.ANONYMOUS_GROUP_NAME, "view"),
+			(settings.UNIVERSITY_GROUP_NAME, "view"),
+			(settings.STUDENT_GROUP_NAME, "view"),
+			(settings.STAFF_GROUP_NAME, "edit"),
+			(self.group.name, "edit"),
+		])
+		with self.assertNumQueries(0):
+			self.assertEqual(document_permission_overview(superuser, document), overview)
+
+		assign_perm(document.view_permission_name, other_groups[0], document)
+		self.assertEqual(document_permission_overview(superuser, document)[-1], (other_groups[0].name, "view"))
+
+		other_groups[0].name = "renamed group"
+		other_groups[0].save()
+		self.assertEqual(document_permission_overview(superuser, document)[-1], ("renamed group", "view"))
+
+		remove_perm(document.view_permission_name, self.anonymous_group, document)
+		self.assertEqual(document_permission_overview(superuser, document)[0], (settings.ANONYMOUS_GROUP_NAME, "none"))
+
 
 class DocumentCreationTests(WebTest):
 
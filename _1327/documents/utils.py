@@ -1,17 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 import json
 import re
 
+from asgiref.sync import async_to_sync
+import channels.layers
+
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import SuspiciousOperation
-from django.db import transaction
-from django.utils import timezone
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone, translation
+from guardian.models import BaseObjectPermission
 from reversion import revisions
 from reversion.models import Version
 
 from _1327.documents.forms import AttachmentForm
 from _1327.documents.models import Document, TemporaryDocumentText
+from _1327.main.cache_versions import shared_cache
+from _1327.main.markdown_pool import render_arguments, render_in_worker
+from _1327.main.markdown_preview import diff_blocks, PreviewCoalescer, render_preview, split_html_blocks
+from _1327.user_management.shortcuts import check_permissions
 
 
 def get_new_autosaved_pages_for_user(user, content_type):
@@ -67,6 +77,7 @@ def handle_edit(request, document, formset=None, initial=None, creation_group=No
 				if Document.objects.filter(url_title=document.url_title).exclude(id=document.id).exists():
 					document.url_title = document.generate_default_slug(document.url_title)
 
+				document.update_rendered_text()
 				with revisions.create_revision():
 					document.save()
 					document.save_formset(formset)
@@ -179,10 +190,140 @@ def delete_cascade_to_json(cascade):
 	items = []
 	for cascade_item in cascade:
 		if hasattr(cascade_item, '__iter__'):
-			items.append(delete_cascade_to_json(cascade_item))
+			nested_items = delete_cascade_to_json(cascade_item)
+			if nested_items:
+				items.append(nested_items)
+		elif isinstance(cascade_item, BaseObjectPermission):
+			# the object permissions of deleted objects are not worth mentioning
+			continue
 		else:
 			items.append({
 				"type": type(cascade_item).__name__,
 				"name": str(cascade_item),
 			})
 	return items
+
+
+_render_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def render_documents(document_ids, pool=None):
+	"""
+		renders the texts of the documents again and stores the results.
+		given a pool of worker processes, e.g. by the render_documents command, the texts are rendered by its workers.
+	"""
+	documents = list(Document.objects.non_polymorphic().filter(id__in=document_ids).only('text_de', 'text_en'))
+	if pool is None:
+		for document in documents:
+			document.update_rendered_text()
+	else:
+		texts = [(document, language) for document in documents for language in ('de', 'en')]
+		arguments = []
+		for document, language in texts:
+			with translation.override(language):
+				arguments.append(render_arguments(getattr(document, 'text_' + language)))
+		# the workers render the texts themselves, they must not start worker processes of the markdown pool
+		for (document, language), rendered in zip(texts, pool.starmap(render_in_worker, arguments)):
+			document.set_rendered_text(language, rendered)
+
+	for document in documents:
+		# a document that has been edited in the meantime was rendered when it was saved
+		Document.objects.non_polymorphic().filter(id=document.id, text_de=document.text_de, text_en=document.text_en).update(
+			rendered_text_de=document.rendered_text_de,
+			rendered_text_en=document.rendered_text_en,
+			rendered_toc_de=document.rendered_toc_de,
+			rendered_toc_en=document.rendered_toc_en,
+		)
+
+
+def render_documents_in_background(document_ids):
+	try:
+		render_documents(document_ids)
+	finally:
+		# the connections of the worker thread are not closed by any request
+		connections.close_all()
+
+
+def render_documents_containing(*texts):
+	"""
+		renders all documents containing one of the texts again, once the current transaction is committed
+	"""
+	if not texts:
+		return
+
+	query = Q()
+	for text in texts:
+		query |= Q(text_de__contains=text) | Q(text_en__contains=text)
+	document_ids = list(Document.objects.non_polymorphic().filter(query).values_list('id', flat=True))
+	if not document_ids:
+		return
+
+	if settings.RENDER_DOCUMENTS_IN_BACKGROUND:
+		transaction.on_commit(lambda: _render_executor.submit(render_documents_in_background, document_ids))
+	else:
+		render_documents(document_ids)
+
+
+def check_preview_permissions(document, user):
+	# documents in creation have no permissions yet, their previews may be rendered by everyone creating documents
+	if document.has_perms():
+		check_permissions(document, user, [document.view_permission_name, document.edit_permission_name])
+
+
+def render_preview_of_group(group_name, text):
+	# the threads of the preview coalescer have no active language
+	__, language = group_name.rsplit('_', 1)
+	with translation.override(language or settings.LANGUAGE_CODE):
+		html, __ = render_preview(group_name, text)
+	return html
+
+
+# the editor renders a preview for each language of the document, texts without language are previewed on their own
+PREVIEW_LANGUAGES = ('de', 'en', '')
+
+
+def preview_group_name(hash_value, language):
+	return '{}_{}'.format(hash_value, language)
+
+
+def preview_blocks(hash_value, language):
+	"""
+		returns the blocks of the html last sent to the viewers of a preview, viewers connecting later start with them
+	"""
+	return shared_cache().get('preview_{}'.format(preview_group_name(hash_value, language)), [])
+
+
+@lru_cache(maxsize=64)
+def diff_preview_blocks(old_blocks, new_blocks):
+	# all viewers of a preview in this process usually compute the same changes
+	return diff_blocks(old_blocks, new_blocks)
+
+
+def send_preview(group_name, html):
+	# the viewers of a preview may be connected to other processes, so the message carries all blocks
+	# and each viewer sends only the blocks that changed for it
+	hash_value, language = group_name.rsplit('_', 1)
+	blocks = split_html_blocks(html)
+	if blocks == preview_blocks(hash_value, language):
+		return
+	shared_cache().set('preview_{}'.format(group_name), blocks)
+	async_to_sync(channels.layers.get_channel_layer().group_send)(
+		hash_value,
+		{
+			'type': 'update_preview',
+			'language': language,
+			'blocks': blocks,
+		}
+	)
+
+
+preview_coalescer = PreviewCoalescer(render_preview_of_group, send_preview)
+
+
+def render_and_send_preview(hash_value, language, text):
+	"""
+		renders the text of a document in the given language and sends it to all viewers of the document's preview.
+		returns a future of the html, texts sent by others while rendering may supersede the given text.
+	"""
+	language = language if language in PREVIEW_LANGUAGES else ''
+	return preview_coalescer.submit(preview_group_name(hash_value, language), text)
@@ -2,9 +2,6 @@ from datetime import datetime
 import json
 import os
 
-from asgiref.sync import async_to_sync
-import channels.layers
-
 from django.contrib import messages
 from django.contrib.admin.utils import NestedObjects
 from django.contrib.auth.models import Group
@@ -27,11 +24,11 @@ from sendfile import sendfile
 from _1327 import settings
 from _1327.documents.forms import get_permission_form
 from _1327.documents.models import Attachment, Document, TemporaryDocumentText
-from _1327.documents.utils import delete_cascade_to_json, delete_old_empty_pages, get_model_function, get_new_autosaved_pages_for_user, \
-	handle_attachment, handle_autosave, handle_edit, prepare_versions
+from _1327.documents.utils import check_preview_permissions, delete_cascade_to_json, delete_old_empty_pages, get_model_function, \
+	get_new_autosaved_pages_for_user, handle_attachment, handle_autosave, handle_edit, prepare_versions, render_and_send_preview
 from _1327.information_pages.models import InformationDocument
 from _1327.information_pages.forms import InformationDocumentForm  # noqa
-from _1327.main.utils import convert_markdown, document_permission_overview
+from _1327.main.utils import document_permission_overview
 from _1327.minutes.models import MinutesDocument
 from _1327.minutes.forms import MinutesDocumentForm  # noqa
 from _1327.polls.models import Poll
@@ -104,6 +101,7 @@ def edit(request, title, new_autosaved_pages=None, initial=None):
 			'permission_overview': document_permission_overview(request.user, document),
 			'supported_image_types': settings.SUPPORTED_IMAGE_TYPES,
 			'formset': formset,
+			'preview_url': settings.PREVIEW_URL,
 		})
 
 
@@ -160,9 +158,9 @@ def view(request, title):
 
 	if document.text == "" and (document.text_en != "" or document.text_de != ""):
 		messages.warning(request, _('The requested document is not available in the selected language. It will be shown in the available language instead.'))
-		text, toc = convert_markdown(next((text for text in (document.text_de, document.text_en) if text != ""), ""))
+		text, toc = document.get_rendered_text('de' if document.text_de != "" else 'en')
 	else:
-		text, toc = convert_markdown(document.text)
+		text, toc = document.get_rendered_text()
 
 	return render(request, 'documents_base.html', {
 		'document': document,
@@ -242,20 +240,9 @@ def render_text(request, title):
 		raise SuspiciousOperation
 
 	document = get_object_or_404(Document, url_title=title)
-	if document.has_perms():
-		check_permissions(document, request.user, [document.view_permission_name, document.edit_permission_name])
-
-	text, __ = convert_markdown(request.POST['text'])
-
-	channel_layer = channels.layers.get_channel_layer()
-	async_to_sync(channel_layer.group_send)(
-		document.hash_value,
-		{
-			'type': 'update_preview',
-			'message': text,
-		}
-	)
+	check_preview_permissions(document, request.user)
 
+	text = render_and_send_preview(document.hash_value, request.POST.get('language'), request.POST['text']).result()
 	return HttpResponse(text, content_type='text/plain')
 
 
@@ -344,6 +331,7 @@ def revert(request):
 			new_fields[field.attname] = fields[key]
 
 	reverted_document = document_class(**new_fields)
+	reverted_document.update_rendered_text()
 	with transaction.atomic(), revisions.create_revision():
 		reverted_document.save()
 		# Restore ManyToManyFields
@@ -500,7 +488,7 @@ def preview(request):
 	hash_value = request.GET['hash_value']
 	document = get_object_or_404(Document, hash_value=hash_value)
 
-	text, __ = convert_markdown(document.text)
+	text, __ = document.get_rendered_text()
 
 	return render(
 		request,
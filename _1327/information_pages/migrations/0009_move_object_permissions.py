@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from _1327.user_management.object_permission_migrations import move_to_direct_object_permissions, move_to_generic_object_permissions
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('information_pages', '0008_direct_object_permissions'),
+		('contenttypes', '0002_remove_content_type_name'),
+		('guardian', '0002_generic_permissions_index'),
+	]
+
+	operations = [
+		migrations.RunPython(
+			move_to_direct_object_permissions('information_pages', 'InformationDocument'),
+			move_to_generic_object_permissions('information_pages', 'InformationDocument'),
+		),
+	]
@@ -2,6 +2,7 @@ from django.db import models
 from django.template import loader
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
 from reversion import revisions
 
 from _1327.documents.models import Document
@@ -45,3 +46,11 @@ class InformationDocument(Document):
 
 
 revisions.register(InformationDocument, follow=["document_ptr"])
+
+
+class InformationDocumentUserObjectPermission(UserObjectPermissionBase):
+	content_object = models.ForeignKey(InformationDocument, on_delete=models.CASCADE)
+
+
+class InformationDocumentGroupObjectPermission(GroupObjectPermissionBase):
+	content_object = models.ForeignKey(InformationDocument, on_delete=models.CASCADE)
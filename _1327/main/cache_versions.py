@@ -0,0 +1,57 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+
+# the versions known to this process with the time they were read from the shared cache
+_versions = {}
+
+
+def shared_cache():
+	"""
+		the cache shared by all processes of a deployment, see SHARED_CACHE_ALIAS
+	"""
+	return caches[settings.SHARED_CACHE_ALIAS]
+
+
+def cache_version(name):
+	"""
+		returns the version token of cached data. entries cached under an old version are not used anymore.
+		the token is read from the shared cache at most every CACHE_VERSION_CHECK_INTERVAL seconds,
+		so changes made in other processes are noticed after this interval at the latest.
+	"""
+	now = time.monotonic()
+	known = _versions.get(name)
+	if known is not None and now - known[1] < settings.CACHE_VERSION_CHECK_INTERVAL:
+		return known[0]
+
+	# versions are random tokens instead of counters, so an evicted version can never be reused for stale entries
+	key = 'version_{}'.format(name)
+	version = shared_cache().get(key)
+	if version is None:
+		shared_cache().add(key, uuid.uuid4().hex, None)
+		version = shared_cache().get(key, '')
+	_versions[name] = (version, now)
+	return version
+
+
+def bump_cache_version(name):
+	def bump():
+		shared_cache().set('version_{}'.format(name), uuid.uuid4().hex, None)
+		# the next read sees the new version at once
+		_versions.pop(name, None)
+
+	bump()
+	# data cached before the change was committed must not stay cached under the new version
+	transaction.on_commit(bump)
+
+
+@receiver(setting_changed)
+def forget_cache_versions(setting, **kwargs):
+	if setting in ('CACHES', 'SHARED_CACHE_ALIAS'):
+		_versions.clear()
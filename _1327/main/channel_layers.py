@@ -0,0 +1,374 @@
+import asyncio
+from collections import deque
+import os
+import struct
+import threading
+import time
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+import msgpack
+
+
+FRAME_HEADER = struct.Struct('!I')
+
+
+def serialize(message):
+	return msgpack.packb(message, use_bin_type=True)
+
+
+def deserialize(data):
+	return msgpack.unpackb(data, raw=False)
+
+
+class LocalChannelLayer(BaseChannelLayer):
+	"""
+		delivers messages within this process, for deployments running a single asgi process.
+
+		like in the redis layer, channels hold at most `capacity` messages, or the capacity of the first pattern
+		in `channel_capacity` matching the channel. send raises ChannelFull for full channels, group_send skips them.
+		messages expire after `expiry` seconds, group memberships after `group_expiry` seconds.
+		messages are serialized like in the redis layer, so consumers get the same messages with both layers.
+
+		the layer can be used from several threads and event loops, e.g. from sync code using async_to_sync.
+	"""
+
+	extensions = ['groups', 'flush']
+
+	def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+		super().__init__(expiry=expiry, capacity=capacity)
+		self.channel_capacity = self.compile_capacities(channel_capacity or {})
+		self.group_expiry = group_expiry
+		self.lock = threading.Lock()
+		self.channels = {}
+		self.waiters = {}
+		self.groups = {}
+		self.next_cleanup = time.monotonic() + expiry
+
+	async def new_channel(self, prefix='specific.'):
+		return '{}local!{}'.format(prefix, uuid.uuid4().hex)
+
+	async def send(self, channel, message):
+		assert isinstance(message, dict), 'message is not a dict'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		self.put(channel, serialize(message))
+
+	async def receive(self, channel):
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		return deserialize(await self.take(channel))
+
+	async def group_add(self, group, channel):
+		assert self.valid_group_name(group), 'Group name not valid'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		with self.lock:
+			self.groups.setdefault(group, {})[channel] = time.monotonic()
+
+	async def group_discard(self, group, channel):
+		assert self.valid_group_name(group), 'Group name not valid'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		with self.lock:
+			channels = self.groups.get(group, {})
+			channels.pop(channel, None)
+			if not channels:
+				self.groups.pop(group, None)
+
+	async def group_send(self, group, message):
+		assert isinstance(message, dict), 'message is not a dict'
+		assert self.valid_group_name(group), 'Group name not valid'
+		self.group_put(group, serialize(message))
+
+	async def flush(self):
+		with self.lock:
+			self.channels = {}
+			self.groups = {}
+
+	async def close(self):
+		pass
+
+	# the following methods work on serialized messages and are shared with the ChannelBroker
+
+	def put(self, channel, data):
+		now = time.monotonic()
+		with self.lock:
+			self.remove_expired(now)
+			queue = self.channels.setdefault(channel, deque())
+			while queue and queue[0][0] < now:
+				queue.popleft()
+			if len(queue) >= self.get_capacity(channel):
+				raise ChannelFull(channel)
+			queue.append((now + self.expiry, data))
+			self.wake_waiters(channel)
+
+	def group_put(self, group, data):
+		with self.lock:
+			timeout = time.monotonic() - self.group_expiry
+			channels = self.groups.get(group, {})
+			for channel in [channel for channel, joined in channels.items() if joined < timeout]:
+				del channels[channel]
+			channels = list(channels)
+		for channel in channels:
+			try:
+				self.put(channel, data)
+			except ChannelFull:
+				pass
+
+	async def take(self, channel):
+		loop = asyncio.get_event_loop()
+		while True:
+			with self.lock:
+				data = self.pop(channel)
+				if data is None:
+					future = loop.create_future()
+					self.waiters.setdefault(channel, []).append((loop, future))
+			if data is not None:
+				return data
+			try:
+				await future
+			finally:
+				with self.lock:
+					waiters = self.waiters.get(channel, [])
+					if (loop, future) in waiters:
+						waiters.remove((loop, future))
+					if not waiters:
+						self.waiters.pop(channel, None)
+
+	def pop(self, channel):
+		queue = self.channels.get(channel)
+		if queue is None:
+			return None
+		now = time.monotonic()
+		while queue and queue[0][0] < now:
+			queue.popleft()
+		data = queue.popleft()[1] if queue else None
+		if not queue:
+			del self.channels[channel]
+		return data
+
+	def wake_waiters(self, channel):
+		for loop, future in self.waiters.get(channel, []):
+			try:
+				loop.call_soon_threadsafe(self.wake_waiter, future)
+			except RuntimeError:
+				# the loop of the waiter is closed already
+				pass
+
+	@staticmethod
+	def wake_waiter(future):
+		if not future.done():
+			future.set_result(None)
+
+	def remove_expired(self, now):
+		if now < self.next_cleanup:
+			return
+		self.next_cleanup = now + self.expiry
+		for channel, queue in list(self.channels.items()):
+			while queue and queue[0][0] < now:
+				queue.popleft()
+			if not queue:
+				del self.channels[channel]
+
+
+async def read_frame(reader):
+	length, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+	return deserialize(await reader.readexactly(length))
+
+
+def write_frame(writer, data):
+	payload = serialize(data)
+	writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class ChannelBroker:
+	"""
+		serves a LocalChannelLayer to the BrokerChannelLayers of several processes on one machine over a unix socket
+	"""
+
+	def __init__(self, path, **config):
+		self.path = path
+		self.layer = LocalChannelLayer(**config)
+		self.methods = {
+			'new_channel': self.layer.new_channel,
+			'put': self.layer.put,
+			'take': self.layer.take,
+			'group_add': self.layer.group_add,
+			'group_discard': self.layer.group_discard,
+			'group_put': self.layer.group_put,
+			'flush': self.layer.flush,
+		}
+
+	async def start(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+		return await asyncio.start_unix_server(self.handle_connection, path=self.path)
+
+	async def serve(self):
+		server = await self.start()
+		async with server:
+			await server.serve_forever()
+
+	async def handle_connection(self, reader, writer):
+		requests = {}
+		try:
+			while True:
+				request_id, method, args = await read_frame(reader)
+				if method == 'cancel':
+					request = requests.pop(args[0], None)
+					if request is not None:
+						request.cancel()
+					continue
+				requests[request_id] = asyncio.ensure_future(self.handle_request(writer, requests, request_id, method, args))
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			for request in list(requests.values()):
+				request.cancel()
+			writer.close()
+
+	async def handle_request(self, writer, requests, request_id, method, args):
+		error = None
+		result = None
+		try:
+			result = self.methods[method](*args)
+			if asyncio.iscoroutine(result):
+				result = await result
+		except ChannelFull:
+			error = 'ChannelFull'
+		except asyncio.CancelledError:
+			error = 'cancelled'
+		except Exception as e:
+			error = repr(e)
+		finally:
+			requests.pop(request_id, None)
+		write_frame(writer, [request_id, error, result])
+
+
+class BrokerConnection:
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+		self.next_request_id = 0
+		self.futures = {}
+		# messages taken for receives that were cancelled meanwhile, they are returned by the next receive of the channel
+		self.cancelled_takes = {}
+		self.received = {}
+		self.reader_task = asyncio.ensure_future(self.read_responses())
+
+	async def request(self, method, *args):
+		self.next_request_id += 1
+		request_id = self.next_request_id
+		future = asyncio.get_event_loop().create_future()
+		self.futures[request_id] = future
+		write_frame(self.writer, [request_id, method, args])
+		try:
+			await self.writer.drain()
+			return await future
+		except asyncio.CancelledError:
+			if method == 'take':
+				if future.done() and not future.cancelled() and future.exception() is None:
+					self.received.setdefault(args[0], deque()).append(future.result())
+				else:
+					self.cancelled_takes[request_id] = args[0]
+					write_frame(self.writer, [0, 'cancel', [request_id]])
+			raise
+		finally:
+			self.futures.pop(request_id, None)
+
+	async def take(self, channel):
+		received = self.received.get(channel)
+		if received:
+			data = received.popleft()
+			if not received:
+				del self.received[channel]
+			return data
+		return await self.request('take', channel)
+
+	async def read_responses(self):
+		try:
+			while True:
+				request_id, error, result = await read_frame(self.reader)
+				channel = self.cancelled_takes.pop(request_id, None)
+				if channel is not None and error is None and result is not None:
+					self.received.setdefault(channel, deque()).append(result)
+					continue
+				future = self.futures.get(request_id)
+				if future is None or future.done():
+					continue
+				if error == 'ChannelFull':
+					future.set_exception(ChannelFull())
+				elif error is not None:
+					future.set_exception(RuntimeError('The channel broker failed: {}'.format(error)))
+				else:
+					future.set_result(result)
+		except (asyncio.IncompleteReadError, ConnectionError):
+			for future in self.futures.values():
+				if not future.done():
+					future.set_exception(ConnectionError('The channel broker closed the connection'))
+
+	def close(self):
+		self.reader_task.cancel()
+		self.writer.close()
+
+
+class BrokerChannelLayer(BaseChannelLayer):
+	"""
+		delivers messages between the processes of one machine through a ChannelBroker listening on the unix socket `path`,
+		see the run_channel_broker command. the capacities and expiries of the broker's layer apply.
+	"""
+
+	extensions = ['groups', 'flush']
+
+	def __init__(self, path, expiry=60, capacity=100, **kwargs):
+		super().__init__(expiry=expiry, capacity=capacity)
+		self.path = path
+		self.connections = {}
+
+	async def connection(self):
+		# streams can only be used in the event loop they were created in, e.g. async_to_sync may use short lived loops
+		for closed_loop in [loop for loop in self.connections if loop.is_closed()]:
+			del self.connections[closed_loop]
+		loop = asyncio.get_event_loop()
+		connection = self.connections.get(loop)
+		if connection is None or connection.reader_task.done():
+			reader, writer = await asyncio.open_unix_connection(self.path)
+			connection = self.connections[loop] = BrokerConnection(reader, writer)
+		return connection
+
+	async def new_channel(self, prefix='specific.'):
+		return await (await self.connection()).request('new_channel', prefix)
+
+	async def send(self, channel, message):
+		assert isinstance(message, dict), 'message is not a dict'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		try:
+			await (await self.connection()).request('put', channel, serialize(message))
+		except ChannelFull:
+			raise ChannelFull(channel)
+
+	async def receive(self, channel):
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		return deserialize(await (await self.connection()).take(channel))
+
+	async def group_add(self, group, channel):
+		assert self.valid_group_name(group), 'Group name not valid'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		await (await self.connection()).request('group_add', group, channel)
+
+	async def group_discard(self, group, channel):
+		assert self.valid_group_name(group), 'Group name not valid'
+		assert self.valid_channel_name(channel), 'Channel name not valid'
+		await (await self.connection()).request('group_discard', group, channel)
+
+	async def group_send(self, group, message):
+		assert isinstance(message, dict), 'message is not a dict'
+		assert self.valid_group_name(group), 'Group name not valid'
+		await (await self.connection()).request('group_put', group, serialize(message))
+
+	async def flush(self):
+		await (await self.connection()).request('flush')
+
+	async def close(self):
+		loop = asyncio.get_event_loop()
+		connection = self.connections.pop(loop, None)
+		if connection is not None:
+			connection.close()
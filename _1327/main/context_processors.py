@@ -1,20 +1,92 @@
-from django.conf import settings
-from guardian.shortcuts import get_objects_for_user
+import hashlib
 
-from _1327.main.models import MenuItem
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import get_language
+
+from _1327.documents.models import Document
+from _1327.main.cache_versions import cache_version
+from _1327.user_management.registry import get_group, permission_names
+from _1327.user_management.shortcuts import get_permitted_objects
 from . import models
 
 
+PERMISSION_FLAGS_SESSION_KEY = 'permission_flags'
+
+
+class MenuEntry:
+	"""
+		a menu item as shown in the menus. the menus visible to a user are cached as trees of entries,
+		only marking the selected entries is done per request.
+	"""
+
+	def __init__(self, menu_item):
+		self.id = menu_item.id
+		self.title = menu_item.title
+		self.url = menu_item.get_url()
+		self.link = menu_item.link
+		self.document_url_title = menu_item.document.url_title if menu_item.document_id else None
+		self.submenu = []
+		self.selected = False
+
+
+def menu_fingerprint(user):
+	"""
+		describes the permissions the visible menu items depend on, users with the same permissions share their cached menus.
+		the permissions of the anonymous user apply to everyone and invalidate all cached menus when changed.
+	"""
+	parts = [user.is_authenticated, user.is_active and user.is_superuser, getattr(user, '_ip_range_group_name', '')]
+	if user.is_authenticated and user.is_active and not user.is_superuser:
+		parts += [
+			sorted(user.groups.values_list('id', flat=True)),
+			sorted(user.user_permissions.values_list('id', flat=True)),
+			sorted(models.MenuItemUserObjectPermission.objects.filter(user=user).values_list('content_object_id', 'permission_id')),
+		]
+	return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def build_menus(user):
+	menu_items = list(models.MenuItem.objects.all())
+	documents = Document.objects.in_bulk({menu_item.document_id for menu_item in menu_items if menu_item.document_id})
+
+	view_permission_name = permission_names(models.MenuItem).view
+	if user.has_perm(view_permission_name):
+		visible_ids = {menu_item.id for menu_item in menu_items}
+	else:
+		visible_ids = set(get_permitted_objects(models.MenuItem.objects.all(), user, view_permission_name).values_list('id', flat=True))
+
+	entries = {}
+	for menu_item in menu_items:
+		if menu_item.id in visible_ids:
+			if menu_item.document_id:
+				menu_item.document = documents[menu_item.document_id]
+			entries[menu_item.id] = MenuEntry(menu_item)
+	# items of invisible parents are not shown
+	for menu_item in menu_items:
+		if menu_item.id in entries and menu_item.parent_id in entries:
+			entries[menu_item.parent_id].submenu.append(entries[menu_item.id])
+
+	main_menu = [entries[menu_item.id] for menu_item in menu_items if menu_item.id in entries and menu_item.menu_type == models.MenuItem.MAIN_MENU and menu_item.parent_id is None]
+	footer = [entries[menu_item.id] for menu_item in menu_items if menu_item.id in entries and menu_item.menu_type == models.MenuItem.FOOTER]
+	return main_menu, footer
+
+
+def visible_menus(user):
+	key = 'menus_{}_{}_{}'.format(cache_version('menus'), get_language(), menu_fingerprint(user))
+	menus = caches['default'].get(key)
+	if menus is None:
+		menus = build_menus(user)
+		caches['default'].set(key, menus)
+	return menus
+
+
 def menu(request):
-	menu_items = models.MenuItem.objects.filter(menu_type=models.MenuItem.MAIN_MENU, parent=None)
-	menu_items = [menu_item for menu_item in menu_items if menu_item.can_view(request.user)]
+	menu_items, footer_items = visible_menus(request.user)
 
 	for item in menu_items:
 		mark_selected(request, item)
 
-	footer_items = models.MenuItem.objects.filter(menu_type=models.MenuItem.FOOTER)
-	footer_items = [footer_item for footer_item in footer_items if footer_item.can_view(request.user)]
-
 	for item in footer_items:
 		mark_selected(request, item)
 
@@ -25,8 +97,6 @@ def menu(request):
 
 
 def mark_selected(request, menu_item):
-	menu_item.submenu = menu_item.children.all()
-	menu_item.submenu = [submenu_item for submenu_item in menu_item.submenu if submenu_item.can_view(request.user)]
 	found_selected = False
 	for child in menu_item.submenu:
 		if mark_selected(request, child):
@@ -47,26 +117,56 @@ def mark_selected(request, menu_item):
 			if item_view.startswith('admin:') and current_view_name.startswith('admin:'):
 				menu_item.selected = True
 				return True
-		elif menu_item.document:
-			if 'title' in request.resolver_match.kwargs and menu_item.document.url_title == request.resolver_match.kwargs['title']:
+		elif menu_item.document_url_title is not None:
+			if 'title' in request.resolver_match.kwargs and menu_item.document_url_title == request.resolver_match.kwargs['title']:
 				menu_item.selected = True
 				return True
 
 
+def permission_flag(request, name, compute):
+	"""
+		computes a permission flag of the user when a template reads it for the first time.
+		the flags of logged in users are kept in their session until permissions or groups change,
+		changes made by other processes are noticed within CACHE_VERSION_CHECK_INTERVAL.
+	"""
+	def get_flag():
+		user = request.user
+		if not user.is_authenticated or not hasattr(request, 'session'):
+			return compute(user)
+
+		version = cache_version('permission_flags')
+		if not version:
+			# without a cache the flags could not be invalidated
+			return compute(user)
+		flags = request.session.get(PERMISSION_FLAGS_SESSION_KEY)
+		if not flags or flags['user'] != user.pk or flags['superuser'] != user.is_superuser or flags['version'] != version:
+			flags = {'user': user.pk, 'superuser': user.is_superuser, 'version': version, 'values': {}}
+		if name not in flags['values']:
+			flags['values'][name] = compute(user)
+			request.session[PERMISSION_FLAGS_SESSION_KEY] = flags
+		return flags['values'][name]
+
+	return SimpleLazyObject(get_flag)
+
+
 def can_create_informationpage(request):
-	return {'CAN_CREATE_INFORMATIONPAGE': request.user.has_perm("information_pages.add_informationdocument")}
+	return {'CAN_CREATE_INFORMATIONPAGE': permission_flag(request, 'create_informationpage', lambda user: user.has_perm("information_pages.add_informationdocument"))}
 
 
 def can_create_minutes(request):
-	return {'CAN_CREATE_MINUTES': request.user.groups.filter(permissions__codename="add_minutesdocument")}
+	def minutes_groups(user):
+		return list(user.groups.filter(permissions__codename="add_minutesdocument").values_list('id', flat=True))
+
+	# the ids of the groups are kept in the session
+	return {'CAN_CREATE_MINUTES': SimpleLazyObject(lambda: [get_group(id=group_id) for group_id in permission_flag(request, 'create_minutes', minutes_groups)])}
 
 
 def can_create_poll(request):
-	return {'CAN_CREATE_POLL': request.user.has_perm("polls.add_poll")}
+	return {'CAN_CREATE_POLL': permission_flag(request, 'create_poll', lambda user: user.has_perm("polls.add_poll"))}
 
 
 def can_change_menu_items(request):
-	return {'CAN_CHANGE_MENU_ITEMS': request.user.is_superuser or len(get_objects_for_user(request.user, MenuItem.CHANGE_CHILDREN_PERMISSION_NAME, klass=MenuItem)) > 0}
+	return {'CAN_CHANGE_MENU_ITEMS': permission_flag(request, 'change_menu_items', models.MenuItem.can_change_any_item)}
 
 
 def image_paths(request):
@@ -11,6 +11,7 @@ from guardian.shortcuts import get_objects_for_user, get_perms
 
 from _1327.documents.forms import PermissionBaseForm
 from _1327.main.models import AbbreviationExplanation
+from _1327.user_management.registry import get_group
 from .models import MenuItem
 
 
@@ -75,7 +76,7 @@ class MenuItemCreationForm(MenuItemForm):
 		for item in items_with_perms:
 			items.append(item.pk)
 			items.extend([child.pk for child in item.children.all()])
-		staff = Group.objects.get(name=settings.STAFF_GROUP_NAME)
+		staff = get_group(settings.STAFF_GROUP_NAME)
 		self.fields['group'].queryset = self.user_groups
 		if staff in self.user_groups and not self.fields['group'].initial:
 			self.fields['group'].initial = staff
@@ -103,7 +104,7 @@ class MenuItemCreationAdminForm(MenuItemAdminForm):
 		super().__init__(*args, **kwargs)
 		self.user_groups = user.groups.all()
 		self.fields['parent'].queryset = MenuItem.objects.filter(Q(menu_type=MenuItem.MAIN_MENU) & (Q(parent=None) | Q(parent__parent=None)) & Q(link=None) & Q(document=None)).order_by('menu_type', 'title_de')
-		staff = Group.objects.get(name=settings.STAFF_GROUP_NAME)
+		staff = get_group(settings.STAFF_GROUP_NAME)
 		self.fields['group'].queryset = self.user_groups
 		if staff in self.user_groups and not self.fields['group'].initial:
 			self.fields['group'].initial = staff
@@ -0,0 +1,47 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from _1327.main.utils import create_markdown_engine, markdown_engine
+
+
+SAMPLE_TEXT = """# Heading
+
+Some text with a [link](https://example.com), *emphasis* and a table:
+
+| Name | Value |
+|------|-------|
+| a    | 1     |
+
+|start|(18:00)
+
+[3|1|0]
+"""
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Compares constructing a markdown engine per render with reusing pooled engines'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--iterations', type=int, default=500)
+
+	def handle(self, *args, **options):
+		iterations = options['iterations']
+
+		def acquire_pooled_engine():
+			with markdown_engine():
+				pass
+
+		def render_with_pooled_engine():
+			with markdown_engine() as md:
+				md.convert(SAMPLE_TEXT)
+
+		results = [
+			('construct engine', timeit.timeit(create_markdown_engine, number=iterations)),
+			('acquire pooled engine', timeit.timeit(acquire_pooled_engine, number=iterations)),
+			('render with new engine', timeit.timeit(lambda: create_markdown_engine().convert(SAMPLE_TEXT), number=iterations)),
+			('render with pooled engine', timeit.timeit(render_with_pooled_engine, number=iterations)),
+		]
+		for name, seconds in results:
+			self.stdout.write('{:<28}{:>10.3f} ms'.format(name, seconds * 1000 / iterations))
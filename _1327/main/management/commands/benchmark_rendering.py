@@ -0,0 +1,145 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+import markdown
+
+from _1327.information_pages.models import InformationDocument
+from _1327.main.models import AbbreviationExplanation
+from _1327.main.utils import in_memory_database, markdown_extensions, render_markdown
+from _1327.polls.models import Poll
+
+
+MINUTES_ITEM = """## TOP {number}: Report of working group {number}
+
+|enter|(18:{minute:02d})(Participant {number})(Hangout)
+The FSR discussed the proposal of the last meeting and its consequences for the budget of the next semester.
+The working group presented its results, the discussion is summarized below.
+
+* first point of the discussion
+* second point of the discussion
+
+The proposal is accepted [7|1|2]
+|quorum|({number_present}/9)
+|leave|(19:{minute:02d})(Participant {number})
+"""
+
+TABLE_HEADER = """| Position | Description | Amount | Responsible |
+|----------|-------------|-------:|-------------|
+"""
+
+ABBREVIATIONS = {
+	'FSR': 'Fachschaftsrat',
+	'TOP': 'Tagesordnungspunkt',
+	'HPI': 'Hasso-Plattner-Institut',
+}
+
+
+def minutes_corpus(size, **kwargs):
+	items = [MINUTES_ITEM.format(number=number, minute=number % 60, number_present=number % 9 + 1) for number in range(size * 10)]
+	return "|start|(18:00)\n\n" + "\n".join(items) + "\n|break|(19:00)(19:15)\n\n|end|(21:00)\n"
+
+
+def links_corpus(size, document_ids, poll_ids):
+	lines = [
+		"* [Document {0}](document:{1}), [Poll {0}](poll:{2}) and [an external page](https://example.com/{0})".format(
+			index,
+			document_ids[index % len(document_ids)],
+			poll_ids[index % len(poll_ids)],
+		)
+		for index in range(size * 20)
+	]
+	return "## Menu\n\n" + "\n".join(lines) + "\n\n* [A deleted document](document:0)\n"
+
+
+def tables_corpus(size, **kwargs):
+	tables = []
+	for table in range(size * 2):
+		rows = ["| {0}.{1} | Position {1} of the budget | {2} | FSR |".format(table, row, row * 10) for row in range(25)]
+		tables.append("## Budget {}\n\n".format(table) + TABLE_HEADER + "\n".join(rows) + "\n")
+	return "\n".join(tables)
+
+
+def images_corpus(size, **kwargs):
+	images = [
+		"![Image {0}](/attachments/download?hash_value=hash{0}&embed=True ={1}x{2})\n\nThe picture shows the results of the meeting.\n".format(
+			index,
+			100 + index,
+			'' if index % 2 else 200 + index,
+		)
+		for index in range(size * 20)
+	]
+	return "\n".join(images)
+
+
+CORPORA = {
+	'minutes': minutes_corpus,
+	'links': links_corpus,
+	'tables': tables_corpus,
+	'images': images_corpus,
+}
+
+
+def create_engine(extension_name=None):
+	if extension_name is None:
+		return markdown.Markdown()
+	return markdown.Markdown(extensions=[markdown_extensions()[extension_name]])
+
+
+def time_render(render, text, iterations):
+	return min(timeit.repeat(lambda: render(text), repeat=3, number=iterations)) / iterations
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Measures the rendering of generated markdown texts, for each extension on its own and for the whole pipeline'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--iterations', type=int, default=20)
+		parser.add_argument('--size', type=int, default=5, help='Scales the length of the generated texts')
+		parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+	def handle(self, *args, **options):
+		with in_memory_database():
+			results = self.run_benchmarks(options['iterations'], options['size'])
+
+		if options['json']:
+			self.stdout.write(json.dumps({'iterations': options['iterations'], 'size': options['size'], 'results': results}, indent=2))
+			return
+		for result in results:
+			self.stdout.write('{corpus:<10}{variant:<18}{characters:>10} chars{milliseconds:>12.3f} ms'.format(**result))
+
+	def run_benchmarks(self, iterations, size):
+		for abbreviation, explanation in ABBREVIATIONS.items():
+			AbbreviationExplanation.objects.create(abbreviation=abbreviation, explanation=explanation)
+		document_ids = [
+			InformationDocument.objects.create(title_en='Document {}'.format(index), title_de='Dokument {}'.format(index), url_title='document-{}'.format(index)).id
+			for index in range(10)
+		]
+		poll_ids = [
+			Poll.objects.create(title_en='Poll {}'.format(index), title_de='Umfrage {}'.format(index), url_title='poll-{}'.format(index)).id
+			for index in range(10)
+		]
+
+		variants = [('baseline', None)] + [(name, name) for name in markdown_extensions()]
+		results = []
+		for corpus_name, corpus in CORPORA.items():
+			text = corpus(size, document_ids=document_ids, poll_ids=poll_ids)
+			for variant, extension_name in variants:
+				md = create_engine(extension_name)
+
+				def render(text):
+					md.convert(text)
+					md.reset()
+
+				results.append(self.result(corpus_name, variant, text, time_render(render, text, iterations)))
+			results.append(self.result(corpus_name, 'full pipeline', text, time_render(render_markdown, text, iterations)))
+		return results
+
+	def result(self, corpus, variant, text, seconds):
+		return {
+			'corpus': corpus,
+			'variant': variant,
+			'characters': len(text),
+			'milliseconds': seconds * 1000,
+		}
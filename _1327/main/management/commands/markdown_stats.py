@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from _1327.main.utils import markdown_stats
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Shows the markdown cache and pool stats of all processes, e.g. to size the markdown cache'
+
+	def handle(self, *args, **options):
+		stats = markdown_stats()
+		lookups = stats['hits'] + stats['misses']
+		rows = [
+			('cache hits', stats['hits']),
+			('cache misses', stats['misses']),
+			('cache hit ratio', '{:.1%}'.format(stats['hits'] / lookups) if lookups else '-'),
+			('pool renders', stats['renders']),
+			('pool timeouts', stats['timeouts']),
+		]
+		for name, value in rows:
+			self.stdout.write('{:<28}{:>12}'.format(name, value))
@@ -0,0 +1,25 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from _1327.main.channel_layers import ChannelBroker
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Runs the broker of a BrokerChannelLayer, delivering messages between the asgi processes of this machine'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--layer', default='default', help='The alias of the channel layer in CHANNEL_LAYERS')
+
+	def handle(self, *args, **options):
+		layer = settings.CHANNEL_LAYERS.get(options['layer'], {})
+		if layer.get('BACKEND') != '_1327.main.channel_layers.BrokerChannelLayer':
+			raise CommandError('The channel layer {} is not a BrokerChannelLayer'.format(options['layer']))
+
+		# the broker uses the configuration of the layer, so the capacities and expiries apply to all processes
+		config = dict(layer.get('CONFIG', {}))
+		broker = ChannelBroker(config.pop('path'), **config)
+		self.stdout.write('Channel broker listening on {}'.format(broker.path))
+		asyncio.run(broker.serve())
@@ -0,0 +1,85 @@
+import re
+
+from markdown import Extension
+from markdown.extensions.abbr import ABBR_REF_RE
+from markdown.inlinepatterns import InlineProcessor
+from markdown.preprocessors import Preprocessor
+from markdown.util import AtomicString, etree
+
+
+NEVER_MATCHING_RE = re.compile(r'(?!)')
+
+
+class AbbreviationMatcher:
+	"""
+		matches all given abbreviations with one combined regular expression instead of one pattern per abbreviation
+	"""
+	def __init__(self, explanations):
+		self.explanations = {abbreviation.strip(): explanation.strip() for abbreviation, explanation in explanations.items() if abbreviation.strip()}
+		if self.explanations:
+			# longer abbreviations first, so that an abbreviation is not shadowed by one of its prefixes
+			alternatives = sorted(self.explanations, key=lambda abbreviation: (-len(abbreviation), abbreviation))
+			self.regex = re.compile(r'(?P<abbr>\b(?:{})\b)'.format('|'.join(re.escape(abbreviation) for abbreviation in alternatives)), re.UNICODE)
+		else:
+			self.regex = NEVER_MATCHING_RE
+
+	def extended_by(self, explanations):
+		if not explanations:
+			return self
+		# the global explanations win over explanations defined in a text
+		return AbbreviationMatcher({**explanations, **self.explanations})
+
+
+class AbbreviationExtension(Extension):
+	def __init__(self, get_matcher, **kwargs):
+		super().__init__(**kwargs)
+		self.get_matcher = get_matcher
+		self.reset()
+
+	def extendMarkdown(self, md):
+		md.registerExtension(self)
+		md.preprocessors.register(AbbreviationPreprocessor(md, self), 'abbr', 12)
+		md.inlinePatterns.register(AbbreviationInlineProcessor(self), 'abbr', 2)
+
+	def reset(self):
+		self.matcher = None
+
+
+class AbbreviationPreprocessor(Preprocessor):
+	"""
+		removes the abbreviation definitions from the text and prepares the matcher for this text
+	"""
+	def __init__(self, md, extension):
+		super().__init__(md)
+		self.extension = extension
+
+	def run(self, lines):
+		explanations = {}
+		new_lines = []
+		for line in lines:
+			match = ABBR_REF_RE.match(line)
+			if match:
+				explanations[match.group('abbr')] = match.group('title')
+				# keep the line to preserve the indices of stashed raw html
+				new_lines.append('')
+			else:
+				new_lines.append(line)
+		self.extension.matcher = self.extension.get_matcher().extended_by(explanations)
+		return new_lines
+
+
+class AbbreviationInlineProcessor(InlineProcessor):
+	def __init__(self, extension):
+		super().__init__(NEVER_MATCHING_RE.pattern)
+		self.extension = extension
+
+	def getCompiledRegExp(self):
+		if self.extension.matcher is None:
+			return NEVER_MATCHING_RE
+		return self.extension.matcher.regex
+
+	def handleMatch(self, m, data):
+		abbr = etree.Element('abbr')
+		abbr.text = AtomicString(m.group('abbr'))
+		abbr.set('title', self.extension.matcher.explanations[m.group('abbr')])
+		return abbr, m.start(0), m.end(0)
@@ -0,0 +1,70 @@
+import logging
+import multiprocessing
+import threading
+
+import django
+from django.conf import settings
+from django.utils import translation
+
+from _1327.main.markdown_abbreviation_extension import AbbreviationMatcher
+from _1327.main.utils import abbreviation_matcher, count_markdown_stat, create_markdown_engine
+
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_POOL_STATS = {'renders': 0, 'timeouts': 0}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_arguments(text):
+	"""
+		returns the arguments of render_in_worker for the text in the current language,
+		everything read from the database is resolved by the calling process
+	"""
+	from _1327.documents.markdown_internal_link_extension import InternalLinksMarkdownExtension
+	return text, translation.get_language(), abbreviation_matcher().explanations, InternalLinksMarkdownExtension.resolve_urls(text)
+
+
+def render_in_worker(text, language, explanations, link_urls):
+	matcher = AbbreviationMatcher(explanations)
+	with translation.override(language):
+		md = create_markdown_engine(lambda: matcher, link_urls)
+		return md.convert(text), md.toc
+
+
+def shutdown_markdown_pool():
+	global _pool
+	with _pool_lock:
+		if _pool is not None:
+			_pool.terminate()
+			_pool = None
+
+
+def render_markdown_in_pool(text):
+	"""
+		renders the text in a worker process and returns None if that takes longer than MARKDOWN_RENDER_TIMEOUT
+	"""
+	global _pool
+
+	arguments = render_arguments(text)
+	with _pool_lock:
+		if _pool is None:
+			_pool = multiprocessing.get_context('spawn').Pool(settings.MARKDOWN_PROCESS_POOL_SIZE, initializer=django.setup)
+		pool = _pool
+		result = pool.apply_async(render_in_worker, arguments)
+
+	count_markdown_stat(MARKDOWN_POOL_STATS, 'renders')
+	try:
+		return result.get(settings.MARKDOWN_RENDER_TIMEOUT)
+	except multiprocessing.TimeoutError:
+		count_markdown_stat(MARKDOWN_POOL_STATS, 'timeouts')
+		logger.warning('Rendering a markdown text of {} characters took longer than {} seconds.'.format(len(text), settings.MARKDOWN_RENDER_TIMEOUT))
+		with _pool_lock:
+			# a running render can not be cancelled, the workers are replaced instead.
+			# other renders waiting for the old workers run into their time limit as well.
+			if _pool is pool:
+				_pool.terminate()
+				_pool = None
+		return None
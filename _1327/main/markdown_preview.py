@@ -0,0 +1,305 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import difflib
+from html.parser import HTMLParser
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from markdown.extensions.abbr import ABBR_REF_RE
+from markdown.extensions.toc import nest_toc_tokens, slugify, unique
+from markdown.preprocessors import ReferencePreprocessor
+from markdown.util import STX
+
+from _1327.main.utils import convert_markdown, markdown_cache, markdown_cache_key, markdown_engine
+
+
+# blocks starting like this may continue the list, blockquote or code block before them
+CONTINUATION_RE = re.compile(r'^(?:\s|[*+-][ \t]|\d+\.[ \t]|>)')
+TOC_MARKER = '[TOC]'
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+PREVIEW_BLOCK_STATS = {'rendered': 0, 'reused': 0}
+PREVIEW_COALESCER_STATS = {'rendered': 0, 'discarded': 0}
+
+
+def split_blocks(text):
+	"""
+		splits a markdown text into top level blocks that render the same on their own as within the text.
+		definitions of references and abbreviations apply to the whole text and are returned separately.
+	"""
+	lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+	definitions = []
+	blocks = []
+	block = []
+	after_blank_line = False
+	index = 0
+	while index < len(lines):
+		line = lines[index]
+		index += 1
+		if ABBR_REF_RE.match(line):
+			definitions.append(line)
+			line = ''
+		else:
+			match = ReferencePreprocessor.RE.match(line)
+			if match:
+				definitions.append(line)
+				line = ''
+				# the title of a reference may be given on the next line
+				if not (match.group(5) or match.group(6) or match.group(7)) and index < len(lines) and ReferencePreprocessor.TITLE_RE.match(lines[index]):
+					definitions.append(lines[index])
+					index += 1
+
+		if not line.strip():
+			after_blank_line = True
+			continue
+		if block and after_blank_line and not CONTINUATION_RE.match(line):
+			blocks.append('\n'.join(block))
+			block = []
+		elif block and after_blank_line:
+			block.append('')
+		block.append(line)
+		after_blank_line = False
+	if block:
+		blocks.append('\n'.join(block))
+	return definitions, blocks
+
+
+def flatten_toc_tokens(toc_tokens):
+	for token in toc_tokens:
+		yield token
+		yield from flatten_toc_tokens(token['children'])
+
+
+def render_block(text):
+	with markdown_engine() as md:
+		html = md.convert(text)
+		toc_tokens = [(token['level'], token['id'], token['name']) for token in flatten_toc_tokens(md.toc_tokens)]
+	# the ids of headings containing stashed html can not be derived from their names
+	if any(STX in name for __, __, name in toc_tokens):
+		return None
+	return html, toc_tokens
+
+
+def assemble_blocks(rendered_blocks):
+	used_ids = set()
+	parts = []
+	toc_tokens = []
+	for html, block_toc_tokens in rendered_blocks:
+		position = 0
+		for level, block_id, name in block_toc_tokens:
+			# heading ids have to be unique in the whole text, not only in their block
+			heading_id = unique(slugify(name, '-'), used_ids)
+			tag = '<h{} id="{}">'.format(level, block_id)
+			position = html.index(tag, position)
+			if heading_id != block_id:
+				html = html[:position] + '<h{} id="{}">'.format(level, heading_id) + html[position + len(tag):]
+			position += 1
+			toc_tokens.append({'level': level, 'id': heading_id, 'name': name})
+		if html:
+			parts.append(html)
+
+	with markdown_engine() as md:
+		toc = md.serializer(md.treeprocessors['toc'].build_toc_div(nest_toc_tokens(toc_tokens)))
+		for postprocessor in md.postprocessors:
+			toc = postprocessor.run(toc)
+	return '\n'.join(parts), toc
+
+
+def render_preview(session, text):
+	"""
+		renders a text that is edited in the given preview session.
+		only blocks that changed since the last render of the session are rendered again.
+	"""
+	# large texts are rendered in the worker pool with a time limit, the blocks of smaller texts are rendered in process
+	if not text.strip() or TOC_MARKER in text or len(text) > settings.MARKDOWN_PROCESS_POOL_THRESHOLD:
+		return convert_markdown(text)
+
+	definitions, blocks = split_blocks(text)
+	prefix = '\n'.join(definitions) + '\n\n' if definitions else ''
+
+	key = 'markdown_preview_{}'.format(session)
+	cached_blocks = markdown_cache().get(key) or {}
+	session_blocks = {}
+	rendered_blocks = []
+	for block in blocks:
+		block_text = prefix + block
+		block_key = markdown_cache_key(block_text)
+		rendered = session_blocks.get(block_key) or cached_blocks.get(block_key)
+		if rendered is None:
+			PREVIEW_BLOCK_STATS['rendered'] += 1
+			rendered = render_block(block_text)
+			if rendered is None:
+				return convert_markdown(text)
+		else:
+			PREVIEW_BLOCK_STATS['reused'] += 1
+		session_blocks[block_key] = rendered
+		rendered_blocks.append(rendered)
+
+	# only the blocks of the latest text are kept, so the session does not grow while editing
+	markdown_cache().set(key, session_blocks)
+	return assemble_blocks(rendered_blocks)
+
+
+class HtmlBlockParser(HTMLParser):
+	"""
+		finds the offsets at which the top level elements of an html text start and end
+	"""
+	def __init__(self, html):
+		super().__init__(convert_charrefs=False)
+		self.html = html
+		self.line_offsets = [0]
+		for line in html.split('\n'):
+			self.line_offsets.append(self.line_offsets[-1] + len(line) + 1)
+		self.depth = 0
+		self.boundaries = [0]
+
+	def position(self):
+		line, column = self.getpos()
+		return self.line_offsets[line - 1] + column
+
+	def handle_starttag(self, tag, attrs):
+		if self.depth == 0:
+			self.boundaries.append(self.position())
+		if tag not in VOID_ELEMENTS:
+			self.depth += 1
+		elif self.depth == 0:
+			self.boundaries.append(self.position() + len(self.get_starttag_text()))
+
+	def handle_startendtag(self, tag, attrs):
+		if self.depth == 0:
+			self.boundaries.append(self.position())
+			self.boundaries.append(self.position() + len(self.get_starttag_text()))
+
+	def handle_endtag(self, tag):
+		# end tags without start tag are ignored like browsers do
+		if self.depth == 0:
+			return
+		self.depth -= 1
+		if self.depth == 0:
+			self.boundaries.append(self.html.index('>', self.position()) + 1)
+
+
+def split_html_blocks(html):
+	"""
+		splits an html text into its top level elements and the texts between them, joining the blocks gives the text again
+	"""
+	parser = HtmlBlockParser(html)
+	parser.feed(html)
+	parser.close()
+	boundaries = parser.boundaries + [len(html)]
+	blocks = []
+	for start, end in zip(boundaries, boundaries[1:]):
+		block = html[start:end]
+		# whitespace between the elements belongs to the element before it
+		if blocks and not block.strip():
+			blocks[-1] += block
+		elif block:
+			blocks.append(block)
+	return blocks
+
+
+def diff_blocks(old_blocks, new_blocks):
+	"""
+		returns the changes turning the old blocks into the new ones as (start, end, blocks) replacing old_blocks[start:end]
+	"""
+	matcher = difflib.SequenceMatcher(None, old_blocks, new_blocks, autojunk=False)
+	return [
+		(old_start, old_end, new_blocks[new_start:new_end])
+		for operation, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+		if operation != 'equal'
+	]
+
+
+class PreviewGroup:
+	def __init__(self):
+		self.text = None
+		self.version = 0
+		self.futures = []
+		self.scheduled = False
+		self.last_render = 0
+
+
+class PreviewCoalescer:
+	"""
+		renders the texts sent to preview groups in a pool of PREVIEW_RENDER_THREADS threads, only the latest text of a group is rendered.
+		a group is rendered at most once per PREVIEW_RENDER_INTERVAL and never by two threads at once,
+		renders that are not due yet are started by a timer. submitting a text never waits for a render.
+	"""
+	def __init__(self, render, send):
+		self.render = render
+		self.send = send
+		self.executor = ThreadPoolExecutor(max_workers=settings.PREVIEW_RENDER_THREADS, thread_name_prefix='preview')
+		self.lock = threading.Lock()
+		self.groups = {}
+
+	def submit(self, group_name, text):
+		"""
+			returns a future resolving to the html of this text or of a newer text sent to the group meanwhile
+		"""
+		future = Future()
+		with self.lock:
+			self.remove_idle_groups()
+			group = self.groups.setdefault(group_name, PreviewGroup())
+			group.text = text
+			group.version += 1
+			group.futures.append((group.version, future))
+			if not group.scheduled:
+				group.scheduled = True
+				self.schedule(group_name, group)
+		return future
+
+	def schedule(self, group_name, group):
+		# called with the lock held
+		delay = group.last_render + settings.PREVIEW_RENDER_INTERVAL - time.monotonic()
+		if delay > 0:
+			timer = threading.Timer(delay, self.executor.submit, (self.run, group_name, group))
+			timer.daemon = True
+			timer.start()
+		else:
+			self.executor.submit(self.run, group_name, group)
+
+	def run(self, group_name, group):
+		with self.lock:
+			text, version = group.text, group.version
+		try:
+			html = self.render(group_name, text)
+			PREVIEW_COALESCER_STATS['rendered'] += 1
+			with self.lock:
+				group.last_render = time.monotonic()
+				outdated = group.version != version
+			if outdated:
+				# the text changed while rendering, only the result of the newer text is sent
+				PREVIEW_COALESCER_STATS['discarded'] += 1
+			else:
+				self.send(group_name, html)
+		except Exception as e:
+			with self.lock:
+				futures, group.futures = group.futures, []
+				group.scheduled = False
+			for __, future in futures:
+				future.set_exception(e)
+			return
+		finally:
+			# the connections of the render threads are not closed by any request
+			close_old_connections()
+
+		with self.lock:
+			futures = [] if outdated else [future for future_version, future in group.futures if future_version <= version]
+			group.futures = [(future_version, future) for future_version, future in group.futures if future_version > version or outdated]
+			if group.version == version:
+				group.scheduled = False
+			else:
+				self.schedule(group_name, group)
+		for future in futures:
+			future.set_result(html)
+
+	def remove_idle_groups(self):
+		now = time.monotonic()
+		idle_groups = [
+			group_name for group_name, group in self.groups.items()
+			if not group.scheduled and group.last_render + settings.PREVIEW_RENDER_INTERVAL < now
+		]
+		for group_name in idle_groups:
+			del self.groups[group_name]
@@ -1,14 +1,21 @@
 from collections import namedtuple
 
-from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import Group
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
 from guardian.shortcuts import assign_perm
 
 from _1327.documents.models import Document
 from _1327.main.tools import translate
+from _1327.main.utils import invalidate_abbreviations, invalidate_menus, invalidate_permission_flags
+from _1327.user_management.models import UserProfile
+from _1327.user_management.registry import permission_names
+from _1327.user_management.shortcuts import get_permitted_objects
 
 MENUITEM_VIEW_PERMISSION_NAME = 'view_menuitem'
 MENUITEM_EDIT_PERMISSION_NAME = 'change_menuitem'
@@ -65,18 +72,15 @@ class MenuItem(models.Model):
 
 	@property
 	def view_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.view_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).view
 
 	@property
 	def change_children_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.changechildren_{model}".format(app=content_type.app_label, model=content_type.model)
+		return "{app}.{codename}".format(app=self._meta.app_label, codename=self.CHANGE_CHILDREN_PERMISSION_NAME)
 
 	@property
 	def edit_permission_name(self):
-		content_type = ContentType.objects.get_for_model(self)
-		return "{app}.change_{model}".format(app=content_type.app_label, model=content_type.model)
+		return permission_names(type(self)).change
 
 	def can_view(self, user):
 		permission_name = self.view_permission_name
@@ -103,9 +107,16 @@ class MenuItem(models.Model):
 		assign_perm(self.view_permission_name, user_or_group, self)
 		assign_perm(self.change_children_permission_name, user_or_group, self)
 
+	@classmethod
+	def can_change_any_item(cls, user):
+		permission_name = "{app}.{codename}".format(app=cls._meta.app_label, codename=cls.CHANGE_CHILDREN_PERMISSION_NAME)
+		if user.is_superuser or user.has_perm(permission_name):
+			return True
+		return get_permitted_objects(cls.objects.all(), user, permission_name).exists()
+
 	@classmethod
 	def used_permissions(cls):
-		app_label = ContentType.objects.get_for_model(cls).app_label
+		app_label = cls._meta.app_label
 		return (
 			NamedPermission(name="{app}.{codename}".format(app=app_label, codename=cls.VIEW_PERMISSION_NAME), description=_('view')),
 			NamedPermission(name="{app}.{codename}".format(app=app_label, codename=cls.CHANGE_CHILDREN_PERMISSION_NAME), description=_('change children')),
@@ -113,6 +124,14 @@ class MenuItem(models.Model):
 		)
 
 
+class MenuItemUserObjectPermission(UserObjectPermissionBase):
+	content_object = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+
+
+class MenuItemGroupObjectPermission(GroupObjectPermissionBase):
+	content_object = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+
+
 class AbbreviationExplanation(models.Model):
 
 	abbreviation = models.CharField(max_length=255, unique=True, verbose_name=_("Abbreviation"))
@@ -120,3 +139,30 @@ class AbbreviationExplanation(models.Model):
 
 	def __str__(self):
 		return '*[' + self.abbreviation + ']: ' + self.explanation
+
+
+@receiver(pre_save, sender=AbbreviationExplanation)
+def remember_previous_abbreviation(sender, instance, **kwargs):
+	instance._previous_abbreviation = AbbreviationExplanation.objects.filter(pk=instance.pk).values_list('abbreviation', flat=True).first()
+
+
+@receiver(post_save, sender=AbbreviationExplanation)
+@receiver(post_delete, sender=AbbreviationExplanation)
+def invalidate_rendered_abbreviations(sender, instance, **kwargs):
+	from _1327.documents.utils import render_documents_containing
+	invalidate_abbreviations()
+	abbreviations = {(abbreviation or '').strip() for abbreviation in (instance.abbreviation, getattr(instance, '_previous_abbreviation', None))}
+	render_documents_containing(*(abbreviation for abbreviation in abbreviations if abbreviation))
+
+
+@receiver([post_save, post_delete, m2m_changed], sender=MenuItem)
+@receiver([post_save, post_delete, m2m_changed], sender=MenuItemUserObjectPermission)
+@receiver([post_save, post_delete, m2m_changed], sender=MenuItemGroupObjectPermission)
+@receiver([post_save, post_delete, m2m_changed], sender=Group.permissions.through)
+@receiver([post_save, post_delete, m2m_changed], sender=UserProfile.groups.through)
+@receiver([post_save, post_delete, m2m_changed], sender=UserProfile.user_permissions.through)
+def invalidate_cached_menus(sender, **kwargs):
+	# the cached menus and permission flags depend on the menu items, their permissions and the global permissions and groups of users.
+	# the menus contain the urls of documents as well, see documents.signals
+	invalidate_menus()
+	invalidate_permission_flags()
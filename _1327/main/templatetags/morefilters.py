@@ -11,16 +11,6 @@ def percentage(value):
 	return floatformat(value, 1) + '%'
 
 
-@register.filter(name='can_edit_menu_item')
-def can_edit_menu_item(menu_item, user):
-	return menu_item.can_edit(user)
-
-
-@register.filter(name='can_delete_menu_item')
-def can_delete_menu_item(menu_item, user):
-	return menu_item.can_delete(user)
-
-
 @register.filter(name='can_view_menu_item')
 def can_view_menu_item(menu_item, user):
 	return menu_item.can_view(user)
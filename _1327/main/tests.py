@@ -1,14 +1,26 @@
+import asyncio
 import datetime
 from io import StringIO
 import json
+import os
 import re
+import tempfile
+import threading
+import time
 
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
+from django.contrib.sessions.middleware import SessionMiddleware
 from django.core import mail, management
+from django.core.cache import caches
 from django.core.management import call_command
+from django.db import connection
+from django.db.models.deletion import Collector
 from django.test import override_settings, RequestFactory, TestCase
-from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.utils import translation
 from django_webtest import WebTest
 from guardian.shortcuts import assign_perm, remove_perm
@@ -16,11 +28,20 @@ from guardian.utils import get_anonymous_user
 from model_bakery import baker
 
 from _1327.information_pages.models import InformationDocument
+from _1327.main.cache_versions import shared_cache
+from _1327.main.channel_layers import BrokerChannelLayer, ChannelBroker, LocalChannelLayer
+from _1327.main.markdown_abbreviation_extension import AbbreviationMatcher
+from _1327.main.markdown_pool import MARKDOWN_POOL_STATS, shutdown_markdown_pool
+from _1327.main.markdown_preview import diff_blocks, PREVIEW_BLOCK_STATS, PREVIEW_COALESCER_STATS, PreviewCoalescer, render_preview, split_blocks, \
+	split_html_blocks
+from _1327.main.models import AbbreviationExplanation
 from _1327.main.tools import translate
-from _1327.main.utils import alternative_emails, find_root_menu_items
+from _1327.main.utils import alternative_emails, convert_markdown, find_root_menu_items, invalidate_abbreviations, markdown_cache, \
+	markdown_cache_key, MARKDOWN_CACHE_STATS, markdown_engine, markdown_stats, render_markdown, save_menu_item_order
 from _1327.minutes.models import MinutesDocument
+from _1327.shortlinks.models import Shortlink
 from _1327.user_management.models import UserProfile
-from .context_processors import mark_selected
+from .context_processors import can_change_menu_items, can_create_minutes, can_create_poll, mark_selected, MenuEntry, visible_menus
 from .models import MenuItem
 
 
@@ -32,10 +53,135 @@ class TestMenuProcessor(TestCase):
 
 		menu_item = baker.make(MenuItem)
 		try:
-			mark_selected(request, menu_item)
+			mark_selected(request, MenuEntry(menu_item))
 		except AttributeError:
 			self.fail("mark_selected() raises an AttributeError")
 
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'menu-tests'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_menus_are_cached(self):
+		caches['default'].clear()
+		user = baker.make(UserProfile)
+		document = baker.make(InformationDocument)
+		root_item = baker.make(MenuItem, title_en="root item", document=document)
+		sub_item = baker.make(MenuItem, parent=root_item, title_en="sub item", link="index")
+		hidden_item = baker.make(MenuItem, parent=root_item, title_en="hidden item")
+		footer_item = baker.make(MenuItem, menu_type=MenuItem.FOOTER, title_en="footer item")
+		for item in (root_item, sub_item, footer_item):
+			assign_perm(item.view_permission_name, user, item)
+
+		main_menu, footer = visible_menus(user)
+		self.assertEqual([item.id for item in main_menu], [root_item.id])
+		self.assertEqual([item.id for item in main_menu[0].submenu], [sub_item.id])
+		self.assertEqual([item.id for item in footer], [footer_item.id])
+		self.assertEqual(main_menu[0].url, document.get_view_url())
+		# only the permissions of the user are read
+		with self.assertNumQueries(3):
+			visible_menus(user)
+
+		assign_perm(hidden_item.view_permission_name, user, hidden_item)
+		main_menu, __ = visible_menus(user)
+		self.assertEqual([item.id for item in main_menu[0].submenu], [sub_item.id, hidden_item.id])
+
+		request = RequestFactory().get(reverse('index'))
+		request.resolver_match = resolve(reverse('index'))
+		mark_selected(request, main_menu[0])
+		self.assertTrue(main_menu[0].selected)
+		self.assertTrue(main_menu[0].submenu[0].selected)
+		self.assertFalse(visible_menus(user)[0][0].selected)
+
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'menu-tests'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_users_with_the_same_permissions_share_cached_menus(self):
+		caches['default'].clear()
+		group = baker.make(Group)
+		users = baker.make(UserProfile, _quantity=3)
+		for user in users:
+			user.groups.add(group)
+		menu_item = baker.make(MenuItem)
+		assign_perm(menu_item.view_permission_name, group, menu_item)
+		other_item = baker.make(MenuItem)
+		assign_perm(other_item.view_permission_name, users[2], other_item)
+
+		self.assertEqual([item.id for item in visible_menus(users[0])[0]], [menu_item.id])
+		with self.assertNumQueries(3):
+			self.assertEqual([item.id for item in visible_menus(users[1])[0]], [menu_item.id])
+		self.assertEqual([item.id for item in visible_menus(users[2])[0]], [menu_item.id, other_item.id])
+
+	def test_menu_receivers_allow_fast_deletes(self):
+		# receivers of post_delete without sender would prevent fast deletes of all models
+		self.assertTrue(Collector(using='default').can_fast_delete(Shortlink.objects.all()))
+
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'permission-flag-tests'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_permission_flags(self):
+		caches['default'].clear()
+		user = baker.make(UserProfile)
+		group = baker.make(Group)
+		user.groups.add(group)
+		menu_item = baker.make(MenuItem)
+
+		session_request = RequestFactory().get(reverse('index'))
+		SessionMiddleware().process_request(session_request)
+
+		def get_request():
+			request = RequestFactory().get(reverse('index'))
+			request.session = session_request.session
+			request.user = UserProfile.objects.get(pk=user.pk)
+			return request
+
+		request = get_request()
+
+		with self.assertNumQueries(0):
+			flags = {**can_create_minutes(request), **can_create_poll(request), **can_change_menu_items(request)}
+		self.assertFalse(flags['CAN_CREATE_POLL'])
+		self.assertEqual(list(flags['CAN_CREATE_MINUTES']), [])
+		self.assertFalse(flags['CAN_CHANGE_MENU_ITEMS'])
+
+		# the flags are kept in the session
+		request = get_request()
+		with self.assertNumQueries(0):
+			self.assertFalse(can_change_menu_items(request)['CAN_CHANGE_MENU_ITEMS'])
+			self.assertFalse(can_create_poll(request)['CAN_CREATE_POLL'])
+
+		assign_perm(menu_item.change_children_permission_name, group, menu_item)
+		group.permissions.add(Permission.objects.get(codename='add_poll'))
+		request = get_request()
+		self.assertTrue(can_change_menu_items(request)['CAN_CHANGE_MENU_ITEMS'])
+		self.assertTrue(can_create_poll(request)['CAN_CREATE_POLL'])
+
+	@override_settings(CACHE_VERSION_CHECK_INTERVAL=0, CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_permission_flags_changed_by_other_processes(self):
+		user = baker.make(UserProfile)
+		group = baker.make(Group)
+		user.groups.add(group)
+		request = RequestFactory().get(reverse('index'))
+		SessionMiddleware().process_request(request)
+		request.user = user
+		self.assertFalse(can_create_poll(request)['CAN_CREATE_POLL'])
+
+		# bulk inserts do not send signals, like changes made by other processes
+		Group.permissions.through.objects.bulk_create([Group.permissions.through(group=group, permission=Permission.objects.get(codename='add_poll'))])
+		request.user = UserProfile.objects.get(pk=user.pk)
+		self.assertFalse(can_create_poll(request)['CAN_CREATE_POLL'])
+
+		# the other process changed the version of the flags
+		shared_cache().set('version_permission_flags', 'changed', None)
+		self.assertTrue(can_create_poll(request)['CAN_CREATE_POLL'])
+
 
 class MainPageTests(WebTest):
 
@@ -547,6 +693,63 @@ class MenuItemTests(WebTest):
 		self.assertEqual(MenuItem.objects.filter(parent_id=root_menu_children[0].id).count(), 1)
 		test_root_menu_order(root_menu_items)
 
+	def test_move_footer_item_into_main_menu_under_its_old_parent(self):
+		assign_perm(MenuItem.CHANGE_CHILDREN_PERMISSION_NAME, self.user, self.root_menu_item)
+		footer_item = baker.make(MenuItem, menu_type=MenuItem.FOOTER, parent=self.root_menu_item, order=5)
+		order_data = {
+			'main_menu_items': [
+				{
+					'id': self.root_menu_item.id,
+					'children': [{'id': footer_item.id}, {'id': self.sub_item.id}],
+				},
+			],
+			'footer_items': [],
+		}
+		response = self.app.post(reverse('menu_items_update_order'), params=json.dumps(order_data), user=self.user)
+		self.assertEqual(response.status_code, 200)
+
+		footer_item.refresh_from_db()
+		self.assertEqual((footer_item.menu_type, footer_item.parent_id, footer_item.order), (MenuItem.MAIN_MENU, self.root_menu_item.id, 0))
+		self.assertEqual(MenuItem.objects.get(id=self.sub_item.id).order, 1)
+
+	def test_update_order_queries(self):
+		def order_data():
+			return {
+				'main_menu_items': [{'id': m.id} for m in reversed(MenuItem.objects.filter(menu_type=MenuItem.MAIN_MENU, parent_id=None))],
+				'footer_items': [{'id': m.id} for m in MenuItem.objects.filter(menu_type=MenuItem.FOOTER)],
+			}
+
+		# the number of queries does not depend on the number of menu items
+		with CaptureQueriesContext(connection) as few_items:
+			save_menu_item_order(self.root_user, **order_data())
+		baker.make(MenuItem, parent=None, _quantity=20)
+		with CaptureQueriesContext(connection) as many_items:
+			save_menu_item_order(self.root_user, **order_data())
+		self.assertEqual(len(few_items), len(many_items))
+
+		# nothing is changed if one of the posted items does not exist
+		orders = dict(MenuItem.objects.values_list('id', 'order'))
+		data = order_data()
+		data['main_menu_items'].append({'id': max(orders) + 1})
+		response = self.app.post(reverse('menu_items_update_order'), params=json.dumps(data), user=self.root_user, expect_errors=True)
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(dict(MenuItem.objects.values_list('id', 'order')), orders)
+
+	def test_menu_items_index_queries(self):
+		assign_perm(self.root_menu_item.change_children_permission_name, self.user, self.root_menu_item)
+		baker.make(MenuItem, parent=self.root_menu_item, document=baker.make(InformationDocument))
+		self.app.get(reverse('menu_items_index'), user=self.user)
+
+		with CaptureQueriesContext(connection) as few_items:
+			self.app.get(reverse('menu_items_index'), user=self.user)
+		for __ in range(5):
+			sub_item = baker.make(MenuItem, parent=self.root_menu_item, document=baker.make(InformationDocument))
+			baker.make(MenuItem, parent=sub_item, _quantity=2)
+		with CaptureQueriesContext(connection) as many_items:
+			response = self.app.get(reverse('menu_items_index'), user=self.user)
+		self.assertEqual(len(few_items), len(many_items))
+		self.assertIn(reverse('menu_item_edit', args=[sub_item.id]), response.body.decode('utf-8'))
+
 	def test_only_subitems_with_change_children_permission_are_visible(self):
 		other_sub_item = baker.make(MenuItem, parent=self.root_menu_item)
 		response = self.app.get(reverse('menu_items_index'), user=self.user)
@@ -689,3 +892,481 @@ class TestEmailReplacement(TestCase):
 			list(alternative_emails('name@somewhereelse.org')),
 			[]
 		)
+
+
+@override_settings(CACHES={
+	'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+	'markdown': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'markdown-tests'},
+	'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+})
+class TestMarkdownCache(TestCase):
+
+	def setUp(self):
+		markdown_cache().clear()
+
+	def test_repeated_rendering_is_served_from_cache(self):
+		hits = MARKDOWN_CACHE_STATS['hits']
+		misses = MARKDOWN_CACHE_STATS['misses']
+
+		self.assertEqual(convert_markdown('# Heading'), convert_markdown('# Heading'))
+		self.assertEqual(MARKDOWN_CACHE_STATS['hits'], hits + 1)
+		self.assertEqual(MARKDOWN_CACHE_STATS['misses'], misses + 1)
+
+	@override_settings(MARKDOWN_STATS_REPORT_INTERVAL=1)
+	def test_stats_are_reported_to_shared_cache(self):
+		# reports the counts of earlier tests
+		convert_markdown('first')
+		shared_cache().clear()
+
+		convert_markdown('# Heading')
+		convert_markdown('# Heading')
+		self.assertEqual(markdown_stats(), {'hits': 1, 'misses': 1, 'renders': 0, 'timeouts': 0})
+		output = StringIO()
+		call_command('markdown_stats', stdout=output)
+		self.assertRegex(output.getvalue(), r'cache hit ratio\s+50.0%')
+
+	def test_language_is_part_of_the_key(self):
+		with translation.override('en'):
+			english_key = markdown_cache_key('|quorum|(5/7)')
+		with translation.override('de'):
+			german_key = markdown_cache_key('|quorum|(5/7)')
+		self.assertNotEqual(english_key, german_key)
+
+	def test_abbreviation_change_invalidates_cache(self):
+		text, __ = convert_markdown('The FSR meets')
+		self.assertNotIn('<abbr', text)
+
+		abbreviation = AbbreviationExplanation.objects.create(abbreviation='FSR', explanation='Fachschaftsrat')
+		text, __ = convert_markdown('The FSR meets')
+		self.assertIn('<abbr title="Fachschaftsrat">FSR</abbr>', text)
+
+		abbreviation.delete()
+		text, __ = convert_markdown('The FSR meets')
+		self.assertNotIn('<abbr', text)
+
+	def test_url_change_of_linked_document_invalidates_cache(self):
+		document = baker.make(InformationDocument, url_title='old')
+		link = '[link](document:{})'.format(document.id)
+		text, __ = convert_markdown(link)
+		self.assertIn(reverse(document.get_view_url_name(), args=['old']), text)
+
+		document.url_title = 'new'
+		document.save()
+		text, __ = convert_markdown(link)
+		self.assertIn(reverse(document.get_view_url_name(), args=['new']), text)
+
+		document.delete()
+		text, __ = convert_markdown(link)
+		self.assertIn('[missing link]', text)
+
+	def test_changes_of_other_processes_invalidate_cache(self):
+		misses = MARKDOWN_CACHE_STATS['misses']
+		convert_markdown('The FSR meets')
+		convert_markdown('The FSR meets')
+		self.assertEqual(MARKDOWN_CACHE_STATS['misses'], misses + 1)
+
+		# another process changed the abbreviations, this process notices it after CACHE_VERSION_CHECK_INTERVAL
+		shared_cache().set('version_abbreviations', 'changed', None)
+		with override_settings(CACHE_VERSION_CHECK_INTERVAL=60):
+			convert_markdown('The FSR meets')
+		self.assertEqual(MARKDOWN_CACHE_STATS['misses'], misses + 1)
+		with override_settings(CACHE_VERSION_CHECK_INTERVAL=0):
+			convert_markdown('The FSR meets')
+		self.assertEqual(MARKDOWN_CACHE_STATS['misses'], misses + 2)
+
+
+class TestMarkdownEnginePool(TestCase):
+
+	def test_engine_is_reused(self):
+		with markdown_engine() as md:
+			first_engine = md
+		with markdown_engine() as md:
+			self.assertIs(first_engine, md)
+
+	def test_nested_use_gets_separate_engines(self):
+		with markdown_engine() as outer:
+			with markdown_engine() as inner:
+				self.assertIsNot(outer, inner)
+
+	def test_state_does_not_leak_between_renders(self):
+		text, toc = render_markdown('## Heading\n\nThe ABC\n\n*[ABC]: Alphabet')
+		self.assertIn('<abbr title="Alphabet">ABC</abbr>', text)
+		self.assertIn('Heading', toc)
+
+		text, toc = render_markdown('The ABC')
+		self.assertNotIn('<abbr', text)
+		self.assertNotIn('Heading', toc)
+
+	def test_benchmark_command(self):
+		output = StringIO()
+		call_command('benchmark_markdown', iterations=1, stdout=output)
+		self.assertIn('render with pooled engine', output.getvalue())
+
+	def test_rendering_benchmark_command(self):
+		output = StringIO()
+		call_command('benchmark_rendering', iterations=1, size=1, json=True, stdout=output)
+		results = json.loads(output.getvalue())['results']
+		self.assertEqual({result['corpus'] for result in results}, {'minutes', 'links', 'tables', 'images'})
+		self.assertIn('full pipeline', {result['variant'] for result in results})
+		# the documents for the benchmarks are created in a separate database
+		self.assertFalse(InformationDocument.objects.exists())
+
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_benchmarks_do_not_change_shared_cache(self):
+		shared_cache().clear()
+		shared_cache().set('version_abbreviations', 'configured', None)
+		call_command('benchmark_rendering', iterations=1, size=1, json=True, stdout=StringIO())
+		self.assertEqual(shared_cache().get('version_abbreviations'), 'configured')
+		self.assertIsNone(shared_cache().get('version_links'))
+
+
+class TestAbbreviations(TestCase):
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.abbreviation = AbbreviationExplanation.objects.create(abbreviation='FSR', explanation='Fachschaftsrat')
+
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		# the abbreviations are kept by the process, the rollback of the test database does not reset them
+		invalidate_abbreviations()
+
+	def test_abbreviations_are_loaded_once(self):
+		invalidate_abbreviations()
+		render_markdown('FSR')
+		with self.assertNumQueries(0):
+			text, __ = render_markdown('The FSR meets')
+		self.assertIn('<abbr title="Fachschaftsrat">FSR</abbr>', text)
+
+	def test_changed_abbreviations_are_reloaded(self):
+		render_markdown('FSR')
+		self.abbreviation.explanation = 'Student council'
+		self.abbreviation.save()
+		text, __ = render_markdown('The FSR meets')
+		self.assertIn('<abbr title="Student council">FSR</abbr>', text)
+
+	@override_settings(CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	}, CACHE_VERSION_CHECK_INTERVAL=0)
+	def test_abbreviations_changed_by_other_processes_are_reloaded(self):
+		render_markdown('FSR')
+		# another process changed the abbreviation, this process only sees the new version
+		AbbreviationExplanation.objects.filter(pk=self.abbreviation.pk).update(explanation='Student council')
+		shared_cache().set('version_abbreviations', 'changed', None)
+		text, __ = render_markdown('The FSR meets')
+		self.assertIn('<abbr title="Student council">FSR</abbr>', text)
+
+	def test_abbreviations_defined_in_text(self):
+		text, __ = render_markdown('The FSR and the HPI\n\n*[HPI]: Hasso Plattner Institute\n*[FSR]: Something else')
+		self.assertIn('<abbr title="Hasso Plattner Institute">HPI</abbr>', text)
+		self.assertIn('<abbr title="Fachschaftsrat">FSR</abbr>', text)
+		self.assertNotIn('Something else', text)
+
+	def test_matcher_prefers_longer_abbreviations(self):
+		matcher = AbbreviationMatcher({'AB': 'short', 'AB-C': 'long', 'C++': 'language'})
+		self.assertEqual(['AB-C', 'AB'], [match.group('abbr') for match in matcher.regex.finditer('AB-C and AB')])
+		self.assertEqual(['C++'], [match.group('abbr') for match in matcher.regex.finditer('C++x')])
+		self.assertEqual([], list(AbbreviationMatcher({}).regex.finditer('anything')))
+
+
+@override_settings(CACHES={
+	'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+	'markdown': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'markdown-tests'},
+	'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+})
+class TestMarkdownPreview(TestCase):
+	texts = [
+		"# Title\n\nSome *text*\n\n## Sub\n\n* a\n* b\n\n* c\n\n    code\n\n> quote\n\n> more\n\n# Title\n\n## Sub\n\ntext",
+		"| a | b |\n|---|---|\n| 1 | 2 |\n\n|start|(18:00)\n\n[1|2|3]\n\n*[ABC]: Alphabet\n\nThe ABC\n\n"
+		"[ref]: https://example.com\n    \"Title\"\n\nSee [this][ref]\n\n1. one\n\n2. two\n\n   continued\n\nend",
+		"Heading\n=======\n\nHeading\n-------\n\n# Heading_1\n\n# Heading\n\n# Heading\n\ntext &amp; more\n\n# A & B\n\n---\n\n* * *\n",
+		"\n\n\nlead\r\n\r\n# Heading\r\n\ttabbed\r\n\r\n\tcode\r\n",
+		"",
+		"# Heading\n\n[TOC]\n\n# Another",
+	]
+
+	def setUp(self):
+		markdown_cache().clear()
+
+	def test_preview_matches_full_render(self):
+		for text in self.texts:
+			self.assertEqual(render_preview('session', text), render_markdown(text))
+
+	def test_split_blocks(self):
+		definitions, blocks = split_blocks("*[ABC]: Alphabet\n# Heading\n\ntext\n\n* a\n\n* b\n\n\n    code\n\nend\n")
+		self.assertEqual(definitions, ['*[ABC]: Alphabet'])
+		# lists and indented lines may continue the block before them
+		self.assertEqual(blocks, ['# Heading', 'text\n\n* a\n\n* b\n\n    code', 'end'])
+
+	def test_only_changed_blocks_are_rendered(self):
+		text = "# Heading\n\nfirst paragraph\n\nsecond paragraph"
+		render_preview('session', text)
+
+		rendered = PREVIEW_BLOCK_STATS['rendered']
+		reused = PREVIEW_BLOCK_STATS['reused']
+		html, __ = render_preview('session', text.replace('second', 'changed'))
+		self.assertIn('<p>changed paragraph</p>', html)
+		self.assertEqual(PREVIEW_BLOCK_STATS['rendered'], rendered + 1)
+		self.assertEqual(PREVIEW_BLOCK_STATS['reused'], reused + 2)
+
+		# blocks of other sessions are not reused
+		render_preview('other-session', text)
+		self.assertEqual(PREVIEW_BLOCK_STATS['rendered'], rendered + 4)
+
+	def test_split_html_blocks(self):
+		html = '<h1 id="a">A</h1>\n<p>text <b>x</b><br />y</p>\n<hr />\n<ul>\n<li>a</li>\n</ul>\n\ntext <i>b</i></p> end'
+		blocks = split_html_blocks(html)
+		self.assertEqual(blocks, ['<h1 id="a">A</h1>\n', '<p>text <b>x</b><br />y</p>\n', '<hr />\n', '<ul>\n<li>a</li>\n</ul>', '\n\ntext ', '<i>b</i>', '</p> end'])
+		self.assertEqual(''.join(blocks), html)
+		self.assertEqual(split_html_blocks(''), [])
+
+	def test_diff_blocks(self):
+		self.assertEqual(diff_blocks(['a', 'b', 'c'], ['a', 'x', 'c', 'd']), [(1, 2, ['x']), (3, 3, ['d'])])
+		self.assertEqual(diff_blocks(['a', 'b'], ['b']), [(0, 1, [])])
+		self.assertEqual(diff_blocks(['a'], ['a']), [])
+
+	def test_changed_abbreviation_definition_rerenders_blocks(self):
+		render_preview('session', "The ABC\n\n*[ABC]: Alphabet")
+		html, __ = render_preview('session', "The ABC\n\n*[ABC]: Alphabet soup")
+		self.assertIn('<abbr title="Alphabet soup">ABC</abbr>', html)
+
+
+class TestPreviewCoalescer(TestCase):
+
+	def setUp(self):
+		self.rendered = []
+		self.sent = []
+		self.render_started = threading.Event()
+		self.continue_render = threading.Event()
+		self.continue_render.set()
+		self.coalescer = PreviewCoalescer(self.render, lambda group_name, html: self.sent.append((group_name, html)))
+
+	def render(self, group_name, text):
+		self.rendered.append((group_name, text))
+		self.render_started.set()
+		self.continue_render.wait()
+		return '<p>{}</p>'.format(text)
+
+	def test_superseded_texts_are_not_rendered(self):
+		self.continue_render.clear()
+		first = self.coalescer.submit('group', 'first')
+		self.render_started.wait()
+
+		# the render of the first text is running, the texts submitted meanwhile only replace each other
+		second = self.coalescer.submit('group', 'second')
+		third = self.coalescer.submit('group', 'third')
+		discarded = PREVIEW_COALESCER_STATS['discarded']
+		self.continue_render.set()
+
+		self.assertEqual(third.result(), '<p>third</p>')
+		self.assertEqual(self.rendered, [('group', 'first'), ('group', 'third')])
+		# the result of the first text was outdated when it was rendered
+		self.assertEqual(self.sent, [('group', '<p>third</p>')])
+		self.assertEqual(PREVIEW_COALESCER_STATS['discarded'], discarded + 1)
+		self.assertEqual(first.result(), '<p>third</p>')
+		self.assertEqual(second.result(), '<p>third</p>')
+
+	def test_submit_does_not_wait_for_render(self):
+		self.continue_render.clear()
+		future = self.coalescer.submit('group', 'text')
+		self.assertFalse(future.done())
+		self.continue_render.set()
+		self.assertEqual(future.result(), '<p>text</p>')
+
+	def test_groups_are_rendered_independently(self):
+		self.assertEqual(self.coalescer.submit('group', 'text').result(), '<p>text</p>')
+		self.assertEqual(self.coalescer.submit('other-group', 'other text').result(), '<p>other text</p>')
+		self.assertEqual(self.sent, [('group', '<p>text</p>'), ('other-group', '<p>other text</p>')])
+
+	@override_settings(PREVIEW_RENDER_INTERVAL=0.1)
+	def test_group_is_rendered_once_per_interval(self):
+		render_times = []
+		coalescer = PreviewCoalescer(lambda group_name, text: render_times.append(time.monotonic()), lambda group_name, html: None)
+		coalescer.submit('group', 'first').result()
+		submitted = time.monotonic()
+		second = coalescer.submit('group', 'second')
+		# the delayed render is started by a timer
+		self.assertLess(time.monotonic() - submitted, 0.1)
+		second.result()
+		self.assertGreaterEqual(render_times[1] - render_times[0], 0.1)
+
+	def test_render_errors_are_passed_to_all_waiting_futures(self):
+		def render(group_name, text):
+			raise ValueError(text)
+
+		coalescer = PreviewCoalescer(render, lambda group_name, html: None)
+		with self.assertRaises(ValueError):
+			coalescer.submit('group', 'text').result()
+		# the group is not blocked by the failed render
+		with self.assertRaises(ValueError):
+			coalescer.submit('group', 'text').result()
+
+
+@override_settings(MARKDOWN_PROCESS_POOL_THRESHOLD=10)
+class TestMarkdownPool(TestCase):
+
+	@classmethod
+	def tearDownClass(cls):
+		shutdown_markdown_pool()
+		invalidate_abbreviations()
+		super().tearDownClass()
+
+	def test_large_text_is_rendered_in_pool(self):
+		AbbreviationExplanation.objects.create(abbreviation='FSR', explanation='Fachschaftsrat')
+		document = baker.make(InformationDocument)
+		text = '# Heading\n\nThe FSR, a [link](document:{}) and a [missing link](poll:0)\n\n|quorum|(3/7)'.format(document.id)
+
+		renders = MARKDOWN_POOL_STATS['renders']
+		self.assertEqual(convert_markdown(text), render_markdown(text))
+		self.assertEqual(MARKDOWN_POOL_STATS['renders'], renders + 1)
+
+	@override_settings(MARKDOWN_RENDER_TIMEOUT=0)
+	def test_timeout_falls_back_to_preformatted_text(self):
+		timeouts = MARKDOWN_POOL_STATS['timeouts']
+		self.assertEqual(convert_markdown('# <b>Heading</b>'), ('<pre># &lt;b&gt;Heading&lt;/b&gt;</pre>', ''))
+		self.assertEqual(MARKDOWN_POOL_STATS['timeouts'], timeouts + 1)
+
+	@override_settings(MARKDOWN_RENDER_TIMEOUT=0)
+	def test_large_preview_is_rendered_in_pool(self):
+		renders = MARKDOWN_POOL_STATS['renders']
+		self.assertEqual(render_preview('pool-session', 'first\n\n<b>second</b>'), ('<pre>first\n\n&lt;b&gt;second&lt;/b&gt;</pre>', ''))
+		self.assertEqual(MARKDOWN_POOL_STATS['renders'], renders + 1)
+
+	def test_small_text_is_rendered_in_process(self):
+		renders = MARKDOWN_POOL_STATS['renders']
+		convert_markdown('short')
+		self.assertEqual(MARKDOWN_POOL_STATS['renders'], renders)
+
+
+class TestLocalChannelLayer(TestCase):
+
+	def test_send_and_receive(self):
+		layer = LocalChannelLayer()
+
+		async def run():
+			channel = await layer.new_channel()
+			await layer.send(channel, {'type': 'test', 'changes': [(0, 1, ['a'])]})
+			# messages are serialized like in the redis layer
+			self.assertEqual(await layer.receive(channel), {'type': 'test', 'changes': [[0, 1, ['a']]]})
+
+		async_to_sync(run)()
+
+	def test_capacity(self):
+		layer = LocalChannelLayer(capacity=2, channel_capacity={'small.*': 1})
+
+		async def run():
+			await layer.send('channel', {'type': 'test'})
+			await layer.send('channel', {'type': 'test'})
+			with self.assertRaises(ChannelFull):
+				await layer.send('channel', {'type': 'test'})
+			await layer.send('small.channel', {'type': 'test'})
+			with self.assertRaises(ChannelFull):
+				await layer.send('small.channel', {'type': 'test'})
+
+			# full channels are skipped by group_send
+			await layer.group_add('group', 'channel')
+			await layer.group_add('group', 'other-channel')
+			await layer.group_send('group', {'type': 'group message'})
+			self.assertEqual(await layer.receive('other-channel'), {'type': 'group message'})
+			self.assertEqual(await layer.receive('channel'), {'type': 'test'})
+			self.assertEqual(await layer.receive('channel'), {'type': 'test'})
+
+		async_to_sync(run)()
+
+	def test_expiry(self):
+		layer = LocalChannelLayer(expiry=0.05, group_expiry=0.05)
+
+		async def run():
+			await layer.group_add('group', 'channel')
+			await layer.send('channel', {'type': 'expired'})
+			await asyncio.sleep(0.1)
+
+			await layer.group_send('group', {'type': 'not delivered'})
+			await layer.send('channel', {'type': 'test'})
+			self.assertEqual(await layer.receive('channel'), {'type': 'test'})
+			self.assertEqual(layer.groups['group'], {})
+
+		async_to_sync(run)()
+
+	def test_send_from_other_event_loop(self):
+		layer = LocalChannelLayer()
+
+		async def run():
+			receive = asyncio.ensure_future(layer.receive('channel'))
+			await asyncio.sleep(0)
+			thread = threading.Thread(target=asyncio.run, args=(layer.send('channel', {'type': 'test'}),))
+			thread.start()
+			self.assertEqual(await asyncio.wait_for(receive, 1), {'type': 'test'})
+			thread.join()
+
+		async_to_sync(run)()
+
+
+class TestBrokerChannelLayer(TestCase):
+
+	def start_broker(self, **config):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		broker = ChannelBroker(os.path.join(directory.name, 'broker.sock'), **config)
+		loop = asyncio.new_event_loop()
+		server = loop.run_until_complete(broker.start())
+		thread = threading.Thread(target=loop.run_forever)
+		thread.start()
+
+		async def close_connections():
+			server.close()
+			tasks = asyncio.all_tasks() - {asyncio.current_task()}
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(server.wait_closed(), *tasks, return_exceptions=True)
+
+		def stop():
+			loop.call_soon_threadsafe(loop.stop)
+			thread.join()
+			loop.run_until_complete(close_connections())
+			loop.close()
+		self.addCleanup(stop)
+		return broker.path
+
+	def test_layers_of_processes_share_the_broker(self):
+		path = self.start_broker(capacity=1)
+		receiving_layer = BrokerChannelLayer(path)
+		sending_layer = BrokerChannelLayer(path)
+
+		async def run():
+			channel = await receiving_layer.new_channel()
+			await receiving_layer.group_add('group', channel)
+			await sending_layer.group_send('group', {'type': 'test', 'text': 'äöü'})
+			self.assertEqual(await receiving_layer.receive(channel), {'type': 'test', 'text': 'äöü'})
+
+			await sending_layer.send(channel, {'type': 'test'})
+			with self.assertRaises(ChannelFull):
+				await sending_layer.send(channel, {'type': 'test'})
+			self.assertEqual(await receiving_layer.receive(channel), {'type': 'test'})
+
+			await receiving_layer.group_discard('group', channel)
+			await sending_layer.group_send('group', {'type': 'not delivered'})
+			await receiving_layer.close()
+			await sending_layer.close()
+
+		async_to_sync(run)()
+
+	def test_messages_of_cancelled_receives_are_kept(self):
+		layer = BrokerChannelLayer(self.start_broker())
+
+		async def run():
+			receive = asyncio.ensure_future(layer.receive('channel'))
+			await asyncio.sleep(0.05)
+			receive.cancel()
+			await layer.send('channel', {'type': 'test'})
+			self.assertEqual(await asyncio.wait_for(layer.receive('channel'), 1), {'type': 'test'})
+			await layer.close()
+
+		async_to_sync(run)()
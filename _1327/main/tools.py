@@ -1,6 +1,11 @@
 from django.utils.translation import get_language
 
 
-def translate(**kwargs):
+def current_language():
 	# Transforms everything that comes out of get_language to 'en' or 'de'. suffixes like -US are omitted.
-	return property(lambda self: getattr(self, kwargs.get((get_language() or 'en').split('-')[0], kwargs['en'])))
+	language = (get_language() or 'en').split('-')[0]
+	return language if language in ('de', 'en') else 'en'
+
+
+def translate(**kwargs):
+	return property(lambda self: getattr(self, kwargs.get(current_language(), kwargs['en'])))
@@ -1,76 +1,198 @@
+from contextlib import contextmanager
+import hashlib
 import re
+import threading
 
 from django.conf import settings
-from django.contrib.auth.models import Group
-from django.core.exceptions import ValidationError
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.exceptions import SuspiciousOperation, ValidationError
+from django.core.management import call_command
+from django.db import connections, DEFAULT_DB_ALIAS, transaction
+from django.db.utils import ConnectionHandler
+from django.test.utils import override_settings
+from django.utils.html import escape
 from django.utils.text import slugify as django_slugify
-from django.utils.translation import gettext_lazy as _
-
-from guardian.core import ObjectPermissionChecker
+from django.utils.translation import get_language, gettext_lazy as _
 
 import markdown
 from markdown.extensions import Extension
 from markdown.extensions.toc import TocExtension
 
+from _1327.main.cache_versions import bump_cache_version, cache_version, shared_cache
+from _1327.main.markdown_abbreviation_extension import AbbreviationExtension, AbbreviationMatcher
+from _1327.user_management.registry import main_group_names
 
-URL_TITLE_REGEX = re.compile(r'^[a-zA-Z0-9-_\/]*$')
 
+URL_TITLE_REGEX = re.compile(r'^[a-zA-Z0-9-_\/]*$')
 
-def save_main_menu_item_order(main_menu_items, user, parent_id=None):
-	from .models import MenuItem
-	order_counter = 0
-
-	# check whether we are allowed to change all children of the current level
-	# in case we are not allowed to do that, we have to make sure, that we are not altering the original
-	# order of the menu items, as we are not allowed to do so.
-	all_menu_items_on_this_level = MenuItem.objects.filter(menu_type=MenuItem.MAIN_MENU, parent_id=parent_id)
-	menu_item_order_map = {menu_item: menu_item.order for menu_item in all_menu_items_on_this_level if menu_item.can_edit(user)}
-	use_old_order = len(menu_item_order_map) != all_menu_items_on_this_level.count()
-
-	for item in main_menu_items:
-		item_id = item['id']
-		menu_item = MenuItem.objects.get(pk=item_id)
-		if (menu_item.link or menu_item.document) and 'children' in item:
-			continue
-		if menu_item.can_edit(user):
-			menu_item.menu_type = MenuItem.MAIN_MENU
-			if use_old_order:
-				menu_item.order = menu_item_order_map[menu_item]
-			else:
+MARKDOWN_CACHE_STATS = {'hits': 0, 'misses': 0}
+# the names of all markdown stats, they are added up for all processes in the shared cache, see the markdown_stats command
+MARKDOWN_STAT_NAMES = ('hits', 'misses', 'renders', 'timeouts')
+
+_unreported_stats = {}
+_unreported_stats_lock = threading.Lock()
+
+_markdown_engines = threading.local()
+
+_abbreviations = {'version': None, 'matcher': None}
+_abbreviations_lock = threading.Lock()
+
+
+class MenuItemPermissions:
+	"""
+		fetches all menu items with their parents and the ids of the menu items the user has the edit and change children
+		permissions for at once. the permissions are decided like in MenuItem.can_edit and MenuItem.can_view_in_list.
+	"""
+
+	def __init__(self, user, queryset=None):
+		from _1327.user_management.shortcuts import get_permitted_objects
+		from .models import MenuItem
+
+		self.user = user
+		self.menu_items = (MenuItem.objects.all() if queryset is None else queryset).in_bulk()
+		for menu_item in self.menu_items.values():
+			if menu_item.parent_id is not None:
+				menu_item.parent = self.menu_items[menu_item.parent_id]
+
+		change_children_permission_name = "{app}.{codename}".format(app=MenuItem._meta.app_label, codename=MenuItem.CHANGE_CHILDREN_PERMISSION_NAME)
+		edit_permission_name = "{app}.{codename}".format(app=MenuItem._meta.app_label, codename=MenuItem.EDIT_PERMISSION_NAME)
+		self.can_edit_all = user.has_perm(change_children_permission_name) or user.has_perm(edit_permission_name)
+		self.change_children_ids = set(get_permitted_objects(MenuItem.objects.all(), user, change_children_permission_name).values_list('id', flat=True))
+		self.edit_ids = set(get_permitted_objects(MenuItem.objects.all(), user, edit_permission_name).values_list('id', flat=True))
+
+	def can_edit(self, menu_item):
+		parent = self.menu_items.get(menu_item.parent_id)
+		if self.can_edit_all or menu_item.id in self.edit_ids:
+			return True
+		if parent is None:
+			return False
+		return parent.id in self.change_children_ids or parent.parent_id in self.change_children_ids
+
+	def can_view_in_list(self, menu_item):
+		return self.can_edit(menu_item) or menu_item.id in self.change_children_ids
+
+
+class MenuItemOrder(MenuItemPermissions):
+	"""
+		applies the order of the menu items posted by the menu item index, the changed items are saved with one query
+	"""
+
+	def __init__(self, user):
+		from .models import MenuItem
+		super().__init__(user, MenuItem.objects.select_for_update())
+		# the levels of the menu are determined by the positions before applying the posted order, which changes them
+		self.original_positions = {menu_item.id: (menu_item.menu_type, menu_item.parent_id) for menu_item in self.menu_items.values()}
+		self.changed = {}
+
+	def get(self, item):
+		try:
+			return self.menu_items[int(item['id'])]
+		except (KeyError, TypeError, ValueError):
+			raise SuspiciousOperation("The posted menu item does not exist.")
+
+	def apply_main_menu(self, main_menu_items, parent_id=None):
+		from .models import MenuItem
+		order_counter = 0
+
+		# check whether we are allowed to change all children of the current level
+		# in case we are not allowed to do that, we have to make sure, that we are not altering the original
+		# order of the menu items, as we are not allowed to do so.
+		all_menu_items_on_this_level = [
+			menu_item for menu_item in self.menu_items.values()
+			if self.original_positions[menu_item.id] == (MenuItem.MAIN_MENU, parent_id)
+		]
+		menu_item_order_map = {menu_item.id: menu_item.order for menu_item in all_menu_items_on_this_level if self.can_edit(menu_item)}
+		use_old_order = len(menu_item_order_map) != len(all_menu_items_on_this_level)
+		parent = self.menu_items.get(parent_id)
+
+		for item in main_menu_items:
+			menu_item = self.get(item)
+			if (menu_item.link or menu_item.document_id) and 'children' in item:
+				continue
+			if self.can_edit(menu_item):
+				menu_item.menu_type = MenuItem.MAIN_MENU
+				if use_old_order:
+					menu_item.order = menu_item_order_map.get(menu_item.id, menu_item.order)
+				else:
+					menu_item.order = order_counter
+				order_counter += 1
+
+				if self.user.is_superuser or (parent and self.can_view_in_list(parent)):  # check that the item is moved under a parent where the change_children permission is set
+					menu_item.parent_id = parent_id
+				self.changed[menu_item.id] = menu_item
+			if 'children' in item:
+				self.apply_main_menu(item['children'], menu_item.id)
+
+	def apply_footer(self, footer_items, order_counter=0):
+		from .models import MenuItem
+		for item in footer_items:
+			menu_item = self.get(item)
+			if self.can_edit(menu_item):
+				menu_item.menu_type = MenuItem.FOOTER
 				menu_item.order = order_counter
-			order_counter += 1
-
-			if parent_id:
-				parent = MenuItem.objects.get(pk=parent_id)
-			else:
-				parent = None
-			if user.is_superuser or (parent and parent.can_view_in_list(user)):  # check that the item is moved under a parent where the change_children permission is set
-				menu_item.parent = parent
-			menu_item.save()
-		if 'children' in item:
-			save_main_menu_item_order(item['children'], user, item_id)
-
-
-def save_footer_item_order(footer_items, user, order_counter=0):
-	from .models import MenuItem
-	for item in footer_items:
-		item_id = item['id']
-		menu_item = MenuItem.objects.get(pk=item_id)
-		if menu_item.can_edit(user):
-			menu_item.menu_type = MenuItem.FOOTER
-			menu_item.order = order_counter
-			order_counter += 1
-			menu_item.parent = None
-			menu_item.save()
-		# in case subitems have been moved into the footer save them as well, remove parents but keep their order
-		if 'children' in item:
-			order_counter = save_footer_item_order(item['children'], user, order_counter)
-	return order_counter
-
-
-def abbreviation_explanation_markdown():
+				order_counter += 1
+				menu_item.parent_id = None
+				self.changed[menu_item.id] = menu_item
+			# in case subitems have been moved into the footer save them as well, remove parents but keep their order
+			if 'children' in item:
+				order_counter = self.apply_footer(item['children'], order_counter)
+		return order_counter
+
+	def save(self):
+		from .models import MenuItem
+		MenuItem.objects.bulk_update(self.changed.values(), ['menu_type', 'order', 'parent'])
+		# bulk updates do not send post_save
+		invalidate_menus()
+
+
+def save_menu_item_order(user, main_menu_items, footer_items=()):
+	with transaction.atomic():
+		menu_item_order = MenuItemOrder(user)
+		menu_item_order.apply_main_menu(main_menu_items)
+		menu_item_order.apply_footer(footer_items)
+		menu_item_order.save()
+
+
+def abbreviation_matcher():
+	# the abbreviations are loaded once per process and reloaded after any process changed them,
+	# other processes notice the change within CACHE_VERSION_CHECK_INTERVAL
 	from .models import AbbreviationExplanation
-	return "\n" + ("\n".join([str(abbr) for abbr in AbbreviationExplanation.objects.all()]))
+	version = cache_version('abbreviations')
+	with _abbreviations_lock:
+		if _abbreviations['matcher'] is None or _abbreviations['version'] != version:
+			_abbreviations['matcher'] = AbbreviationMatcher(dict(AbbreviationExplanation.objects.values_list('abbreviation', 'explanation')))
+			_abbreviations['version'] = version
+		return _abbreviations['matcher']
+
+
+def invalidate_abbreviations():
+	with _abbreviations_lock:
+		_abbreviations['matcher'] = None
+	bump_cache_version('abbreviations')
+
+
+@contextmanager
+def in_memory_database():
+	"""
+		runs benchmarks in a migrated in-memory database with caches of their own,
+		so they neither depend on nor change the configured database and the caches shared with other processes
+	"""
+	original_connection = connections[DEFAULT_DB_ALIAS]
+	connection = ConnectionHandler({DEFAULT_DB_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}})[DEFAULT_DB_ALIAS]
+	local_caches = {alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-{}'.format(alias)} for alias in settings.CACHES}
+	with override_settings(CACHES=local_caches):
+		connections[DEFAULT_DB_ALIAS] = connection
+		ContentType.objects.clear_cache()
+		invalidate_abbreviations()
+		try:
+			call_command('migrate', verbosity=0, interactive=False)
+			yield
+		finally:
+			invalidate_abbreviations()
+			connection.close()
+			connections[DEFAULT_DB_ALIAS] = original_connection
+			ContentType.objects.clear_cache()
 
 
 # see https://pythonhosted.org/Markdown/release-2.6.html#safe_mode-deprecated
@@ -80,19 +202,114 @@ class EscapeHtml(Extension):
 		md.inlinePatterns.deregister('html')
 
 
+def markdown_cache():
+	return caches[settings.MARKDOWN_CACHE_ALIAS]
+
+
+def markdown_cache_key(text):
+	parts = [get_language() or '', cache_version('abbreviations')]
+	# only texts containing internal links depend on the urls of other documents
+	if '(document:' in text or '(poll:' in text:
+		parts.append(cache_version('links'))
+	parts.append(text)
+	return 'markdown_' + hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def count_markdown_stat(stats, name):
+	"""
+		counts an event in the stats of this process. the counts are added to the shared cache every MARKDOWN_STATS_REPORT_INTERVAL events,
+		counts of the cache backends without atomic increments, like the file based one, may miss concurrent events.
+	"""
+	stats[name] += 1
+	with _unreported_stats_lock:
+		_unreported_stats[name] = _unreported_stats.get(name, 0) + 1
+		if sum(_unreported_stats.values()) < settings.MARKDOWN_STATS_REPORT_INTERVAL:
+			return
+		unreported = dict(_unreported_stats)
+		_unreported_stats.clear()
+
+	for name, count in unreported.items():
+		key = 'markdown_stats_{}'.format(name)
+		if not shared_cache().add(key, count, None):
+			try:
+				shared_cache().incr(key, count)
+			except ValueError:
+				# the counts were evicted or the shared cache does not keep any values
+				pass
+
+
+def markdown_stats():
+	"""
+		returns the counts of all processes reported to the shared cache so far
+	"""
+	counts = shared_cache().get_many(['markdown_stats_{}'.format(name) for name in MARKDOWN_STAT_NAMES])
+	return {name: counts.get('markdown_stats_{}'.format(name), 0) for name in MARKDOWN_STAT_NAMES}
+
+
+def try_convert_markdown(text):
+	"""
+		returns None if the text could not be rendered within MARKDOWN_RENDER_TIMEOUT
+	"""
+	key = markdown_cache_key(text)
+	cached = markdown_cache().get(key)
+	if cached is not None:
+		count_markdown_stat(MARKDOWN_CACHE_STATS, 'hits')
+		return cached
+	count_markdown_stat(MARKDOWN_CACHE_STATS, 'misses')
+
+	if len(text) > settings.MARKDOWN_PROCESS_POOL_THRESHOLD:
+		from _1327.main.markdown_pool import render_markdown_in_pool
+		rendered = render_markdown_in_pool(text)
+		if rendered is None:
+			return None
+	else:
+		rendered = render_markdown(text)
+	markdown_cache().set(key, rendered)
+	return rendered
+
+
 def convert_markdown(text):
+	rendered = try_convert_markdown(text)
+	if rendered is None:
+		# the fallback is not cached, the next request tries to render the text again
+		return '<pre>{}</pre>'.format(escape(text)), ''
+	return rendered
+
+
+def markdown_extensions(get_abbreviation_matcher=abbreviation_matcher, link_urls=None):
 	from _1327.documents.markdown_internal_link_extension import InternalLinksMarkdownExtension
-	md = markdown.Markdown(
-		extensions=[
-			EscapeHtml(),
-			TocExtension(baselevel=2),
-			InternalLinksMarkdownExtension(),
-			'_1327.minutes.markdown_minutes_extensions',
-			'_1327.documents.markdown_scaled_image_extension',
-			'markdown.extensions.abbr',
-			'markdown.extensions.tables',
-		])
-	return md.convert(text + abbreviation_explanation_markdown()), md.toc
+	return {
+		'escape_html': EscapeHtml(),
+		'toc': TocExtension(baselevel=2),
+		'internal_links': InternalLinksMarkdownExtension(link_urls),
+		'minutes': '_1327.minutes.markdown_minutes_extensions',
+		'scaled_images': '_1327.documents.markdown_scaled_image_extension',
+		'abbreviations': AbbreviationExtension(get_abbreviation_matcher),
+		'tables': 'markdown.extensions.tables',
+	}
+
+
+def create_markdown_engine(get_abbreviation_matcher=abbreviation_matcher, link_urls=None):
+	return markdown.Markdown(extensions=list(markdown_extensions(get_abbreviation_matcher, link_urls).values()))
+
+
+@contextmanager
+def markdown_engine():
+	# every thread keeps its own pool, an engine is never used by two renders at the same time
+	pool = getattr(_markdown_engines, 'pool', None)
+	if pool is None:
+		pool = _markdown_engines.pool = []
+	md = pool.pop() if pool else create_markdown_engine()
+	try:
+		yield md
+	finally:
+		md.reset()
+		pool.append(md)
+
+
+def render_markdown(text):
+	with markdown_engine() as md:
+		return md.convert(text), md.toc
 
 
 def slugify(string):
@@ -150,37 +367,66 @@ def slugify_and_clean_url_title(instance, url_title):
 	return url_title
 
 
+def permission_overview_cache_key(content_type_id, object_pk):
+	# the overviews are kept in the shared cache, so the changes of any process invalidate them.
+	# renamed, created and deleted groups change the overviews of all documents
+	return 'permission_overview_{}_{}_{}'.format(content_type_id, object_pk, cache_version('groups'))
+
+
+def invalidate_permission_overview(content_type_id, object_pk):
+	def invalidate():
+		shared_cache().delete(permission_overview_cache_key(content_type_id, object_pk))
+
+	invalidate()
+	# overviews computed before the change was committed must not stay cached
+	transaction.on_commit(invalidate)
+
+
+def invalidate_permission_overviews():
+	bump_cache_version('groups')
+
+
+def invalidate_menus():
+	bump_cache_version('menus')
+
+
+def invalidate_permission_flags():
+	bump_cache_version('permission_flags')
+
+
 def document_permission_overview(user, document):
+	from guardian.utils import get_group_obj_perms_model
+
 	can_edit = user.has_perm(document.edit_permission_name, document)
 	if not can_edit:
 		return []
 
-	main_groups = [
-		settings.ANONYMOUS_GROUP_NAME,
-		settings.UNIVERSITY_GROUP_NAME,
-		settings.STUDENT_GROUP_NAME,
-		settings.STAFF_GROUP_NAME,
-	]
-	permissions = []
-	for group_name in main_groups:
-		group = Group.objects.get(name=group_name)
-		checker = ObjectPermissionChecker(group)
-		checker.prefetch_perms([document])
-		if checker.has_perm(document.edit_permission_name, document):
-			permissions.append((group.name, "edit"))
-		elif checker.has_perm(document.view_permission_name, document):
-			permissions.append((group.name, "view"))
+	content_type = ContentType.objects.get_for_model(document)
+	key = permission_overview_cache_key(content_type.id, document.pk)
+	permissions = shared_cache().get(key)
+	if permissions is not None:
+		return permissions
+
+	main_groups = main_group_names()
+	edit_codename = document.edit_permission_name.split('.')[1]
+	view_codename = document.view_permission_name.split('.')[1]
+	group_permissions = {}
+	permission_model = get_group_obj_perms_model(document)
+	if permission_model.objects.is_generic():
+		object_permissions = permission_model.objects.filter(content_type=content_type, object_pk=str(document.pk))
+	else:
+		object_permissions = permission_model.objects.filter(content_object=document.pk)
+	object_permissions = object_permissions.filter(permission__codename__in=[edit_codename, view_codename])
+	for group_name, codename in object_permissions.order_by('group_id').values_list('group__name', 'permission__codename'):
+		if codename == edit_codename:
+			group_permissions[group_name] = "edit"
 		else:
-			permissions.append((group.name, "none"))
+			group_permissions.setdefault(group_name, "view")
 
-	for group in Group.objects.exclude(name__in=main_groups):
-		checker = ObjectPermissionChecker(group)
-		checker.prefetch_perms([document])
-		if checker.has_perm(document.edit_permission_name, document):
-			permissions.append((group.name, "edit"))
-		elif checker.has_perm(document.view_permission_name, document):
-			permissions.append((group.name, "view"))
+	permissions = [(group_name, group_permissions.get(group_name, "none")) for group_name in main_groups]
+	permissions += [(group_name, permission) for group_name, permission in group_permissions.items() if group_name not in main_groups]
 
+	shared_cache().set(key, permissions)
 	return permissions
 
 
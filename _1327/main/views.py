@@ -13,7 +13,6 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_POST
 from django.views.i18n import set_language
-from guardian.shortcuts import get_objects_for_user
 
 from _1327.documents.models import Document
 from _1327.documents.views import edit as document_edit, view as document_view
@@ -24,7 +23,7 @@ from _1327.shortlinks.models import Shortlink
 from _1327.shortlinks.views import edit as shortlink_edit, view as shortlink_view
 from .forms import MenuItemAdminForm, MenuItemCreationAdminForm, MenuItemCreationForm, MenuItemForm
 from .models import MenuItem
-from .utils import save_footer_item_order, save_main_menu_item_order
+from .utils import MenuItemPermissions, save_menu_item_order
 
 
 @ensure_csrf_cookie
@@ -54,38 +53,38 @@ def edit(request, title):
 
 
 def menu_items_index(request):
-	if not request.user.is_superuser and len(get_objects_for_user(request.user, MenuItem.CHANGE_CHILDREN_PERMISSION_NAME, klass=MenuItem)) == 0:
+	if not MenuItem.can_change_any_item(request.user):
 		raise PermissionDenied
 
-	main_menu_items = []
-	footer_items = []
-
-	items = find_root_menu_items(
-		[item for item in MenuItem.objects.filter(menu_type=MenuItem.MAIN_MENU, children=None) if item.can_view_in_list(request.user)]
+	# the whole menu is built from one query for the menu items, their documents and the permissions of the user
+	permissions = MenuItemPermissions(request.user)
+	menu_items = list(permissions.menu_items.values())
+	documents = Document.objects.in_bulk({menu_item.document_id for menu_item in menu_items if menu_item.document_id})
+	children = {}
+	for menu_item in menu_items:
+		if menu_item.document_id:
+			menu_item.document = documents[menu_item.document_id]
+		menu_item.editable = permissions.can_edit(menu_item)
+		children.setdefault(menu_item.parent_id, []).append(menu_item)
+
+	def visible_children(item):
+		return [child for child in children.get(item.id, []) if child.menu_type == MenuItem.MAIN_MENU and permissions.can_view_in_list(child)]
+
+	main_menu_items = find_root_menu_items(
+		[item for item in menu_items if item.menu_type == MenuItem.MAIN_MENU and item.id not in children and permissions.can_view_in_list(item)]
 	)
-	items = sorted(items, key=lambda x: x.order)
-
-	for item in items:
-		subitems = [
-			subitem for subitem in
-			MenuItem.objects.filter(menu_type=MenuItem.MAIN_MENU, parent=item).order_by('order')
-			if subitem.can_view_in_list(request.user)
-		]
-		if subitems:
-			for subitem in subitems:
-				subsubitems = [
-					subsubitem for subsubitem in
-					MenuItem.objects.filter(menu_type=MenuItem.MAIN_MENU, parent=subitem).order_by('order')
-					if subsubitem.can_view_in_list(request.user)
-				]
-				if subsubitems:
-					subitem.subitems = subsubitems
-			item.subitems = subitems
-		main_menu_items.append(item)
+	main_menu_items = sorted(main_menu_items, key=lambda x: x.order)
 
+	for item in main_menu_items:
+		item.subitems = visible_children(item)
+		for subitem in item.subitems:
+			subsubitems = visible_children(subitem)
+			if subsubitems:
+				subitem.subitems = subsubitems
+
+	footer_items = []
 	if request.user.is_superuser:  # only allow editing of footer items for superusers
-		for item in MenuItem.objects.filter(menu_type=MenuItem.FOOTER, parent=None).order_by('order'):
-			footer_items.append(item)
+		footer_items = [item for item in menu_items if item.menu_type == MenuItem.FOOTER and item.parent_id is None]
 
 	return render(request, 'menu_items_index.html', {
 		'main_menu_items': main_menu_items,
@@ -159,10 +158,9 @@ def menu_items_update_order(request):
 		elif len(footer_items) == 0:
 			messages.error(request, _("There must always be at least one item in the footer menu."))
 		else:
-			save_main_menu_item_order(main_menu_items, request.user)
-			save_footer_item_order(footer_items, request.user)
+			save_menu_item_order(request.user, main_menu_items, footer_items)
 	else:
-		save_main_menu_item_order(main_menu_items, request.user)
+		save_menu_item_order(request.user, main_menu_items)
 	return HttpResponse()
 
 
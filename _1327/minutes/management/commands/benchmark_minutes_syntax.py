@@ -0,0 +1,71 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+import markdown
+
+from _1327.minutes.markdown_minutes_extensions import BreakPreprocessor, EnterLeavePreprocessor, MinutesPreprocessor, \
+	QuorumPrepocessor, StartEndPreprocessor, VotePreprocessor
+
+
+AGENDA_ITEM = """## TOP {number}: Agenda item {number}
+
+|enter|(18:{minute:02d})(Participant {number})(Hangout)
+Report of the working group, discussion about the proposal of the last meeting and the
+consequences for the budget of the next semester.
+
+* first point of the discussion
+* second point of the discussion with a [link](https://example.com)
+
+| Position | Amount |
+|----------|--------|
+| Travel   | 100    |
+| Food     | 50     |
+
+The proposal is accepted [7|1|2]
+|leave|(19:{minute:02d})(Participant {number})
+"""
+
+
+def generate_minutes(agenda_items):
+	items = [AGENDA_ITEM.format(number=number, minute=number % 60) for number in range(agenda_items)]
+	return "|start|(18:00)\n|quorum|(7/9)\n\n" + "\n".join(items) + "\n|break|(19:00)(19:15)\n|end|(21:00)\n"
+
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Compares running the minutes preprocessors one after another with the single pass preprocessor'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--iterations', type=int, default=20)
+		parser.add_argument('--agenda-items', type=int, default=30)
+
+	def handle(self, *args, **options):
+		iterations = options['iterations']
+		lines = generate_minutes(options['agenda_items']).split("\n")
+
+		md = markdown.Markdown()
+		preprocessors = [
+			VotePreprocessor(md),
+			StartEndPreprocessor(md),
+			BreakPreprocessor(md),
+			QuorumPrepocessor(md),
+			EnterLeavePreprocessor(md),
+		]
+		minutes_preprocessor = MinutesPreprocessor(md, preprocessors)
+
+		def run_sequentially():
+			result = lines
+			for preprocessor in preprocessors:
+				result = preprocessor.run(result)
+			return result
+
+		if run_sequentially() != minutes_preprocessor.run(lines):
+			raise CommandError('The single pass preprocessor produces a different output.')
+
+		results = [
+			('sequential preprocessors', timeit.timeit(run_sequentially, number=iterations)),
+			('single pass preprocessor', timeit.timeit(lambda: minutes_preprocessor.run(lines), number=iterations)),
+		]
+		self.stdout.write('{} lines'.format(len(lines)))
+		for name, seconds in results:
+			self.stdout.write('{:<28}{:>10.3f} ms'.format(name, seconds * 1000 / iterations))
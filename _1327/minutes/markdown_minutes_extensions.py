@@ -11,12 +11,16 @@ class MinutesBasePreprocessor(Preprocessor):
 
 		for line in lines:
 			if line.strip():
-				for pattern, method in self.patterns:
-					line = re.sub(pattern, method, line, flags=re.UNICODE)
+				line = self.process_line(line)
 			new_lines.append(line)
 
 		return new_lines
 
+	def process_line(self, line):
+		for pattern, method in self.patterns:
+			line = re.sub(pattern, method, line, flags=re.UNICODE)
+		return line
+
 
 class VotePreprocessor(MinutesBasePreprocessor):
 	def __init__(self, *args, **kwargs):
@@ -120,14 +124,62 @@ class EnterLeavePreprocessor(MinutesBasePreprocessor):
 		return self.enter_or_leavify(match, _("leaves"))
 
 
+class MinutesPreprocessor(Preprocessor):
+	"""
+		applies the patterns of all given preprocessors in a single pass over each line,
+		producing the same output as running the preprocessors one after another
+	"""
+	def __init__(self, md, preprocessors):
+		super().__init__(md)
+		self.preprocessors = preprocessors
+		directives = [(re.compile(pattern, re.UNICODE), method) for preprocessor in preprocessors for pattern, method in preprocessor.patterns]
+		self.directives = {}
+		alternatives = []
+		for index, (regex, method) in enumerate(directives):
+			# a match of a directive may swallow a directive that the preprocessors would have replaced before it
+			preceding = '|'.join(preceding_regex.pattern for preceding_regex, __ in directives[:index])
+			self.directives['directive{}'.format(index)] = (regex, method, re.compile(preceding, re.UNICODE) if preceding else None)
+			alternatives.append('(?P<directive{}>{})'.format(index, regex.pattern))
+		self.regex = re.compile('|'.join(alternatives), re.UNICODE)
+
+	def run(self, lines):
+		# every directive contains a pipe, all other lines are left as they are
+		return [self.process_line(line) if '|' in line else line for line in lines]
+
+	def process_line(self, line):
+		parts = []
+		position = 0
+		for match in self.regex.finditer(line):
+			regex, method, preceding_regex = self.directives[match.lastgroup]
+			if preceding_regex is not None:
+				preceding_match = preceding_regex.search(line, match.start() + 1)
+				if preceding_match is not None and preceding_match.start() < match.end():
+					return self.process_line_sequentially(line)
+			parts.append(line[position:match.start()])
+			parts.append(method(regex.match(line, match.start())))
+			position = match.end()
+		if not parts:
+			return line
+		parts.append(line[position:])
+		return ''.join(parts)
+
+	def process_line_sequentially(self, line):
+		for preprocessor in self.preprocessors:
+			line = preprocessor.process_line(line)
+		return line
+
+
 class MinuteExtension(Extension):
 	def extendMarkdown(self, md):
 		md.registerExtension(self)
-		md.preprocessors.register(VotePreprocessor(md), 'votify', 200)
-		md.preprocessors.register(StartEndPreprocessor(md), 'start_or_endify', 200)
-		md.preprocessors.register(BreakPreprocessor(md), 'breakify', 200)
-		md.preprocessors.register(QuorumPrepocessor(md), 'quorumify', 200)
-		md.preprocessors.register(EnterLeavePreprocessor(md), 'enter_or_leavify', 200)
+		preprocessors = [
+			VotePreprocessor(md),
+			StartEndPreprocessor(md),
+			BreakPreprocessor(md),
+			QuorumPrepocessor(md),
+			EnterLeavePreprocessor(md),
+		]
+		md.preprocessors.register(MinutesPreprocessor(md, preprocessors), 'minutes', 200)
 
 
 def makeExtension():
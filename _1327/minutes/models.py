@@ -1,7 +1,6 @@
 from datetime import date, datetime
 
 from django.conf import settings
-from django.contrib.auth.models import Group
 from django.core.exceptions import SuspiciousOperation
 from django.db import models
 from django.db.models.signals import post_save
@@ -9,12 +8,14 @@ from django.dispatch import receiver
 from django.template import loader
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _, ngettext_lazy
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
 from guardian.shortcuts import assign_perm
 from reversion import revisions
 
 from _1327.documents.models import Document
 from _1327.minutes.fields import HexColorModelField
 from _1327.user_management.models import UserProfile
+from _1327.user_management.registry import get_group
 
 MINUTES_VIEW_PERMISSION_NAME = 'view_minutesdocument'
 
@@ -82,7 +83,8 @@ class MinutesDocument(Document):
 	def get_edit_url(self):
 		return reverse(self.get_edit_url_name(), args=(self.url_title, ))
 
-	def get_view_url_name(self):
+	@classmethod
+	def get_view_url_name(cls):
 		return 'minutes:view'
 
 	def get_edit_url_name(self):
@@ -141,10 +143,18 @@ class MinutesDocument(Document):
 revisions.register(MinutesDocument, follow=["document_ptr"])
 
 
+class MinutesDocumentUserObjectPermission(UserObjectPermissionBase):
+	content_object = models.ForeignKey(MinutesDocument, on_delete=models.CASCADE)
+
+
+class MinutesDocumentGroupObjectPermission(GroupObjectPermissionBase):
+	content_object = models.ForeignKey(MinutesDocument, on_delete=models.CASCADE)
+
+
 @receiver(post_save, sender=MinutesDocument, dispatch_uid="update_permissions")
 def update_permissions(sender, instance, **kwargs):
-	student_group = Group.objects.get(name=settings.STUDENT_GROUP_NAME)
-	university_network_group = Group.objects.get(name=settings.UNIVERSITY_GROUP_NAME)
+	student_group = get_group(settings.STUDENT_GROUP_NAME)
+	university_network_group = get_group(settings.UNIVERSITY_GROUP_NAME)
 	if instance.state == MinutesDocument.UNPUBLISHED or instance.state == MinutesDocument.INTERNAL:
 		instance.delete_all_permissions(student_group)
 		instance.delete_all_permissions(university_network_group)
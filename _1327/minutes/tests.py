@@ -1,7 +1,9 @@
+from io import StringIO
 from unittest import TestCase
 
 from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.management import call_command
 from django.urls import reverse
 from django_webtest import WebTest
 from guardian.core import ObjectPermissionChecker
@@ -11,8 +13,8 @@ from model_bakery import baker
 from reversion.models import Version
 
 from _1327.main.utils import slugify
-from _1327.minutes.markdown_minutes_extensions import BreakPreprocessor, EnterLeavePreprocessor, QuorumPrepocessor, \
-	StartEndPreprocessor, VotePreprocessor
+from _1327.minutes.markdown_minutes_extensions import BreakPreprocessor, EnterLeavePreprocessor, MinutesPreprocessor, \
+	QuorumPrepocessor, StartEndPreprocessor, VotePreprocessor
 
 from _1327.minutes.models import MinutesDocument
 from _1327.user_management.models import UserProfile
@@ -547,3 +549,35 @@ class TestMarkdownMinutesExtension(TestCase):
 		leave_text_with_space = "|leave|(15:30)(User with Spaces)"
 		processed_text = self.enter_leave_preprocessor.run([self.base_text.format(leave_text_with_space)])[0]
 		self.assertIn("*15:30: User with Spaces leaves the meeting*", processed_text)
+
+	def test_minutes_preprocessor_matches_sequential_preprocessors(self):
+		preprocessors = [
+			self.vote_preprocessor,
+			self.start_end_preprocessor,
+			self.break_preprocessor,
+			self.quorum_preprocessor,
+			self.enter_leave_preprocessor,
+		]
+		minutes_preprocessor = MinutesPreprocessor(self.md, preprocessors)
+		lines = [
+			"",
+			"   ",
+			"no directive at all",
+			"| Name | Value |",
+			"|start|(18:00) and [1|2|3] and |end|(20:00)",
+			"|break|(18:30)(18:45)|quorum|(4/9)",
+			"|enter|(14:30)(User)(Hangout) |leave|(15:30)(User, Other)",
+			"|enter|(14:30)(User)([1|2|3])",
+			"|enter|(14:30)(User)(|start|(15:00)) rest",
+			"|enter|(14:30)(User)(|leave|(15:30)(User))",
+			"[1|2|3|4] |start|(1:2:3)",
+		]
+		expected_lines = lines
+		for preprocessor in preprocessors:
+			expected_lines = preprocessor.run(expected_lines)
+		self.assertEqual(minutes_preprocessor.run(lines), expected_lines)
+
+	def test_benchmark_command(self):
+		output = StringIO()
+		call_command('benchmark_minutes_syntax', iterations=1, agenda_items=2, stdout=output)
+		self.assertIn('single pass preprocessor', output.getvalue())
@@ -1,51 +1,31 @@
 import re
 
-from django.contrib.auth.models import Group
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Q
 from django.shortcuts import Http404, redirect, render
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django.utils.translation import get_language
-from guardian.core import ObjectPermissionChecker
 
 from _1327.minutes.forms import SearchForm
 from _1327.minutes.models import MinutesDocument
+from _1327.user_management.registry import get_group
+from _1327.user_management.shortcuts import get_permitted_objects
 
 
 def get_permitted_minutes(minutes, request, groupid):
 	groupid = int(groupid)
 	try:
-		group = Group.objects.get(id=groupid)
+		group = get_group(id=groupid)
 	except ObjectDoesNotExist:
 		raise Http404
 
 	own_group = request.user.is_superuser or group in request.user.groups.all()
 
-	# Prefetch group permissions
-	group_checker = ObjectPermissionChecker(group)
-	group_checker.prefetch_perms(minutes)
-
-	# Prefetch user permissions
-	user_checker = ObjectPermissionChecker(request.user)
-	user_checker.prefetch_perms(minutes)
-
-	# Prefetch ip group permissions
-	ip_range_group_name = request.user._ip_range_group_name if hasattr(request.user, '_ip_range_group_name') else None
-	if ip_range_group_name:
-		ip_range_group = Group.objects.get(name=ip_range_group_name)
-		ip_range_group_checker = ObjectPermissionChecker(ip_range_group)
-
-	permitted_minutes = []
-	for m in minutes:
-		# we show all documents for which the requested group has edit permissions
-		# e.g. if you request FSR minutes, all minutes for which the FSR group has edit rights will be shown
-		if not group_checker.has_perm(m.edit_permission_name, m):
-			continue
-		# we only show documents for which the user has view permissions
-		if not user_checker.has_perm(MinutesDocument.get_view_permission(), m) and (not ip_range_group_name or not ip_range_group_checker.has_perm(MinutesDocument.get_view_permission(), m)):
-			continue
-		permitted_minutes.append(m)
+	# we show all documents for which the requested group has edit permissions
+	# e.g. if you request FSR minutes, all minutes for which the FSR group has edit rights will be shown
+	# but only documents for which the user has view permissions
+	permitted_minutes = get_permitted_objects(minutes, request.user, MinutesDocument.get_view_permission(), edit_group=group)
 
 	return permitted_minutes, own_group
 
@@ -1,11 +1,11 @@
 from datetime import date, datetime
 
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import Sum
 from django.template import loader
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
 from guardian.shortcuts import assign_perm
 
 from reversion import revisions
@@ -47,11 +47,10 @@ class Poll(Document):
 
 	class LinkPattern(InternalLinkPattern):
 
-		def url(self, id):
-			poll = Poll.objects.get(id=id)
-			if poll:
-				return reverse(poll.get_view_url_name(), args=[poll.id])
-			return ''
+		@staticmethod
+		def resolve_urls(ids):
+			poll_ids = Poll.objects.non_polymorphic().filter(id__in=ids).values_list('id', flat=True)
+			return {poll_id: reverse(Poll.get_view_url_name(), args=[poll_id]) for poll_id in poll_ids}
 
 	@classmethod
 	def generate_new_title(cls):
@@ -59,10 +58,7 @@ class Poll(Document):
 
 	@classmethod
 	def get_vote_permission(klass):
-		content_type = ContentType.objects.get_for_model(klass)
-		app_label = content_type.app_label
-		permission = "{app}.{permission_name}".format(app=app_label, permission_name=klass.VOTE_PERMISSION_NAME)
-		return permission
+		return "{app}.{permission_name}".format(app=klass._meta.app_label, permission_name=klass.VOTE_PERMISSION_NAME)
 
 	@classmethod
 	def generate_default_slug(cls, title):
@@ -83,7 +79,8 @@ class Poll(Document):
 	def get_edit_url(self):
 		return reverse(self.get_edit_url_name(), args=(self.url_title,))
 
-	def get_view_url_name(self):
+	@classmethod
+	def get_view_url_name(cls):
 		return 'polls:view'
 
 	def get_edit_url_name(self):
@@ -118,11 +115,10 @@ class Poll(Document):
 		return loader.get_template('polls_meta_information.html')
 
 	def handle_edit(self, cleaned_data):
-		content_type = ContentType.objects.get_for_model(self)
 		groups = cleaned_data['vote_groups']
 		for group in groups:
-			assign_perm("{app}.view_{model}".format(app=content_type.app_label, model=content_type.model), group, self)
-			assign_perm("{app}.vote_{model}".format(app=content_type.app_label, model=content_type.model), group, self)
+			assign_perm(self.view_permission_name, group, self)
+			assign_perm(self.get_vote_permission(), group, self)
 
 	@property
 	def has_choice_descriptions(self):
@@ -135,6 +131,14 @@ class Poll(Document):
 revisions.register(Poll, follow=["document_ptr"])
 
 
+class PollUserObjectPermission(UserObjectPermissionBase):
+	content_object = models.ForeignKey(Poll, on_delete=models.CASCADE)
+
+
+class PollGroupObjectPermission(GroupObjectPermissionBase):
+	content_object = models.ForeignKey(Poll, on_delete=models.CASCADE)
+
+
 class Choice(models.Model):
 	poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name="choices")
 	text_de = models.CharField(max_length=255, verbose_name=_("Text (German)"))
@@ -10,26 +10,26 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
 from _1327.documents.models import Document
-from _1327.main.utils import convert_markdown, document_permission_overview
+from _1327.main.utils import document_permission_overview
 from _1327.polls.models import Poll
-from _1327.user_management.shortcuts import check_permissions
+from _1327.user_management.permission_cache import prefetch_fallback_permissions
+from _1327.user_management.shortcuts import check_permissions, get_permitted_objects
 
 
 def index(request):
-	running_polls = []
-	finished_polls = []
-	upcoming_polls = []
+	today = datetime.date.today()
+	polls = Poll.objects.all().order_by('-end_date')
 	# do not show polls that a user is not allowed to see
-	for poll in Poll.objects.all().order_by('-end_date'):
-		if request.user.has_perm(Poll.get_view_permission(), obj=poll) and poll.start_date <= datetime.date.today():
-			if datetime.date.today() <= poll.end_date \
-						and not poll.participants.filter(id=request.user.pk).exists() \
-						and request.user.has_perm(Poll.get_vote_permission(), poll):
-				running_polls.append(poll)
-			else:
-				finished_polls.append(poll)
-		elif request.user.has_perm("polls.change_poll", obj=poll) and poll.start_date > datetime.date.today():
-			upcoming_polls.append(poll)
+	visible_polls = list(get_permitted_objects(polls.filter(start_date__lte=today), request.user, Poll.get_view_permission()))
+	upcoming_polls = list(get_permitted_objects(polls.filter(start_date__gt=today), request.user, "polls.change_poll"))
+
+	open_polls = polls.filter(start_date__lte=today, end_date__gte=today)
+	if request.user.is_authenticated:
+		open_polls = open_polls.exclude(participants=request.user)
+	votable_poll_ids = set(get_permitted_objects(open_polls, request.user, Poll.get_vote_permission()).values_list('pk', flat=True))
+	running_polls = [poll for poll in visible_polls if poll.pk in votable_poll_ids]
+	finished_polls = [poll for poll in visible_polls if poll.pk not in votable_poll_ids]
+	prefetch_fallback_permissions(request.user, visible_polls + upcoming_polls)
 
 	return render(
 		request,
@@ -61,7 +61,7 @@ def results(request, poll, url_title):
 		)
 		return HttpResponseRedirect(reverse('polls:index'))
 
-	description, toc = convert_markdown(poll.text)
+	description, toc = poll.get_rendered_text()
 
 	return render(
 		request,
@@ -84,7 +84,7 @@ def results_for_admin(request, title):
 		raise PermissionDenied
 
 	poll = get_object_or_404(Document, url_title=title)
-	description, toc = convert_markdown(poll.text)
+	description, toc = poll.get_rendered_text()
 
 	return render(
 		request,
@@ -131,7 +131,7 @@ def vote(request, poll, url_title):
 			return HttpResponseRedirect(reverse('polls:index'))
 		return HttpResponseRedirect(reverse(poll.get_view_url_name(), args=[url_title]))
 
-	description, toc = convert_markdown(poll.text)
+	description, toc = poll.get_rendered_text()
 
 	return render(
 		request,
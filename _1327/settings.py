@@ -120,6 +120,7 @@ MIDDLEWARE = [
 	'django.middleware.csrf.CsrfViewMiddleware',
 	'django.contrib.auth.middleware.AuthenticationMiddleware',
 	'_1327.user_management.middleware.IPRangeUserMiddleware',
+	'_1327.user_management.middleware.PermissionCacheMiddleware',
 	'django.contrib.messages.middleware.MessageMiddleware',
 	'django.middleware.clickjacking.XFrameOptionsMiddleware',
 	'django.middleware.locale.LocaleMiddleware',
@@ -128,6 +129,7 @@ MIDDLEWARE = [
 ]
 
 AUTHENTICATION_BACKENDS = [
+	'_1327.user_management.authentication.CachedPermissionBackend',
 	'django.contrib.auth.backends.ModelBackend',
 	'guardian.backends.ObjectPermissionBackend',
 	'_1327.user_management.authentication.OpenIDAuthenticationBackend',
@@ -167,6 +169,9 @@ DATABASES = {
 }
 
 # rabbitmq config https://pypi.org/project/channels-rabbitmq/
+# deployments running a single asgi process may use '_1327.main.channel_layers.LocalChannelLayer' instead of redis.
+# the asgi processes of one machine may use '_1327.main.channel_layers.BrokerChannelLayer' with a 'path' of a unix socket
+# in the CONFIG and the broker started by "manage.py run_channel_broker"
 CHANNEL_LAYERS = {
 	'default': {
 		'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -177,6 +182,55 @@ CHANNEL_LAYERS = {
 }
 
 PREVIEW_URL = '/ws/preview'
+# renders of a preview are coalesced, each preview is rendered at most once per interval, see main.markdown_preview.PreviewCoalescer
+PREVIEW_RENDER_INTERVAL = 0.5  # seconds
+# threads rendering the previews of all preview groups
+PREVIEW_RENDER_THREADS = 2
+# viewers of previews answer heartbeats, connections without messages are closed after the timeout, see documents.consumers
+PREVIEW_HEARTBEAT_INTERVAL = 30  # seconds
+PREVIEW_IDLE_TIMEOUT = 75  # seconds
+# updates waiting to be sent to a viewer, a viewer not keeping up gets the whole preview instead
+PREVIEW_SEND_QUEUE_SIZE = 20
+
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+	},
+	# rendered markdown, keyed by a digest of the text, see main.utils.convert_markdown
+	'markdown': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+		'LOCATION': 'markdown',
+		'TIMEOUT': 60 * 60 * 24,
+		'OPTIONS': {
+			'MAX_ENTRIES': 1000,
+		},
+	},
+	# version tokens invalidating the entries of the other caches and the state of previews, see main.cache_versions.
+	# all processes of a deployment have to use the same cache, the file based cache is shared by the processes of one machine.
+	# deployments running on several machines have to configure a cache shared by all of them, e.g. memcached or redis.
+	'shared': {
+		'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+		'LOCATION': os.path.join(BASE_DIR, 'shared_cache'),
+		'TIMEOUT': 60 * 60 * 24,
+		'OPTIONS': {
+			'MAX_ENTRIES': 1000,
+		},
+	},
+}
+MARKDOWN_CACHE_ALIAS = 'markdown'
+SHARED_CACHE_ALIAS = 'shared'
+# processes read the version tokens from the shared cache at most once per interval
+CACHE_VERSION_CHECK_INTERVAL = 1  # seconds
+
+# markdown texts longer than this are rendered in a pool of worker processes with a time limit, see main.markdown_pool
+MARKDOWN_PROCESS_POOL_THRESHOLD = 20000
+MARKDOWN_PROCESS_POOL_SIZE = 2
+MARKDOWN_RENDER_TIMEOUT = 10  # seconds
+# the markdown cache and pool stats of a process are added to the shared cache after this many events, see the markdown_stats command
+MARKDOWN_STATS_REPORT_INTERVAL = 100
+
+# render documents again in a background thread when abbreviations or linked documents change
+RENDER_DOCUMENTS_IN_BACKGROUND = True
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = ''
@@ -304,6 +358,10 @@ if TESTING:
 	DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3'}  # use sqlite to speed tests up
 	logging.disable(logging.CRITICAL)  # disable logging, primarily to prevent console spam
 	LANGUAGE_CODE = 'en-US'  # force language to be English while testing
+	CACHES = {alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in CACHES}  # the test database is rolled back, caches would not be
+	RENDER_DOCUMENTS_IN_BACKGROUND = False  # the worker thread would not see the data of the test transaction
+	PREVIEW_RENDER_INTERVAL = 0
+	CHANNEL_LAYERS = {'default': {'BACKEND': '_1327.main.channel_layers.LocalChannelLayer'}}
 
 # Create a localsettings.py to override settings per machine or user, e.g. for
 # development or different settings in deployments using multiple servers.
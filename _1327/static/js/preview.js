@@ -0,0 +1,101 @@
+// shows the previews sent over the preview websocket of a document.
+// the server sends the whole preview when connecting and the changed top level blocks of the html afterwards,
+// the page asks for the whole preview again when it missed an update.
+class PreviewConnection {
+	constructor(url, containerForLanguage) {
+		this.url = url;
+		this.containerForLanguage = containerForLanguage;
+		this.previews = {};
+		this.shownLanguages = new Map();
+		this.connect();
+	}
+
+	connect() {
+		this.socket = new WebSocket(this.url);
+		this.socket.onopen = () => {
+			// the sequences of updates start again with each connection, the shown html stays until the whole preview arrives
+			this.previews = {};
+			this.shownLanguages.clear();
+		};
+		this.socket.onmessage = (e) => this.receive(JSON.parse(e.data));
+		this.socket.onclose = () => setTimeout(() => this.connect(), 2000);
+	}
+
+	isOpen() {
+		return this.socket.readyState === WebSocket.OPEN;
+	}
+
+	send(data) {
+		this.socket.send(JSON.stringify(data));
+	}
+
+	receive(message) {
+		if (message.heartbeat) {
+			// connections that do not answer are closed by the server
+			this.send({'heartbeat': true});
+			return;
+		}
+
+		const language = message.language;
+		if (message.blocks !== undefined) {
+			this.previews[language] = {'sequence': message.sequence, 'blocks': message.blocks, 'nodes': []};
+			this.render(language);
+			return;
+		}
+
+		const preview = this.previews[language];
+		if (preview !== undefined && message.sequence <= preview.sequence) {
+			// the update is already contained in the whole preview
+			return;
+		}
+		if (preview === undefined || message.sequence !== preview.sequence + 1) {
+			this.send({'resync': language});
+			return;
+		}
+
+		preview.sequence = message.sequence;
+		const container = this.containerForLanguage(language);
+		const shown = this.shownLanguages.get(container) === language;
+		// the changes refer to the blocks before the update, applying them from the end keeps their indices valid
+		for (const [start, end, blocks] of message.changes.slice().reverse()) {
+			const nodes = shown ? blocks.map((block) => this.createNodes(block)) : [];
+			if (shown) {
+				const following = preview.nodes.slice(end).find((blockNodes) => blockNodes.length > 0);
+				const next = following === undefined ? null : following[0];
+				preview.nodes.slice(start, end).flat().forEach((node) => node.remove());
+				nodes.flat().forEach((node) => container.insertBefore(node, next));
+				preview.nodes.splice(start, end - start, ...nodes);
+			}
+			preview.blocks.splice(start, end - start, ...blocks);
+		}
+		if (!shown && container !== null) {
+			this.render(language);
+		}
+	}
+
+	showHtml(language, html) {
+		// html rendered without the websocket replaces the shown preview until the next update
+		const container = this.containerForLanguage(language);
+		container.innerHTML = emojione.toImage(html);
+		this.shownLanguages.delete(container);
+	}
+
+	render(language) {
+		const preview = this.previews[language];
+		const container = this.containerForLanguage(language);
+		if (container === null) {
+			// the page does not show previews of this language
+			return;
+		}
+		container.innerHTML = '';
+		preview.nodes = preview.blocks.map((block) => this.createNodes(block));
+		preview.nodes.flat().forEach((node) => container.appendChild(node));
+		this.shownLanguages.set(container, language);
+	}
+
+	createNodes(block) {
+		const template = document.createElement('template');
+		template.innerHTML = emojione.toImage(block);
+		return Array.from(template.content.childNodes);
+	}
+}
@@ -0,0 +1 @@
+default_app_config = '_1327.user_management.apps.UserManagementConfig'
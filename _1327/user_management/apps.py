@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class UserManagementConfig(AppConfig):
+	name = '_1327.user_management'
+
+	def ready(self):
+		from _1327.user_management import permission_cache
+		permission_cache.connect_permission_cache_receivers()
@@ -1,17 +1,51 @@
 import unicodedata
 
-from django.contrib.auth import user_logged_in
-from django.contrib.auth.models import Group
+from django.contrib.auth import get_backends, user_logged_in
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import PermissionDenied
 from django.dispatch import receiver
 from django.utils import translation
 from django.utils.translation import get_language, LANGUAGE_SESSION_KEY
-from guardian.core import ObjectPermissionChecker
-from guardian.utils import get_anonymous_user
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
 
 from _1327.main.utils import clean_email
 from _1327.user_management.models import UserProfile
+from _1327.user_management.permission_cache import fallback_checkers, permission_cache
+
+
+class CachedPermissionBackend:
+	"""
+		answers permission checks with the decisions of the other backends made before in the same request,
+		see user_management.permission_cache. has to be the first backend.
+	"""
+
+	def authenticate(self, *args, **kwargs):
+		return None
+
+	def has_perm(self, user_obj, perm, obj=None):
+		cache = permission_cache()
+		if cache is None:
+			return False
+
+		decision = cache.get(user_obj, perm, obj)
+		if decision is None:
+			decision = self.decide(user_obj, perm, obj)
+			cache.set(user_obj, perm, obj, decision)
+		if not decision:
+			# stops django from asking the other backends
+			raise PermissionDenied
+		return True
+
+	def decide(self, user_obj, perm, obj):
+		for backend in get_backends():
+			if isinstance(backend, CachedPermissionBackend) or not hasattr(backend, 'has_perm'):
+				continue
+			try:
+				if backend.has_perm(user_obj, perm, obj):
+					return True
+			except PermissionDenied:
+				return False
+		return False
 
 
 class _1327AuthorizationBackend:
@@ -30,19 +64,9 @@ class _1327AuthorizationBackend:
 		if app != content_type.app_label:
 			return False
 
-		group_name = user_obj._ip_range_group_name if hasattr(user_obj, '_ip_range_group_name') else None
-
-		if user_obj.is_authenticated:
-			# user is not anonymous user and no other backend confirmed the permission yet
-			# --> we need to check the anonymous permissions again
-			check = ObjectPermissionChecker(get_anonymous_user())
-			if check.has_perm(perm, obj):
-				return True
-		if group_name:
-			group = Group.objects.get(name=group_name)
-			check = ObjectPermissionChecker(group)
-			return check.has_perm(perm, obj)
-		return False
+		# no other backend confirmed the permission yet, users have the permissions of the anonymous user
+		# and of their ip range group as well
+		return any(checker.has_perm(perm, obj) for checker in fallback_checkers(user_obj))
 
 
 @receiver(user_logged_in)
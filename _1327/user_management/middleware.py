@@ -1,4 +1,5 @@
 from ipaddress import ip_address, ip_network
+import logging
 from urllib.parse import urlparse
 
 from django.conf import settings
@@ -6,6 +7,11 @@ from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.shortcuts import resolve_url
 
+from _1327.user_management.permission_cache import request_permission_cache
+
+
+logger = logging.getLogger(__name__)
+
 
 class IPRangeUserMiddleware:
 
@@ -31,6 +37,18 @@ class IPRangeUserMiddleware:
 					break
 
 
+class PermissionCacheMiddleware:
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		with request_permission_cache() as cache:
+			response = self.get_response(request)
+		logger.debug('%s: %d permission decisions made, %d served from the cache', request.path, cache.decided, cache.cached)
+		return response
+
+
 class LoginRedirectMiddleware:
 	def __init__(self, get_response):
 		self.get_response = get_response
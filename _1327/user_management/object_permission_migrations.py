@@ -0,0 +1,65 @@
+"""
+	helpers for data migrations moving the object permissions of a model between guardian's generic tables
+	and the model's direct foreign key permission tables.
+	the models of documents, polls and menu items have direct tables, which guardian finds through their foreign keys,
+	so their permissions are queried by foreign key instead of by content type and string primary key.
+"""
+
+PERMISSION_TABLES = (
+	# generic model, suffix of the direct model, field of the user or group
+	('UserObjectPermission', 'UserObjectPermission', 'user_id'),
+	('GroupObjectPermission', 'GroupObjectPermission', 'group_id'),
+)
+
+
+def get_content_type(apps, app_label, model_name):
+	ContentType = apps.get_model('contenttypes', 'ContentType')
+	return ContentType.objects.filter(app_label=app_label, model=model_name.lower()).first()
+
+
+def move_to_direct_object_permissions(app_label, model_name):
+	def forwards(apps, schema_editor):
+		content_type = get_content_type(apps, app_label, model_name)
+		if content_type is None:
+			# nothing was created yet
+			return
+		Model = apps.get_model(app_label, model_name)
+		object_pks = set(Model.objects.values_list('pk', flat=True))
+		for generic_name, direct_suffix, owner_field in PERMISSION_TABLES:
+			GenericPermission = apps.get_model('guardian', generic_name)
+			DirectPermission = apps.get_model(app_label, model_name + direct_suffix)
+			generic_permissions = GenericPermission.objects.filter(content_type=content_type)
+			DirectPermission.objects.bulk_create(
+				[
+					DirectPermission(permission_id=permission_id, content_object_id=int(object_pk), **{owner_field: owner_id})
+					for permission_id, object_pk, owner_id in generic_permissions.values_list('permission_id', 'object_pk', owner_field).iterator()
+					# permissions of deleted objects are dropped
+					if object_pk.isdigit() and int(object_pk) in object_pks
+				],
+				batch_size=1000,
+				ignore_conflicts=True,
+			)
+			generic_permissions.delete()
+
+	return forwards
+
+
+def move_to_generic_object_permissions(app_label, model_name):
+	def backwards(apps, schema_editor):
+		content_type = get_content_type(apps, app_label, model_name)
+		if content_type is None:
+			return
+		for generic_name, direct_suffix, owner_field in PERMISSION_TABLES:
+			GenericPermission = apps.get_model('guardian', generic_name)
+			DirectPermission = apps.get_model(app_label, model_name + direct_suffix)
+			GenericPermission.objects.bulk_create(
+				[
+					GenericPermission(permission_id=permission_id, content_type=content_type, object_pk=str(object_pk), **{owner_field: owner_id})
+					for permission_id, object_pk, owner_id in DirectPermission.objects.values_list('permission_id', 'content_object_id', owner_field).iterator()
+				],
+				batch_size=1000,
+				ignore_conflicts=True,
+			)
+			DirectPermission.objects.all().delete()
+
+	return backwards
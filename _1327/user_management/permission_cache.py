@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from guardian.core import ObjectPermissionChecker
+from guardian.models import BaseObjectPermission
+from guardian.utils import get_anonymous_user
+
+from _1327.user_management.registry import get_group
+
+
+PERMISSION_CACHE_STATS = {'decided': 0, 'cached': 0}
+
+_permission_cache = ContextVar('permission_cache', default=None)
+
+# changes of these apps and of the object permission models of other apps may change permission decisions
+PERMISSION_APPS = {'auth', 'guardian', 'user_management'}
+
+
+class PermissionCache:
+	"""
+		remembers the permission decisions of the authentication backends keyed by user, permission and object
+	"""
+	def __init__(self):
+		self.decisions = {}
+		self.decided = 0
+		self.cached = 0
+		self.anonymous_user = None
+		self.checkers = {}
+
+	def get_anonymous_user(self):
+		if self.anonymous_user is None:
+			self.anonymous_user = get_anonymous_user()
+		return self.anonymous_user
+
+	def get_checker(self, user_or_group):
+		key = (user_or_group._meta.label_lower, user_or_group.pk)
+		if key not in self.checkers:
+			self.checkers[key] = ObjectPermissionChecker(user_or_group)
+		return self.checkers[key]
+
+	def clear(self):
+		self.decisions.clear()
+		self.checkers.clear()
+
+	@staticmethod
+	def key(user, perm, obj):
+		# users of ip ranges have the permissions of the range's group as well
+		user_key = (user.pk, getattr(user, '_ip_range_group_name', None))
+		obj_key = None if obj is None else (obj._meta.label_lower, obj.pk)
+		return user_key, perm, obj_key
+
+	def get(self, user, perm, obj):
+		decision = self.decisions.get(self.key(user, perm, obj))
+		if decision is not None:
+			self.cached += 1
+			PERMISSION_CACHE_STATS['cached'] += 1
+		return decision
+
+	def set(self, user, perm, obj, decision):
+		self.decided += 1
+		PERMISSION_CACHE_STATS['decided'] += 1
+		if obj is None or obj.pk is not None:
+			self.decisions[self.key(user, perm, obj)] = decision
+
+
+def permission_cache():
+	return _permission_cache.get()
+
+
+@contextmanager
+def request_permission_cache():
+	"""
+		permission decisions made within this context are remembered until the context ends or a permission changes
+	"""
+	cache = PermissionCache()
+	token = _permission_cache.set(cache)
+	try:
+		yield cache
+	finally:
+		_permission_cache.reset(token)
+
+
+def invalidate_permission_cache():
+	cache = permission_cache()
+	if cache is not None:
+		cache.clear()
+
+
+def fallback_checkers(user):
+	"""
+		yields the checkers of the anonymous user and of the user's ip range group, whose permissions the user has as well.
+		within a request the checkers and their prefetched permissions are kept.
+	"""
+	# outside of requests the checkers are used once
+	cache = permission_cache() or PermissionCache()
+	if user.is_authenticated:
+		yield cache.get_checker(cache.get_anonymous_user())
+	group_name = getattr(user, '_ip_range_group_name', None)
+	if group_name:
+		yield cache.get_checker(get_group(group_name))
+
+
+def prefetch_fallback_permissions(user, objects):
+	"""
+		fetches the permissions of the fallback checkers for all objects at once, before checking the objects one by one
+	"""
+	if permission_cache() is None:
+		return
+	objects_by_model = {}
+	for obj in objects:
+		objects_by_model.setdefault(type(obj), []).append(obj)
+	for checker in fallback_checkers(user):
+		# guardian prefetches the permissions of objects of one model at once
+		for model_objects in objects_by_model.values():
+			checker.prefetch_perms(model_objects)
+
+
+def invalidate_permission_cache_on_change(sender, **kwargs):
+	# e.g. assign_perm, remove_perm and changed groups of users
+	if permission_cache() is not None:
+		invalidate_permission_cache()
+
+
+def connect_permission_cache_receivers():
+	# only the models that may change permission decisions are senders
+	for model in apps.get_models(include_auto_created=True):
+		if model._meta.app_label in PERMISSION_APPS or issubclass(model, BaseObjectPermission):
+			post_save.connect(invalidate_permission_cache_on_change, sender=model)
+			post_delete.connect(invalidate_permission_cache_on_change, sender=model)
+			# the senders of m2m_changed are the through models, e.g. of the groups of users
+			m2m_changed.connect(invalidate_permission_cache_on_change, sender=model)
@@ -0,0 +1,103 @@
+from collections import namedtuple
+from functools import lru_cache
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from _1327.main.cache_versions import bump_cache_version, cache_version
+
+
+PermissionNames = namedtuple('PermissionNames', ['view', 'add', 'change', 'delete'])
+
+GROUP_SETTINGS = {'ANONYMOUS_GROUP_NAME', 'UNIVERSITY_GROUP_NAME', 'STUDENT_GROUP_NAME', 'STAFF_GROUP_NAME', 'ANONYMOUS_IP_RANGE_GROUPS'}
+
+
+@lru_cache(maxsize=None)
+def permission_names(model):
+	# content types are named like the options of the concrete model
+	opts = model._meta.concrete_model._meta
+	return PermissionNames(*('{}.{}_{}'.format(opts.app_label, action, opts.model_name) for action in PermissionNames._fields))
+
+
+def main_group_names():
+	return [
+		settings.ANONYMOUS_GROUP_NAME,
+		settings.UNIVERSITY_GROUP_NAME,
+		settings.STUDENT_GROUP_NAME,
+		settings.STAFF_GROUP_NAME,
+	]
+
+
+def configured_group_names():
+	names = main_group_names()
+	return names + [name for name in settings.ANONYMOUS_IP_RANGE_GROUPS.values() if name not in names]
+
+
+class GroupRegistry:
+	"""
+		keeps the groups used by this process. the configured groups are loaded at once when the first group is used,
+		all groups are loaded again after any group changed, in other processes within CACHE_VERSION_CHECK_INTERVAL.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.version = None
+		self.by_name = {}
+		self.by_id = {}
+
+	def load(self):
+		version = cache_version('group_registry')
+		if self.version != version:
+			self.by_name = {group.name: group for group in Group.objects.filter(name__in=configured_group_names())}
+			self.by_id = {group.id: group for group in self.by_name.values()}
+			self.version = version
+
+	def add(self, group):
+		self.by_name[group.name] = group
+		self.by_id[group.id] = group
+		return group
+
+	def get(self, name=None, id=None):
+		"""
+			returns the group with the name or id, raises Group.DoesNotExist like Group.objects.get
+		"""
+		with self.lock:
+			self.load()
+			group = self.by_name.get(name) if id is None else self.by_id.get(id)
+			if group is None:
+				group = self.add(Group.objects.get(name=name) if id is None else Group.objects.get(id=id))
+			return group
+
+	def clear(self):
+		with self.lock:
+			self.version = None
+			self.by_name = {}
+			self.by_id = {}
+
+
+group_registry = GroupRegistry()
+
+
+def get_group(name=None, id=None):
+	return group_registry.get(name=name, id=id)
+
+
+def invalidate_groups():
+	group_registry.clear()
+	bump_cache_version('group_registry')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_groups_on_change(sender, **kwargs):
+	invalidate_groups()
+
+
+@receiver(setting_changed)
+def invalidate_groups_on_setting_change(setting, **kwargs):
+	if setting in GROUP_SETTINGS or setting in ('CACHES', 'SHARED_CACHE_ALIAS'):
+		group_registry.clear()
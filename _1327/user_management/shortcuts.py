@@ -1,4 +1,12 @@
 from django.core.exceptions import PermissionDenied
+from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Cast
+from guardian.ctypes import get_content_type
+from guardian.utils import get_group_obj_perms_model, get_identity, get_user_obj_perms_model
+
+from _1327.main.utils import invalidate_permission_overview
+from _1327.user_management.permission_cache import invalidate_permission_cache, permission_cache, PermissionCache
 
 
 def check_permissions(obj, user, permissions):
@@ -14,3 +22,104 @@ def check_permissions(obj, user, permissions):
 		# check for object level permission
 		if not user.has_perm(permission, obj):
 			raise PermissionDenied
+
+
+def object_pks_with_permission(permission_model, model, permission, *conditions, **filters):
+	app_label, codename = permission.split('.')
+	object_permissions = permission_model.objects.filter(
+		*conditions,
+		permission__content_type__app_label=app_label,
+		permission__codename=codename,
+		**filters
+	)
+	if not permission_model.objects.is_generic():
+		return object_permissions.values_list('content_object_id')
+
+	# guardian's generic tables store the primary keys of the objects as text
+	pk_field = model._meta.pk
+	while pk_field.remote_field is not None:
+		# e.g. the document_ptr of the document subclasses
+		pk_field = pk_field.target_field
+	if isinstance(pk_field, models.IntegerField):
+		return object_permissions.values_list(Cast('object_pk', models.BigIntegerField()))
+	return object_permissions.values_list('object_pk')
+
+
+def get_permitted_objects(queryset, user, permission, ip_range_group_name=None, edit_group=None):
+	"""
+		filters the queryset in the database to the objects the user has the object permission for, like user.has_perm:
+		superusers have all permissions, users have the permissions of their groups, of the anonymous user
+		and of their ip range group, which is taken from the user if no ip_range_group_name is given.
+		if edit_group is given, only objects the group has the change permission for are returned.
+	"""
+	model = queryset.model
+	if edit_group is not None:
+		edit_permission = '{}.change_{}'.format(model._meta.app_label, model._meta.model_name)
+		queryset = queryset.filter(pk__in=object_pks_with_permission(get_group_obj_perms_model(model), model, edit_permission, group=edit_group))
+
+	if user.is_active and user.is_superuser:
+		return queryset
+
+	cache = permission_cache() or PermissionCache()
+	anonymous_user = cache.get_anonymous_user()
+	users = [anonymous_user] if anonymous_user.is_active else []
+	if user.is_authenticated and user.is_active:
+		users.append(user)
+	groups = Q(group__user__in=users)
+	ip_range_group_name = ip_range_group_name or getattr(user, '_ip_range_group_name', None)
+	if ip_range_group_name:
+		groups |= Q(group__name=ip_range_group_name)
+
+	return queryset.filter(
+		Q(pk__in=object_pks_with_permission(get_user_obj_perms_model(model), model, permission, user__in=users))
+		| Q(pk__in=object_pks_with_permission(get_group_obj_perms_model(model), model, permission, groups))
+	)
+
+
+def object_permissions_of(permission_model, obj):
+	if permission_model.objects.is_generic():
+		return permission_model.objects.filter(content_type=get_content_type(obj), object_pk=str(obj.pk))
+	return permission_model.objects.filter(content_object=obj)
+
+
+def create_object_permission(permission_model, obj, **fields):
+	if permission_model.objects.is_generic():
+		return permission_model(content_type=get_content_type(obj), object_pk=str(obj.pk), **fields)
+	return permission_model(content_object=obj, **fields)
+
+
+def bulk_assign_perms(obj, user_permissions=(), group_permissions=()):
+	"""
+		assigns the object permissions given as pairs of user or group ids and permission ids to obj
+		with one insert per table, permissions that are assigned already are skipped
+	"""
+	for permission_model, owner_field, permissions in (
+		(get_user_obj_perms_model(obj), 'user_id', user_permissions),
+		(get_group_obj_perms_model(obj), 'group_id', group_permissions),
+	):
+		if permissions:
+			permission_model.objects.bulk_create(
+				[create_object_permission(permission_model, obj, permission_id=permission_id, **{owner_field: owner_id}) for owner_id, permission_id in permissions],
+				ignore_conflicts=True,
+			)
+
+	# bulk inserts do not send the post_save signals invalidating the cached permissions
+	invalidate_permission_cache()
+	invalidate_permission_overview(get_content_type(obj).id, obj.pk)
+
+
+def bulk_remove_perms(obj, codenames, user_or_group=None):
+	"""
+		removes the object permissions with the given codenames of user_or_group, or of all users and groups, from obj
+	"""
+	user, group = (None, None) if user_or_group is None else get_identity(user_or_group)
+	if group is None:
+		user_permissions = object_permissions_of(get_user_obj_perms_model(obj), obj).filter(permission__codename__in=codenames)
+		if user is not None:
+			user_permissions = user_permissions.filter(user=user)
+		user_permissions.delete()
+	if user is None:
+		group_permissions = object_permissions_of(get_group_obj_perms_model(obj), obj).filter(permission__codename__in=codenames)
+		if group is not None:
+			group_permissions = group_permissions.filter(group=group)
+		group_permissions.delete()
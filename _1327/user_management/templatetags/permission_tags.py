@@ -0,0 +1,9 @@
+from django.template import Library
+
+register = Library()
+
+
+@register.simple_tag(name='has_perm')
+def has_perm(user, perm, obj=None):
+	# unlike guardian's get_obj_perms, the decisions are shared with the rest of the request
+	return user.has_perm(perm, obj)
@@ -1,15 +1,24 @@
+from django.apps import apps
 from django.conf import settings
-from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.contrib.contenttypes.models import ContentType
 from django.test.utils import override_settings
 from django.urls import reverse
 
 from django_webtest import WebTest
-from guardian.shortcuts import assign_perm
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import assign_perm, remove_perm
 from guardian.utils import get_anonymous_user
 from model_bakery import baker
 
-from _1327.information_pages.models import InformationDocument
+from _1327.information_pages.models import InformationDocument, InformationDocumentGroupObjectPermission, InformationDocumentUserObjectPermission
+from _1327.main.cache_versions import shared_cache
+from .authentication import _1327AuthorizationBackend
 from .models import UserProfile
+from .object_permission_migrations import move_to_direct_object_permissions, move_to_generic_object_permissions
+from .permission_cache import PERMISSION_CACHE_STATS, prefetch_fallback_permissions, request_permission_cache
+from .registry import get_group, group_registry, permission_names
+from .shortcuts import get_permitted_objects
 
 
 class UsecaseTests(WebTest):
@@ -237,6 +246,209 @@ class _1327AuthenticationBackendTests(WebTest):
 		self.assertEqual(response.status_code, 200)
 
 
+class PermissionCacheTests(WebTest):
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.document = baker.make(InformationDocument)
+		cls.user = baker.make(UserProfile)
+
+	def test_decisions_are_cached(self):
+		with request_permission_cache() as cache:
+			self.assertFalse(self.user.has_perm(self.document.view_permission_name, self.document))
+			with self.assertNumQueries(0):
+				self.assertFalse(self.user.has_perm(self.document.view_permission_name, self.document))
+			self.assertEqual((cache.decided, cache.cached), (1, 1))
+
+		# decisions are only cached within the context
+		decided = PERMISSION_CACHE_STATS['decided']
+		self.user.has_perm(self.document.view_permission_name, self.document)
+		self.assertEqual(PERMISSION_CACHE_STATS['decided'], decided)
+
+	def test_changed_permissions_invalidate_cache(self):
+		with request_permission_cache():
+			self.assertFalse(self.user.has_perm(self.document.view_permission_name, self.document))
+			assign_perm(self.document.view_permission_name, self.user, self.document)
+			self.assertTrue(self.user.has_perm(self.document.view_permission_name, self.document))
+			remove_perm(self.document.view_permission_name, self.user, self.document)
+			self.assertFalse(self.user.has_perm(self.document.view_permission_name, self.document))
+
+			group = baker.make(Group)
+			assign_perm(self.document.view_permission_name, group, self.document)
+			self.assertFalse(self.user.has_perm(self.document.view_permission_name, self.document))
+			self.user.groups.add(group)
+			self.assertTrue(self.user.has_perm(self.document.view_permission_name, self.document))
+
+	@override_settings(ANONYMOUS_IP_RANGE_GROUPS={'8.0.0.0/8': 'university_group'})
+	def test_fallback_permissions_are_prefetched(self):
+		documents = baker.make(InformationDocument, _quantity=5)
+		group = baker.make(Group, name='university_group')
+		assign_perm(documents[0].view_permission_name, get_anonymous_user(), documents[0])
+		assign_perm(documents[1].view_permission_name, group, documents[1])
+		self.user._ip_range_group_name = 'university_group'
+
+		backend = _1327AuthorizationBackend()
+		with request_permission_cache():
+			prefetch_fallback_permissions(self.user, documents)
+			with self.assertNumQueries(0):
+				decisions = [backend.has_perm(self.user, document.view_permission_name, document) for document in documents]
+		self.assertEqual(decisions, [True, True, False, False, False])
+
+	def test_request_uses_cache(self):
+		assign_perm(self.document.view_permission_name, self.user, self.document)
+		decided = PERMISSION_CACHE_STATS['decided']
+		response = self.app.get(reverse(self.document.get_view_url_name(), args=[self.document.url_title]), user=self.user)
+		self.assertEqual(response.status_code, 200)
+		# decisions are only counted by the cache of a request
+		self.assertGreater(PERMISSION_CACHE_STATS['decided'], decided)
+
+
+class PermittedObjectsTests(WebTest):
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.documents = baker.make(InformationDocument, _quantity=6)
+		cls.user = baker.make(UserProfile)
+		cls.group = baker.make(Group)
+		cls.user.groups.add(cls.group)
+		cls.university_group = baker.make(Group, name='university_group')
+		cls.edit_group = baker.make(Group)
+
+		view_permission = InformationDocument.get_view_permission()
+		assign_perm(view_permission, cls.user, cls.documents[0])
+		assign_perm(view_permission, cls.group, cls.documents[1])
+		assign_perm(view_permission, get_anonymous_user(), cls.documents[2])
+		assign_perm(view_permission, cls.university_group, cls.documents[3])
+		assign_perm('information_pages.change_informationdocument', cls.user, cls.documents[4])
+		for document in cls.documents[1:4]:
+			assign_perm('information_pages.change_informationdocument', cls.edit_group, document)
+
+	def permitted_documents(self, user, **kwargs):
+		queryset = InformationDocument.objects.filter(pk__in=[document.pk for document in self.documents]).order_by('pk')
+		return list(get_permitted_objects(queryset, user, InformationDocument.get_view_permission(), **kwargs))
+
+	def test_permitted_objects_match_has_perm(self):
+		self.user._ip_range_group_name = 'university_group'
+		expected = [document for document in self.documents if self.user.has_perm(document.view_permission_name, document)]
+		self.assertEqual(self.permitted_documents(self.user), expected)
+		self.assertEqual(self.permitted_documents(self.user), self.documents[:4])
+
+	def test_permitted_objects_of_anonymous_users(self):
+		self.assertEqual(self.permitted_documents(AnonymousUser()), [self.documents[2]])
+		self.assertEqual(self.permitted_documents(AnonymousUser(), ip_range_group_name='university_group'), self.documents[2:4])
+
+	def test_permitted_objects_of_superusers(self):
+		superuser = baker.make(UserProfile, is_superuser=True)
+		self.assertEqual(self.permitted_documents(superuser), self.documents)
+		self.assertEqual(self.permitted_documents(superuser, edit_group=self.edit_group), self.documents[1:4])
+
+	def test_permitted_objects_edited_by_group(self):
+		self.assertEqual(self.permitted_documents(self.user, edit_group=self.edit_group), self.documents[1:3])
+
+	def test_permitted_objects_are_filtered_in_one_query(self):
+		with request_permission_cache() as cache:
+			cache.get_anonymous_user()
+			with self.assertNumQueries(1):
+				self.permitted_documents(self.user, edit_group=self.edit_group)
+
+
+class DirectObjectPermissionTests(WebTest):
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.document = baker.make(InformationDocument)
+		cls.user = baker.make(UserProfile)
+		cls.group = baker.make(Group)
+		cls.permission = Permission.objects.get(codename='view_informationdocument')
+
+	def test_permissions_are_stored_in_direct_tables(self):
+		assign_perm(self.document.view_permission_name, self.user, self.document)
+		assign_perm(self.document.view_permission_name, self.group, self.document)
+		self.assertTrue(InformationDocumentUserObjectPermission.objects.filter(user=self.user, content_object=self.document).exists())
+		self.assertTrue(InformationDocumentGroupObjectPermission.objects.filter(group=self.group, content_object=self.document).exists())
+		self.assertFalse(GroupObjectPermission.objects.exists())
+
+		self.document.delete()
+		self.assertFalse(InformationDocumentUserObjectPermission.objects.filter(user=self.user).exists())
+		self.assertFalse(InformationDocumentGroupObjectPermission.objects.filter(group=self.group).exists())
+
+	def test_data_migration(self):
+		content_type = ContentType.objects.get_for_model(InformationDocument)
+		GroupObjectPermission.objects.create(group=self.group, permission=self.permission, content_type=content_type, object_pk=str(self.document.pk))
+		UserObjectPermission.objects.create(user=self.user, permission=self.permission, content_type=content_type, object_pk=str(self.document.pk))
+		# permission of a deleted document
+		GroupObjectPermission.objects.bulk_create([GroupObjectPermission(group=self.group, permission=self.permission, content_type=content_type, object_pk='0')])
+
+		move_to_direct_object_permissions('information_pages', 'InformationDocument')(apps, None)
+		self.assertFalse(GroupObjectPermission.objects.exists())
+		self.assertFalse(UserObjectPermission.objects.exists())
+		self.assertTrue(self.user.has_perm(self.document.view_permission_name, self.document))
+		self.assertTrue(InformationDocumentGroupObjectPermission.objects.filter(group=self.group, content_object=self.document).exists())
+
+		move_to_generic_object_permissions('information_pages', 'InformationDocument')(apps, None)
+		self.assertFalse(InformationDocumentGroupObjectPermission.objects.filter(group=self.group).exists())
+		self.assertEqual(
+			list(GroupObjectPermission.objects.filter(group=self.group).values_list('object_pk', flat=True)),
+			[str(self.document.pk)],
+		)
+
+
+class RegistryTests(WebTest):
+
+	def setUp(self):
+		group_registry.clear()
+
+	def test_configured_groups_are_loaded_at_once(self):
+		with self.assertNumQueries(1):
+			staff = get_group(settings.STAFF_GROUP_NAME)
+			student = get_group(settings.STUDENT_GROUP_NAME)
+		with self.assertNumQueries(0):
+			self.assertEqual(get_group(id=staff.id), staff)
+		self.assertEqual(student, Group.objects.get(name=settings.STUDENT_GROUP_NAME))
+
+		group = baker.make(Group)
+		with self.assertNumQueries(2):
+			self.assertEqual(get_group(group.name), group)
+		with self.assertNumQueries(0):
+			self.assertEqual(get_group(id=group.id), group)
+
+		with self.assertRaises(Group.DoesNotExist):
+			get_group('missing group')
+
+	def test_changed_groups_are_loaded_again(self):
+		group = baker.make(Group)
+		get_group(id=group.id)
+		group.name = 'renamed group'
+		group.save()
+		self.assertEqual(get_group(id=group.id).name, 'renamed group')
+		group.delete()
+		with self.assertRaises(Group.DoesNotExist):
+			get_group('renamed group')
+
+	@override_settings(CACHE_VERSION_CHECK_INTERVAL=0, CACHES={
+		'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+		'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-tests'},
+	})
+	def test_groups_changed_by_other_processes_are_loaded_again(self):
+		staff = get_group(settings.STAFF_GROUP_NAME)
+		with self.assertNumQueries(0):
+			get_group(id=staff.id)
+
+		# another process changed a group
+		shared_cache().set('version_group_registry', 'changed', None)
+		with self.assertNumQueries(1):
+			get_group(id=staff.id)
+
+	def test_permission_names(self):
+		document = baker.make(InformationDocument)
+		with self.assertNumQueries(0):
+			self.assertEqual(document.view_permission_name, 'information_pages.view_informationdocument')
+			self.assertEqual(document.edit_permission_name, 'information_pages.change_informationdocument')
+			self.assertEqual(InformationDocument.get_view_permission(), 'information_pages.view_informationdocument')
+		self.assertEqual(permission_names(InformationDocument).delete, 'information_pages.delete_informationdocument')
+
+
 @override_settings(ANONYMOUS_IP_RANGE_GROUPS={'8.0.0.0/8': 'university_group'})
 class _1327AuthenticationBackendUniversityNetworkTests(WebTest):
 